@@ -1,163 +1,248 @@
-import time
+import functools
+import sys
+import zipfile
 
 from flask import Flask, send_from_directory, request
-from .model.excel_processing.ExcelOutput import ExcelOutput
-from .model import storage, file_importing, guttman_analysis
+from .model import storage, jobs, metrics, profiling
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__, static_url_path='')
 
 
+@app.before_request
+def recover_jobs():
+    # the first request of every process takes over the jobs left by stopped processes, see jobs.recover
+    jobs.recover()
+
+
 @app.route('/export/<int:file_id>')
 def export(file_id):
-    file_dir, file_name = storage.get_export_path(file_id)
-    return send_from_directory(file_dir, file_name, as_attachment=True, attachment_filename=file_name)
+    if not storage.is_processed(file_id):
+        return {'err_msg': 'The file is not processed yet'}
+    file_dir, file_name = jobs.export_file(file_id)
+    return send_from_directory(file_dir, file_name, as_attachment=True, download_name=file_name)
 
 
 @app.route('/upload', methods=['POST'])
 def upload():
-    start = time.time()
+    """
+    Upload an excel file to analyse. Post 'profile=1' to process it under the profiler, its reports are then listed
+    at the returned 'profile_url' once the job finished.
+    """
     if 'file' not in request.files:
         return {'err_msg': 'No file part'}
     file_name = request.files['file']
     if file_name.filename == '':
         return {'err_msg': 'No selected file'}
     if file_name and storage.allowed_file(file_name.filename):
-        filename = secure_filename(file_name.filename)
-        file_id, path, mod_path = storage.make_new_path(filename)
-        result = {
-            'file_id': file_id,
-            'export_url': '/export/' + str(file_id)
+        result = queue_upload(file_name.filename, file_name.save, profile_flag())
+        if 'err_msg' in result:
+            return {'err_msg': result['err_msg']}
+        response = {
+            'file_id': result['file_id'],
+            'export_url': result['export_url']
         }
+        if 'profile_url' in result:
+            response['profile_url'] = result['profile_url']
+        return response
+    else:
+        return {'err_msg': 'Illegal file extension'}
+
 
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload several excel files, or zip archives of them, in one request. Every file gets its own id and is processed
+    in parallel by the worker pool. Post 'wait=1' to respond only when all of them are processed, and 'profile=1' to
+    process them under the profiler.
+    """
+    files = [file for file in request.files.getlist('file') if file.filename != '']
+    if not files:
+        return {'err_msg': 'No selected file'}
+    results = []
+    for file in files:
+        if not file.filename.lower().endswith('.zip'):
+            results.append(queue_upload(file.filename, file.save, profile_flag()))
+            continue
         try:
-            file_name.save(path)
-            data, index = file_importing.readfile(path)
-            data = file_importing.transpose(data)
-
-            new_data = file_importing.break_down_marks(data, index)
-            file_importing.sort_2d_array_mark(new_data)
-            matrix = guttman_analysis.clean_input(new_data)
-            # print(matrix)
-
-            flag = 'Accumulation'  # Similarity, Correlation, Accumulation
-
-            irregular_item = guttman_analysis.return_irregular_index(matrix, False, flag)
-            corr_item = guttman_analysis.return_correlation(matrix, False, flag)
-            excel = ExcelOutput(mod_path)
-            excel.add_array(new_data)
-            excel.write_excel(0)
-            for col in irregular_item:
-                excel.highlight_area(0, 0, col + 1, col + 1, '#95e1d3', 0)
-            excel.add_total_score(0)
-            excel.add_correlation(corr_item, 'column', 0)
-            content_list = []
-
-            for i in range(len(new_data)):
-                tail = "total" if i == 0 else "" if i == 1 else sum(new_data[i][1:])
-                content_list.append({
-                    new_data[i][0]: new_data[i][1:]
-                })
-                content_list[i][new_data[i][0]].append(tail)
-            content_list.append({
-                'total': guttman_analysis.sum_item_score(matrix)
-            })
-
-            json = {
-                'file_id': file_id,
-                'file_name': filename,
-                'export_url': '/export/' + str(file_id),
-                'irregular_student': [],
-                'irregular_item': [new_data[1][i + 1] for i in irregular_item],
-                'item_performance': corr_item,
-                'boxes': [],
-                'content': content_list,
-                'odd_cells': []
-            }
-            storage.save_result(json, file_id, 0)
-
-            for row in new_data:
-                pos = 1
-                for item in irregular_item:
-                    del row[item + pos]
-                    pos -= 1
-            file_importing.sort_2d_array_mark(new_data)
-            matrix = guttman_analysis.clean_input(new_data)
-
-            excel.add_array(new_data)
-            excel.write_excel(1)
-
-            irregular_student = guttman_analysis.return_irregular_index(matrix, True, flag)
-
-            for row in irregular_student:
-                excel.highlight_area(row + 2, row + 2, 0, 0, '#f9ed69', 1)
-
-            excel.add_total_score(1)
-
-            boxes = guttman_analysis.irregular_box(matrix)
-            boxes_json = []
-            for i in boxes:
-                col1, col2, rows = i
-                row1, row2 = rows
-                excel.add_border(row1 + 2, row2 + 2, col1 + 1, col2 + 1, 1)
-                boxes_json.append({
-                    'row_range': [row1 + 2, row2 + 2],
-                    'column_range': [col1 + 1, col2 + 1]
-                })
-
-            content_list = []
-
-            for i in range(len(new_data)):
-                tail = "total" if i == 0 else "" if i == 1 else sum(new_data[i][1:])
-                content_list.append({
-                    new_data[i][0]: new_data[i][1:]
-                })
-                content_list[i][new_data[i][0]].append(tail)
-            content_list.append({
-                'total': guttman_analysis.sum_item_score(matrix)
-            })
-            odd_cells = guttman_analysis.odd_cells(matrix)
-            odd_cells_str_tuple = []
-            for (r, c) in odd_cells:
-                excel.highlight_area(r + 2, r + 2, c + 1, c + 1, '#b063c5', 1)
-                odd_cells_str_tuple.append("(%d, %d)" % (c, r + 1))
-
-            json = {
-                'file_id': file_id,
-                'file_name': filename,
-                'export_url': '/export/' + str(file_id),
-                'irregular_student': [new_data[i + 2][0] for i in irregular_student],
-                'irregular_item': [],
-                'content': content_list,
-                'boxes': boxes_json,
-                'odd_cells': odd_cells_str_tuple
-            }
-            storage.save_result(json, file_id, 1)
-            excel.close_workbook()
-            end = time.time()
-            print("took ", end - start, " sec to process.")
+            archive = zipfile.ZipFile(file.stream)
+            members = storage.read_zip(archive)
         except Exception as e:
-            storage.delete_file(file_id)
-            return {'err_msg': str(e)}
-        return result
-    else:
+            # not a zip file, or over the limits
+            results.append({'file_name': file.filename, 'err_msg': str(e)})
+            continue
+        with archive:
+            for name, info in members:
+                results.append(queue_upload(name, functools.partial(storage.extract_member, archive, info),
+                                            profile_flag()))
+    if request.form.get('wait') in ['1', 'true']:
+        queued = [result for result in results if 'file_id' in result]
+        for result, status in zip(queued, jobs.wait([result['file_id'] for result in queued])):
+            result.update(status)
+    return {'file_list': results}
+
+
+def profile_flag():
+    return request.form.get('profile') in ['1', 'true']
+
+
+def queue_upload(name, save, profile=False):
+    """
+    Save an uploaded file into a new upload directory and queue it for processing.
+    :param name: name of the uploaded file.
+    :param save: a function that writes the file to the given path.
+    :param profile: process the file under the profiler.
+    :return: a dict with the file id, or with the error message.
+    """
+    if not storage.allowed_file(name):
+        return {'file_name': name, 'err_msg': 'Illegal file extension'}
+    filename = secure_filename(name)
+    file_id, path, _ = storage.make_new_path(filename)
+    spans = []
+    try:
+        with metrics.span('save', spans):
+            save(path)
+        jobs.submit(file_id, filename, path, spans, profile)
+    except Exception as e:
+        storage.delete_file(file_id)
+        return {'file_name': filename, 'err_msg': str(e)}
+    result = {
+        'file_id': file_id,
+        'file_name': filename,
+        'export_url': '/export/' + str(file_id)
+    }
+    if profile:
+        result['profile_url'] = '/profile/' + str(file_id)
+    return result
+
+
+@app.route('/revise/<int:file_id>', methods=['POST'])
+def revise(file_id):
+    """
+    Upload an edited version of a processed excel file. The file keeps its id, and only the analysis near the changed
+    marks is done again. Poll '/status/<file_id>': a failed revision is reported once, the previous results are kept.
+    """
+    if not storage.is_processed(file_id):
+        return {'err_msg': 'The file is not processed yet'}
+    if jobs.is_pending(file_id):
+        return {'err_msg': 'The file is being processed'}
+    if 'file' not in request.files:
+        return {'err_msg': 'No file part'}
+    file = request.files['file']
+    if file.filename == '':
+        return {'err_msg': 'No selected file'}
+    if not storage.allowed_file(file.filename):
         return {'err_msg': 'Illegal file extension'}
+    path = storage.make_revision_path(file_id, secure_filename(file.filename))
+    spans = []
+    try:
+        with metrics.span('save', spans):
+            file.save(path)
+        jobs.revise(file_id, path, spans)
+    except Exception as e:
+        storage.discard_revision(file_id)
+        return {'err_msg': str(e)}
+    return {
+        'file_id': file_id,
+        'export_url': '/export/' + str(file_id)
+    }
+
+
+@app.route('/status/<int:file_id>', methods=['GET'])
+def status(file_id):
+    return jobs.get_status(file_id)
 
 
 @app.route('/filelist', methods=['GET'])
 def file_list():
-    return {'file_list': storage.get_file_list()}
+    """
+    List the uploads from the newest. Query with 'cursor' (the 'next_cursor' of the previous page), 'limit' and 'name'.
+    """
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    files, next_cursor = storage.get_file_list(request.args.get('cursor', type=int), limit, request.args.get('name'))
+    return {'file_list': files, 'next_cursor': next_cursor}
 
 
 @app.route('/delete/<int:file_id>', methods=['GET'])
 def delete_file(file_id):
+    jobs.forget(file_id)
     storage.delete_file(file_id)
     return {}
 
 
 @app.route('/result/<int:file_id>/pattern/<int:pattern_id>', methods=['GET'])
 def get_result(file_id, pattern_id):
-    return storage.get_result(file_id, pattern_id)
+    """
+    Return the result of a pattern. Query with 'row_start', 'row_end', 'column_start' and 'column_end' to only get
+    part of the students and items in 'content'.
+    """
+    rows, columns = query_range('row'), query_range('column')
+    if rows is not None or columns is not None:
+        body, encoding, etag = storage.get_result_slice_body(file_id, pattern_id, rows, columns, accepted_encodings())
+    else:
+        body, encoding, etag = storage.get_result_body(file_id, pattern_id, accepted_encodings())
+    response = app.response_class(body, mimetype='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # cached by the browser, but checked with the server every time
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def accepted_encodings():
+    """
+    Return the encodings of a result the client accepts, in the client's order of preference; 'br' first on a tie.
+    An encoding with q=0 is refused.
+    """
+    accept = request.accept_encodings
+    encodings = [encoding for encoding in ['br', 'gzip'] if accept.quality(encoding) > 0]
+    return sorted(encodings, key=lambda encoding: -accept.quality(encoding))
+
+
+@app.route('/stats/cache', methods=['GET'])
+def cache_stats():
+    return storage.result_cache.stats()
+
+
+@app.route('/result/<int:file_id>/metrics', methods=['GET'])
+def result_metrics(file_id):
+    """
+    Return the wall time, CPU time and peak memory of every stage the file went through, in the order they ran.
+    """
+    return {'spans': storage.get_metrics(file_id)}
+
+
+@app.route('/profile/<int:file_id>', methods=['GET'])
+def profile_reports(file_id):
+    """
+    List the profiler reports of a file uploaded with 'profile=1', empty until its job finished.
+    """
+    return {'reports': [{
+        'name': name,
+        'url': '/profile/' + str(file_id) + '/' + name
+    } for name in profiling.get_reports(file_id)]}
+
+
+@app.route('/profile/<int:file_id>/<name>', methods=['GET'])
+def profile_report(file_id, name):
+    if name not in profiling.REPORTS:
+        return {'err_msg': 'No such report'}
+    return send_from_directory(profiling.get_profile_dir(file_id), name, as_attachment=True)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def query_range(name):
+    start = request.args.get(name + '_start', type=int)
+    end = request.args.get(name + '_end', type=int)
+    if start is None and end is None:
+        return None
+    return start or 0, end if end is not None else sys.maxsize
 
 
 @app.route('/')
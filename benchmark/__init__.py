@@ -0,0 +1,210 @@
+'''
+Benchmarks of the analysis stages on synthetic mark sheets.
+
+The mark sheets are generated to look like real cohorts: every student has an ability and every sub-criterion a
+difficulty, a student passes the sub-criteria easier than their ability, and a share of the task marks is replaced by
+random noise. Each stage is timed on its own at several scales, the best of a few runs is kept. The results can be
+saved as the baseline, and later results are compared with it to find the stages that got slower.
+
+Run it from the repo root with 'python -m benchmark', see 'python -m benchmark --help'.
+'''
+
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy
+
+from model import file_importing, guttman_analysis
+from model.excel_processing.ExcelOutput import ExcelOutput
+
+# students, tasks and sub-criteria per task of every scale
+SCALES = {
+    'small': (100, 10, 3),
+    'medium': (500, 30, 3),
+    'large': (2000, 60, 4),
+}
+NOISE = 0.05
+FLAG = 'Accumulation'
+RESULT_PATH = 'benchmark/result.json'
+BASELINE_PATH = 'benchmark/baseline.json'
+# a stage is slower than its baseline when it takes this much longer, both relatively and in seconds
+TOLERANCE = 0.25
+MIN_DELTA = 0.005
+
+
+def guttman_matrix(students, items, noise=NOISE, seed=0):
+    """
+    Generate a matrix of 0/1 marks that follows a Guttman pattern, apart from the noise.
+    :param students: number of rows.
+    :param items: number of columns.
+    :param noise: share of the marks that are flipped.
+    :param seed: seed of the random generator.
+    :return: 2d numpy array of uint8, neither the rows nor the columns are sorted.
+    """
+    generator = numpy.random.RandomState(seed)
+    ability = generator.rand(students, 1)
+    difficulty = generator.rand(1, items)
+    matrix = ability > difficulty
+    matrix ^= generator.rand(students, items) < noise
+    return matrix.astype(numpy.uint8)
+
+
+def task_names(tasks):
+    """
+    Names of the tasks and of their sub-criteria. Names of different tasks differ at every position, so the criteria
+    are matched to their own task only.
+    """
+    return [chr(0x4e00 + task) * 4 for task in range(tasks)]
+
+
+def mark_sheet(students, tasks, criteria=3, noise=NOISE, seed=0):
+    """
+    Generate a mark sheet as it is read from an uploaded workbook and transposed.
+    :param students: number of students.
+    :param tasks: number of tasks.
+    :param criteria: number of sub-criteria of every task.
+    :param noise: share of the task marks that are replaced by a random mark.
+    :param seed: seed of the random generator.
+    :return: the task marks as a 2d array with a task name row and one row per student, and the criteria rows.
+    """
+    generator = numpy.random.RandomState(seed)
+    ability = generator.rand(students, 1, 1)
+    difficulty = numpy.sort(generator.rand(tasks * criteria)).reshape(1, tasks, criteria)
+    marks = (ability > difficulty).sum(axis=2)
+    noisy = generator.rand(students, tasks) < noise
+    marks[noisy] = generator.randint(0, criteria + 1, size=int(noisy.sum()))
+    names = task_names(tasks)
+    data = [['student_id'] + names]
+    for student, row in enumerate(marks.tolist()):
+        data.append(['s%05d' % student] + row)
+    index = [[name + str(i + 1) for name in names for i in range(criteria)]]
+    index.append(['criterion'] * len(index[0]))
+    return data, index
+
+
+def copy_index(index):
+    return [list(row) for row in index]
+
+
+def time_stage(function, repeat, setup=None):
+    """
+    Time a function, the setup before every run is not timed.
+    :param function: the function to time, it gets the output of the setup.
+    :param repeat: number of runs.
+    :param setup: a function that returns the argument of every run.
+    :return: the shortest time in seconds.
+    """
+    best = None
+    for i in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def write_excel(sheet):
+    """
+    Write a sheet to a temporary excel file, as the export of a result does.
+    """
+    file, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(file)
+    try:
+        excel = ExcelOutput(path, constant_memory=True)
+        excel.add_array(sheet)
+        excel.write_excel(0)
+        excel.add_total_score(0)
+        excel.close_workbook()
+    finally:
+        os.remove(path)
+
+
+def run_scale(students, tasks, criteria, noise=NOISE, repeat=3, seed=0):
+    """
+    Time every stage on one generated mark sheet.
+    :return: a dict of the seconds taken by each stage.
+    """
+    data, index = mark_sheet(students, tasks, criteria, noise, seed)
+
+    def break_down(argument):
+        # the criteria counts are cached, clear them to time a layout seen for the first time
+        file_importing.criterion_counts.cache_clear()
+        return file_importing.break_down_marks(data, argument)
+
+    sheet = break_down(copy_index(index))
+    file_importing.sort_2d_array_mark(sheet)
+    matrix = guttman_analysis.as_matrix(guttman_analysis.clean_input(sheet))
+    return {
+        'break_down_marks': time_stage(break_down, repeat, lambda: copy_index(index)),
+        'sort_2d_array_mark': time_stage(file_importing.sort_2d_array_mark, repeat,
+                                         lambda: break_down(copy_index(index))),
+        'return_correlation': time_stage(lambda m: guttman_analysis.return_correlation(m, False, FLAG), repeat,
+                                         lambda: matrix),
+        'return_irregular_index': time_stage(lambda m: guttman_analysis.return_irregular_index(m, False, FLAG), repeat,
+                                             lambda: matrix),
+        'return_irregular_index_students': time_stage(
+            lambda m: guttman_analysis.return_irregular_index(m, True, FLAG), repeat, lambda: matrix),
+        'irregular_box': time_stage(guttman_analysis.irregular_box, repeat, lambda: matrix),
+        'odd_cells': time_stage(guttman_analysis.odd_cells, repeat, lambda: matrix),
+        'ExcelOutput': time_stage(write_excel, repeat, lambda: sheet),
+    }
+
+
+def run(scales=None, noise=NOISE, repeat=3, seed=0):
+    """
+    Time every stage at several scales.
+    :param scales: names of the scales to run, all of them by default.
+    :return: the results, with the seconds taken by each stage at each scale.
+    """
+    results = {}
+    for name in scales or SCALES:
+        if name not in SCALES:
+            raise Exception("Unknown scale '%s'." % name)
+        results[name] = run_scale(*SCALES[name], noise=noise, repeat=repeat, seed=seed)
+    return {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'noise': noise,
+        'scales': {name: SCALES[name] for name in results},
+        'results': results
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA):
+    """
+    Find the stages that got slower than in the baseline. Only results of the same scales and noise are compared.
+    :param results: results of 'run'.
+    :param baseline: earlier results of 'run'.
+    :return: a list of (scale, stage, seconds, baseline seconds) of the regressions.
+    """
+    regressions = []
+    if baseline.get('noise') != results.get('noise'):
+        return regressions
+    for scale, stages in results['results'].items():
+        if baseline['scales'].get(scale) != results['scales'][scale]:
+            continue
+        for stage, seconds in stages.items():
+            before = baseline['results'][scale].get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > min_delta:
+                regressions.append((scale, stage, seconds, before))
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load(path):
+    with open(path) as file:
+        results = json.load(file)
+    # json turns the tuples of the scales into lists
+    results['scales'] = {name: tuple(scale) for name, scale in results['scales'].items()}
+    return results
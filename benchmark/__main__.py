@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+
+import benchmark
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Time the analysis stages.')
+    parser.add_argument('--scales', default=','.join(benchmark.SCALES),
+                        help='comma separated scales to run, out of: ' + ', '.join(benchmark.SCALES))
+    parser.add_argument('--noise', type=float, default=benchmark.NOISE, help='share of noisy marks')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every stage, the best one is kept')
+    parser.add_argument('--output', default=benchmark.RESULT_PATH, help='file to record the results in')
+    parser.add_argument('--baseline', default=benchmark.BASELINE_PATH, help='file of the baseline results')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=benchmark.TOLERANCE,
+                        help='relative slow down of a stage that counts as a regression')
+    args = parser.parse_args()
+
+    results = benchmark.run(args.scales.split(','), args.noise, args.repeat)
+    for scale, stages in results['results'].items():
+        students, tasks, criteria = results['scales'][scale]
+        print('%s: %d students, %d tasks, %d sub-criteria each' % (scale, students, tasks, criteria))
+        for stage, seconds in stages.items():
+            print('    %-32s %10.4f s' % (stage, seconds))
+    benchmark.save(results, args.output)
+
+    if args.save_baseline:
+        benchmark.save(results, args.baseline)
+        print('saved the baseline to', args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline at', args.baseline + ', save one with --save-baseline')
+        return 0
+    regressions = benchmark.compare(results, benchmark.load(args.baseline), args.tolerance)
+    for scale, stage, seconds, before in regressions:
+        print('REGRESSION %s %s: %.4f s, was %.4f s' % (scale, stage, seconds, before))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,33 @@
 import xlsxwriter
 import math
+import numpy
+
+# bits of a cell's border mask
+BORDER_TOP = 1
+BORDER_BOTTOM = 2
+BORDER_LEFT = 4
+BORDER_RIGHT = 8
+
 
 class ExcelOutput:
-    def __init__(self, file_name):
+    def __init__(self, file_name, constant_memory=False):
+        """
+        :param file_name: path of the excel file to write
+        :param constant_memory: stream the rows to disk as they are written, so memory use does not grow with the data
+        """
         self.arrays = []
 
-        self.workbook = xlsxwriter.Workbook(file_name)
+        self.workbook = xlsxwriter.Workbook(file_name, {'constant_memory': constant_memory})
 
         self.worksheet1 = self.workbook.add_worksheet("Irregular Items")
         self.worksheet2 = self.workbook.add_worksheet("Other Patterns")
         self.worksheets = [self.worksheet1, self.worksheet2]
-        self.formats = []
-        self.formats.append([])
-        self.formats.append([])
+        # the cells of each sheet: its values, and the background color code and border mask of every cell
+        self.sheets = [None, None]
+        # cells written around the data, such as totals and correlations, by (row, column)
+        self.extra_cells = [{}, {}]
+        self.colors = [None]
+        self.format_cache = {}
         self.base_format = {
             'font_name': 'Times New Roman',
             'align': 'center',
@@ -24,40 +39,97 @@ class ExcelOutput:
 
     def write_excel(self, sheet_number):
         """
-        # write data to excel file
+        # lay out the data of a sheet, its cells are written once their styles are final
         :return: null
         """
-        for i in range(len(self.arrays[sheet_number])):
-            self.formats[sheet_number].append([])
-            for j in range(len(self.arrays[sheet_number][0])):
-                cell_format = self.workbook.add_format(self.base_format)
+        array = self.arrays[sheet_number]
+        width = len(array[0])
+        values = [list(row[:width]) for row in array]
+        positive = numpy.array([[type(value).__name__ == 'int' and value > 0 for value in row] for row in values],
+                               dtype=bool).reshape(len(values), width)
+        colors = numpy.zeros((len(values), width), dtype=numpy.int32)
+        colors[positive] = self.color_code('#ffd5d5')
+        self.sheets[sheet_number] = (values, colors, numpy.zeros((len(values), width), dtype=numpy.int32))
+
+    def color_code(self, color):
+        if color not in self.colors:
+            self.colors.append(color)
+        return self.colors.index(color)
+
+    def get_format(self, color_code, border_mask):
+        """
+        # return the shared format of a cell style, every style is added to the workbook once
+        :param color_code: index of the background color in self.colors, 0 for none
+        :param border_mask: the BORDER_* bits of the cell
+        :return: an xlsxwriter format
+        """
+        key = (color_code, border_mask)
+        if key not in self.format_cache:
+            cell_format = self.workbook.add_format(self.base_format)
+            if color_code:
+                cell_format.set_bg_color(self.colors[color_code])
+            border_style = 2  # bold border
+            if border_mask & BORDER_TOP:
+                cell_format.set_top(border_style)
+            if border_mask & BORDER_BOTTOM:
+                cell_format.set_bottom(border_style)
+            if border_mask & BORDER_LEFT:
+                cell_format.set_left(border_style)
+            if border_mask & BORDER_RIGHT:
+                cell_format.set_right(border_style)
+            self.format_cache[key] = cell_format
+        return self.format_cache[key]
 
-                if type(self.arrays[sheet_number][i][j]).__name__ == 'int' and self.arrays[sheet_number][i][j] > 0:
-                    cell_format.set_bg_color('#ffd5d5')
-                self.formats[sheet_number][i].append(cell_format)
-                self.worksheets[sheet_number].write(i, j, self.arrays[sheet_number][i][j], self.formats[sheet_number][i][j])
+    def write_cell(self, sheet_number, row, col, value):
+        """
+        # keep a cell around the data, it is written in row order with the rest of the sheet
+        :return: null
+        """
+        self.extra_cells[sheet_number][(row, col)] = value
+
+    def flush_sheet(self, sheet_number):
+        """
+        # write every cell of a sheet strictly in row order, each run of cells sharing a style in one call
+        :return: null
+        """
+        values, colors, borders = self.sheets[sheet_number] or ([], None, None)
+        extra_rows = {}
+        for (row, col), value in sorted(self.extra_cells[sheet_number].items()):
+            extra_rows.setdefault(row, []).append((col, value))
+        self.sheets[sheet_number] = None
+        self.extra_cells[sheet_number] = {}
+        worksheet = self.worksheets[sheet_number]
+        base_format = self.get_format(0, 0)
+        for i in range(max([len(values)] + [row + 1 for row in extra_rows])):
+            if i < len(values):
+                style_row = colors[i] * 16 + borders[i]
+                starts = [0] + (numpy.flatnonzero(style_row[1:] != style_row[:-1]) + 1).tolist()
+                ends = starts[1:] + [len(style_row)]
+                for start, end in zip(starts, ends):
+                    cell_format = self.get_format(int(colors[i, start]), int(borders[i, start]))
+                    worksheet.write_row(i, start, values[i][start:end], cell_format)
+            for col, value in extra_rows.get(i, []):
+                worksheet.write(i, col, value, base_format)
 
     def add_total_score(self, sheet_number):
         """
         # add total score at the end of each row and column
         :return: null
         """
-        cell_format = self.workbook.add_format(self.base_format)
-        # cell_format.set_bg_color('yellow')
         # total score of rows
-        self.worksheets[sheet_number].write(0, len(self.arrays[sheet_number][0]), 'total score', cell_format)
-        self.worksheets[sheet_number].write(len(self.arrays[sheet_number]), 0, 'total score', cell_format)
+        self.write_cell(sheet_number, 0, len(self.arrays[sheet_number][0]), 'total score')
+        self.write_cell(sheet_number, len(self.arrays[sheet_number]), 0, 'total score')
         for i in range(2, len(self.arrays[sheet_number])):
             count = 0
             for j in range(1, len(self.arrays[sheet_number][0])):
                 count += self.arrays[sheet_number][i][j]
-            self.worksheets[sheet_number].write(i, len(self.arrays[sheet_number][0]), count, cell_format)
+            self.write_cell(sheet_number, i, len(self.arrays[sheet_number][0]), count)
         # total score of columns
         for i in range(1, len(self.arrays[sheet_number][0])):
             count = 0
             for j in range(2, len(self.arrays[sheet_number])):
                 count += self.arrays[sheet_number][j][i]
-            self.worksheets[sheet_number].write(len(self.arrays[sheet_number]), i, count, cell_format)
+            self.write_cell(sheet_number, len(self.arrays[sheet_number]), i, count)
 
     def add_correlation(self, array, types, sheet_number):
         """
@@ -66,22 +138,20 @@ class ExcelOutput:
         :param types: a string, either 'row' or 'column'
         :return: null
         """
-        cell_format = self.workbook.add_format(self.base_format)
-        # cell_format.set_bg_color('yellow')
         if types == 'row':
-            self.worksheets[sheet_number].write(1, len(self.arrays[sheet_number][0]) + 1, 'correlation', cell_format)
+            self.write_cell(sheet_number, 1, len(self.arrays[sheet_number][0]) + 1, 'correlation')
             for i in range(2, len(self.arrays[sheet_number])):
-                self.worksheets[sheet_number].write(i, len(self.arrays[sheet_number][0]) + 1, array[i - 1], cell_format)
+                self.write_cell(sheet_number, i, len(self.arrays[sheet_number][0]) + 1, array[i - 1])
         if types == 'column':
-            self.worksheets[sheet_number].write(len(self.arrays[sheet_number]) + 1, 0, 'item_performance', cell_format)
+            self.write_cell(sheet_number, len(self.arrays[sheet_number]) + 1, 0, 'item_performance')
             for i in range(1, len(array) + 1):
                 # print(len(self.array[0]))
                 # print(len(array))
                 # print(array[i - 1])
                 if math.isnan(array[i - 1]):
-                    self.worksheets[sheet_number].write(len(self.arrays[sheet_number]) + 1, i, "nan", cell_format)
+                    self.write_cell(sheet_number, len(self.arrays[sheet_number]) + 1, i, "nan")
                 else:
-                    self.worksheets[sheet_number].write(len(self.arrays[sheet_number]) + 1, i, array[i - 1], cell_format)
+                    self.write_cell(sheet_number, len(self.arrays[sheet_number]) + 1, i, array[i - 1])
 
     def highlight_area(self, row1, row2, col1, col2, color, sheet_number):
         """
@@ -93,27 +163,20 @@ class ExcelOutput:
         :param color: text color
         :return: null
         """
-        for i in range(row1, row2 + 1):
-            for j in range(col1, col2 + 1):
-                self.formats[sheet_number][i][j].set_bg_color(color)
-                self.worksheets[sheet_number].write(i, j, self.arrays[sheet_number][i][j], self.formats[sheet_number][i][j])
+        self.sheets[sheet_number][1][row1:row2 + 1, col1:col2 + 1] = self.color_code(color)
 
     def add_border(self, row1, row2, col1, col2, sheet_number):
-        border_style = 2  # bold border
-        for i in range(col1, col2 + 1):
-            self.formats[sheet_number][row1][i].set_top(border_style)
-            self.worksheets[sheet_number].write(row1, i, self.arrays[sheet_number][row1][i], self.formats[sheet_number][row1][i])
-            self.formats[sheet_number][row2][i].set_bottom(border_style)
-            self.worksheets[sheet_number].write(row2, i, self.arrays[sheet_number][row2][i], self.formats[sheet_number][row2][i])
-        for i in range(row1, row2 + 1):
-            self.formats[sheet_number][i][col1].set_left(border_style)
-            self.worksheets[sheet_number].write(i, col1, self.arrays[sheet_number][i][col1], self.formats[sheet_number][i][col1])
-            self.formats[sheet_number][i][col2].set_right(border_style)
-            self.worksheets[sheet_number].write(i, col2, self.arrays[sheet_number][i][col2], self.formats[sheet_number][i][col2])
+        borders = self.sheets[sheet_number][2]
+        borders[row1, col1:col2 + 1] |= BORDER_TOP
+        borders[row2, col1:col2 + 1] |= BORDER_BOTTOM
+        borders[row1:row2 + 1, col1] |= BORDER_LEFT
+        borders[row1:row2 + 1, col2] |= BORDER_RIGHT
 
     def close_workbook(self):
         """
         # close workbook to output the excel file
         :return: null
         """
+        for sheet_number in range(len(self.sheets)):
+            self.flush_sheet(sheet_number)
         self.workbook.close()
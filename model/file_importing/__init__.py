@@ -1,77 +1,142 @@
+import functools
 import math
+import numpy
+import openpyxl
 import textdistance
-import pandas as pd
+
+
+def mark_totals(array):
+    """
+    # total mark of every student row and every task column, computed once
+    :param array: a 2d array with two header rows and one student id column
+    :return: the marks converted with int() as a 2d numpy array, row totals and column totals
+    """
+    marks = numpy.array([row[1:] for row in array[2:]], dtype=numpy.int64)
+    marks = marks.reshape(max(len(array) - 2, 0), len(array[0]) - 1)
+    return marks, marks.sum(axis=1), marks.sum(axis=0)
+
+
+def exchange_order(totals):
+    """
+    # order the rows by total mark, from high to low, the same way the original exchange sort did
+    the exchange sort is not stable: for each position i it walks the remaining rows and swaps in every row with a
+    strictly greater total, so the rows that were swapped out move to where the swap happened. this replays the same
+    swaps on the precomputed totals: one pass rotates the chain of strictly increasing running maxima, and passes for
+    positions already holding their final total are skipped.
+    :param totals: 1d array of row totals
+    :return: 1d array, the row order
+    """
+    totals = numpy.array(totals)
+    order = numpy.arange(len(totals))
+    target = numpy.sort(totals)[::-1]
+    for i in range(len(totals)):
+        if totals[i] == target[i]:
+            continue
+        # the chain ends at the first row holding the maximum, nothing after it is strictly greater
+        segment = totals[i:i + totals[i:].argmax() + 1]
+        running_max = numpy.maximum.accumulate(segment)
+        chain = numpy.concatenate(([0], numpy.flatnonzero(segment[1:] > running_max[:-1]) + 1)) + i
+        totals[chain] = numpy.roll(totals[chain], 1)
+        order[chain] = numpy.roll(order[chain], 1)
+    return order
+
+
+def sort_order(array):
+    """
+    # row and column order that sorts the 2d array according to marks of tasks
+    rows are ordered by total mark, columns by the total mark of all sorted rows except the last one (as the original
+    bubble sort did), both from high to low. ties of columns keep their order.
+    :param array: a 2d array with two header rows and one student id column
+    :return: row order and column order, as indexes into the rows and columns of the array
+    """
+    marks, row_totals, _ = mark_totals(array)
+    student_order, task_order = marks_order(marks, row_totals)
+    row_order = numpy.concatenate(([0, 1], student_order + 2))[:len(array)]
+    column_order = numpy.concatenate(([0], task_order + 1))
+    return row_order, column_order
+
+
+def marks_order(marks, row_totals):
+    """
+    # order of the students and the tasks of a matrix of marks, the way sort_order orders them
+    :param marks: a 2d numpy array of marks, one row per student
+    :param row_totals: total mark of every row of the marks
+    :return: student order and task order, as indexes into the rows and columns of the marks
+    """
+    student_order = exchange_order(row_totals)
+    column_totals = marks[student_order[:-1]].sum(axis=0, dtype=numpy.int64)
+    return student_order, numpy.argsort(-column_totals, kind='stable')
+
+
+def apply_order(array, row_order, column_order):
+    """
+    # rearrange the rows and columns of the 2d array in place
+    :param array: a 2d array
+    :param row_order: indexes of the rows in their new order
+    :param column_order: indexes of the columns in their new order
+    :return: null
+    """
+    column_order = column_order.tolist()
+    array[:] = [[row[j] for j in column_order] for row in [array[i] for i in row_order.tolist()]]
 
 
 def sort_2d_array_mark(array):
     """
     # sort the imported excel file as 2d array according to marks of tasks
     :param array: a 2d array
-    :return: a sorted 2d array, sort from left to right and also from top to bottom
-    """
-    # header = array.pop(0)
-    # sort rows
-    for i in range(2, len(array)):
-        for j in range(i, len(array)):
-            count1 = 0
-            count2 = 0
-            for k in range(1, len(array[0])):
-                count1 += int(array[i][k])
-                count2 += int(array[j][k])
-            if count1 < count2:
-                array[j], array[i] = array[i], array[j]
-    # sort columns
-    for i in range(1, len(array[0]) - 1):
-        for j in range(1, len(array[0]) - i):
-            count1 = 0
-            count2 = 0
-            for k in range(2, len(array) - 1):
-                count1 += int(array[k][j])
-                count2 += int(array[k][j + 1])
-            if count1 < count2:
-                for k in range(len(array)):
-                    array[k][j], array[k][j + 1] = array[k][j + 1], array[k][j]
+    :return: row order and column order that were applied, the array itself is sorted in place,
+    sort from left to right and also from top to bottom
+    """
+    row_order, column_order = sort_order(array)
+    apply_order(array, row_order, column_order)
+    return row_order, column_order
 
 
-def break_down_marks(array, index):
-    indexs = []
+@functools.lru_cache(maxsize=32)
+def criterion_counts(tasks, criteria):
+    """
+    # number of sub-criteria that belongs to each task, matched by name similarity
+    :param tasks: a tuple of task names
+    :param criteria: a tuple of criteria names
+    :return: a numpy array with the criteria count of every task
+    """
+    counts = numpy.zeros(len(tasks), dtype=numpy.int64)
+    for i, task in enumerate(tasks):
+        for string in criteria:
+            if textdistance.hamming.normalized_similarity(string, task) >= 0.5:
+                counts[i] += 1
+    counts.setflags(write=False)
+    return counts
+
 
-    for i in range(1, len(array[0])):
-        count = 0
-        for string in index[0]:
-            if textdistance.hamming.normalized_similarity(string, str(array[0][i])) >= 0.5:
-                count += 1
-        indexs.append(count)
+def break_down_marks(array, index):
+    """
+    # expand every task mark into 0/1 sub-criteria marks, the input marks are left untouched
+    :param array: a 2d array with a task name row and one row per student
+    :param index: criteria rows read from the second worksheet
+    :return: a 2d array with the criteria rows and the 0/1 mark of every sub-criteria
+    """
+    counts = criterion_counts(tuple(str(task) for task in array[0][1:]), tuple(index[0]))
 
-    transposed_array = transpose(array)
+    marks = numpy.array([row[1:] for row in array[1:]])
+    marks = marks.reshape(len(array) - 1, len(array[0]) - 1)
 
-    max_mark = []
-    for i in range(1, len(transposed_array)):
-        # assume the maximum mark of this task is 1
-        max_mark.append(int(max(transposed_array[i][2:])))
+    # the first student is left out of the check, as it always was
+    max_mark = marks[1:].max(axis=0).astype(numpy.int64)
+    if (counts < max_mark).any():
+        raise Exception("the max mark of this task is greater than its total sub-criteria")
 
-    for i in range(len(indexs)):
-        if indexs[i] < max_mark[i]:
-            raise Exception("the max mark of this task is greater than its total sub-criteria")
+    expanded = numpy.empty((len(marks), int(counts.sum())), dtype=numpy.uint8)
+    start = 0
+    for task, count in enumerate(counts):
+        expanded[:, start:start + count] = marks[:, task, None] > numpy.arange(count)
+        start += count
 
     new_array = [index[1], index[0]]
-
-    for row in range(1, len(array)):
-        tmp = []
-        for column in range(1, len(array[0])):
-            for i in range(indexs[column - 1]):
-                if array[row][column] > 0:
-                    tmp.append(1)
-                    array[row][column] -= 1
-                else:
-                    tmp.append(0)
-                    array[row][column] -= 1
-        # print(tmp)
-        new_array.append(tmp)
-    # new_array[1][0] = "student_id"
     new_array[0].insert(0, "")
-    for i in range(len(array)):
-        new_array[i + 1].insert(0, array[i][0])
+    new_array[1].insert(0, array[0][0])
+    for row in range(1, len(array)):
+        new_array.append([array[row][0]] + expanded[row - 1].tolist())
     return new_array
 
 
@@ -88,65 +153,286 @@ def transpose(array):
     return temp
 
 
-def readfile(file_name):
+MARK_ERROR = "Mark data should present starting from B3, non-integer or negative value detected."
+
+
+def convert_cell(value):
     """
-    # read an excel file and store it in a 2d array
-    :return: a 2d array containing all information from that excel file
+    # convert a cell value the way pandas does when it reads an excel file
+    :param value: a cell value from openpyxl
+    :return: nan for an empty cell, int for a whole number, otherwise the value itself
     """
-    xls = pd.ExcelFile(file_name)
-    sheet_names = xls.sheet_names
+    if value is None:
+        return float('nan')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
 
-    if len(sheet_names) < 2:
-        raise Exception('Excel file has less than 2 work sheets')
 
-    df1 = pd.read_excel(xls, sheet_names[0])
+def trim_row(row):
+    """
+    # drop the empty cells at the end of a row
+    :param row: a tuple of cell values
+    :return: the row without its trailing empty cells
+    """
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row[:end]
 
-    excel_dict1 = df1.to_dict(orient='dict')
 
-    array1 = []
-    # read the first worksheet
-    for key in excel_dict1.keys():
-        temp_array1 = []
-        for index in excel_dict1[key]:
-            temp_array1.append(excel_dict1[key][index])
+def sheet_columns(worksheet):
+    """
+    # stream a worksheet into a list of columns, the first row being the header and dropped, the same layout
+    readfile used to get from pandas: trailing empty rows and columns are left out, other empty cells are nan
+    :param worksheet: an openpyxl read-only worksheet
+    :return: a 2d array, one list per column
+    """
+    worksheet.reset_dimensions()
+    rows = []
+    pending_blank = 0
+    width = 0
+    for index, row in enumerate(worksheet.iter_rows(values_only=True)):
+        row = trim_row(row)
+        width = max(width, len(row))
+        if index == 0:
+            continue
+        if not row:
+            pending_blank += 1
+            continue
+        rows.extend([()] * pending_blank)
+        pending_blank = 0
+        rows.append(row)
+    columns = [[] for _ in range(width)]
+    for row in rows:
+        for i in range(width):
+            columns[i].append(convert_cell(row[i] if i < len(row) else None))
+    return columns
 
-        array1.append(temp_array1)
-    for i in range(len(array1[0])):
-        array1[0][i] = str(array1[0][i])
 
-    fst_row_int_cnt, snd_row_int_cnt = 0, 0
-    item_name = []
-    for i in range(1, len(array1)):
-        if isinstance(array1[i][0], (float, int)) and int(math.floor(array1[i][0])) == array1[i][0]:
+def read_mark_sheet(worksheet):
+    """
+    # stream the first worksheet (marks) into the layout readfile returns: a list of columns, the first one holding
+    the student ids as strings, the others an item name followed by the marks of every student.
+    marks are validated row by row while they are read, the first bad row raises, and they are stored in an integer
+    array preallocated from the sheet dimension
+    :param worksheet: an openpyxl read-only worksheet
+    :return: a 2d array, one list per column
+    """
+    capacity = worksheet.max_row or 64
+    worksheet.reset_dimensions()
+    rows = worksheet.iter_rows(values_only=True)
+    width = len(trim_row(next(rows, ())))
+    item_row = trim_row(next(rows, ()))
+    width = max(width, len(item_row))
+
+    student_id = [convert_cell(item_row[0] if item_row else None)]
+    marks = None
+    count = 0
+    pending_blank = 0
+    for row in rows:
+        row = trim_row(row)
+        if not row:
+            pending_blank += 1
+            continue
+        if marks is None:
+            width = max(width, len(row))
+            marks = numpy.empty((capacity, width - 1), dtype=numpy.int64)
+        # a blank row in between, or a row shorter or longer than the others, leaves empty (nan) marks
+        if pending_blank or len(row) != width:
+            raise Exception(MARK_ERROR)
+        values = numpy.array(row[1:])
+        if values.dtype.kind not in 'biuf':
+            raise Exception(MARK_ERROR)
+        if values.dtype.kind == 'f' and \
+                (numpy.isnan(values).any() or (numpy.floor(values) != values).any()):
+            raise Exception(MARK_ERROR)
+        if (values < 0).any():
+            raise Exception(MARK_ERROR)
+        if count == len(marks):
+            marks = numpy.concatenate((marks, numpy.empty_like(marks)))
+        marks[count] = values
+        count += 1
+        student_id.append(convert_cell(row[0]))
+
+    if marks is None:
+        marks = numpy.empty((0, max(width - 1, 0)), dtype=numpy.int64)
+    item_name = [convert_cell(item_row[i] if i < len(item_row) else None) for i in range(1, width)]
+    array1 = [[str(name) for name in student_id]]
+    for i, column in enumerate(marks[:count].T.tolist()):
+        array1.append([item_name[i]] + column)
+    return array1
+
+
+def check_items(item_name):
+    """
+    # check the item names, read from the second row of the first worksheet
+    :param item_name: a list of item names
+    :return: null
+    """
+    snd_row_int_cnt = 0
+    for name in item_name:
+        # empty names are nan, which is not a whole number
+        if isinstance(name, (float, int)) and float(name).is_integer():
             snd_row_int_cnt += 1
-        item_name.append(array1[i][0])
-        for j in range(1, len(array1[0])):
-            if not isinstance(array1[i][j], (float, int)) or \
-                    math.isnan(array1[i][j]) or array1[i][j] < 0 or \
-                    int(math.floor(array1[i][j])) != array1[i][j]:
-                raise Exception("Mark data should present starting from B3, non-integer or negative value detected.")
-    if snd_row_int_cnt == len(array1) - 1:
+    if snd_row_int_cnt == len(item_name):
         raise Exception("Second row should be item names, digit value detected.")
     if len(item_name) != len(set(item_name)):
         raise Exception("Duplicate item name detected.")
-    if len(array1[0][1:]) != len(set(array1[0][1:])):
-        raise Exception("Duplicate student name detected.")
 
-    array2 = []
 
-    df2 = pd.read_excel(xls, sheet_names[1])
-    excel_dict2 = df2.to_dict(orient='dict')
+def check_names(array1):
+    """
+    # check the item names (second row) and student names (first column) of the first worksheet
+    :param array1: the first worksheet as a list of columns
+    :return: null
+    """
+    check_items([column[0] for column in array1[1:]])
+    if len(array1[0][1:]) != len(set(array1[0][1:])):
+        raise Exception("Duplicate student name detected.")
 
-    for key in excel_dict2.keys():
-        temp_array2 = []
-        for index in excel_dict2[key]:
-            temp_array2.append(excel_dict2[key][index])
-        array2.append(temp_array2)
 
+def check_criteria(array2):
+    """
     # exam if the criteria is listed in order
+    :param array2: the second worksheet as a list of columns
+    :return: null
+    """
     previous = ""
     for i in range(len(array2[0])):
         if previous > array2[0][i]:
             raise Exception("the criteria in worksheet 2 is not listed in order")
         previous = array2[0][i]
+
+
+def check_marks(array1, array2):
+    """
+    # check that no mark is greater than the number of sub-criteria of its task, the check break_down_marks makes,
+    before the marks are transposed and broken down
+    :param array1: the first worksheet as a list of columns
+    :param array2: the second worksheet as a list of columns
+    :return: null
+    """
+    counts = criterion_counts(tuple(str(column[0]) for column in array1[1:]), tuple(array2[0]))
+    # the first student is left out of the check, as it always was
+    for count, column in zip(counts, array1[1:]):
+        if len(column) > 2 and max(column[2:]) > count:
+            raise Exception("the max mark of this task is greater than its total sub-criteria")
+
+
+def validate_workbook(workbook):
+    """
+    # the checks that need no marks, made before the marks are read: the number of worksheets, the item names in
+    the header rows of the first worksheet and the order of the criteria in the (small) second worksheet
+    :param workbook: an openpyxl read-only workbook
+    :return: the second worksheet as a list of columns
+    """
+    sheet_names = workbook.sheetnames
+    if len(sheet_names) < 2:
+        raise Exception('Excel file has less than 2 work sheets')
+    rows = workbook[sheet_names[0]].iter_rows(max_row=2, values_only=True)
+    header = trim_row(next(rows, ()))
+    item_row = trim_row(next(rows, ()))
+    check_items([convert_cell(item_row[i] if i < len(item_row) else None)
+                 for i in range(1, max(len(header), len(item_row)))])
+    array2 = sheet_columns(workbook[sheet_names[1]])
+    check_criteria(array2)
+    return array2
+
+
+def validate(file_name):
+    """
+    # reject a badly formatted excel file quickly, only the header rows of the first worksheet are read. a file that
+    passes can still be rejected by readfile, for its marks or its student names
+    :return: null
+    """
+    if not str(file_name).lower().endswith('.xlsx'):
+        import pandas as pd
+
+        validate_xls(pd.ExcelFile(file_name))
+        return
+    workbook = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        validate_workbook(workbook)
+    finally:
+        workbook.close()
+
+
+def read_xlsx(file_name):
+    """
+    # read an xlsx file with openpyxl in read-only mode, streaming rows without building DataFrames.
+    the marks are only read once the rest of the file is validated
+    :return: the same two 2d arrays as readfile
+    """
+    workbook = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        array2 = validate_workbook(workbook)
+        array1 = read_mark_sheet(workbook[workbook.sheetnames[0]])
+        check_names(array1)
+    finally:
+        workbook.close()
+    check_marks(array1, array2)
     return array1, array2
+
+
+def read_columns(xls, sheet_name, nrows=None):
+    """
+    # read a worksheet of an xls file through pandas into a list of columns, the first row being the header and dropped
+    :param nrows: number of rows to read after the header, all of them if None
+    :return: a 2d array, one list per column
+    """
+    import pandas as pd
+
+    excel_dict = pd.read_excel(xls, sheet_name, nrows=nrows).to_dict(orient='dict')
+    return [[column[index] for index in column] for column in excel_dict.values()]
+
+
+def validate_xls(xls):
+    """
+    # the checks of validate_workbook for an xls file
+    :param xls: a pandas ExcelFile
+    :return: the second worksheet as a list of columns
+    """
+    sheet_names = xls.sheet_names
+    if len(sheet_names) < 2:
+        raise Exception('Excel file has less than 2 work sheets')
+    check_items([column[0] for column in read_columns(xls, sheet_names[0], nrows=1)[1:]])
+    array2 = read_columns(xls, sheet_names[1])
+    check_criteria(array2)
+    return array2
+
+
+def read_xls(file_name):
+    """
+    # read an xls file through pandas, openpyxl only reads xlsx
+    :return: the same two 2d arrays as readfile
+    """
+    import pandas as pd
+
+    xls = pd.ExcelFile(file_name)
+    array2 = validate_xls(xls)
+
+    # read the first worksheet
+    array1 = read_columns(xls, xls.sheet_names[0])
+    for i in range(len(array1[0])):
+        array1[0][i] = str(array1[0][i])
+
+    for i in range(1, len(array1)):
+        for j in range(1, len(array1[0])):
+            if not isinstance(array1[i][j], (float, int)) or \
+                    math.isnan(array1[i][j]) or array1[i][j] < 0 or \
+                    int(math.floor(array1[i][j])) != array1[i][j]:
+                raise Exception(MARK_ERROR)
+    check_names(array1)
+    check_marks(array1, array2)
+    return array1, array2
+
+
+def readfile(file_name):
+    """
+    # read an excel file and store it in a 2d array
+    :return: a 2d array containing all information from that excel file
+    """
+    if str(file_name).lower().endswith('.xlsx'):
+        return read_xlsx(file_name)
+    return read_xls(file_name)
@@ -67,13 +67,20 @@ Section III. Helper functions:
     transpose_matrix(matrix)
 
     The above mentioned functions can be skipped while you read the code.
+
+
+Section IV. Matrix engine:
+
+    The calculations are implemented in engine.py on 2-d numpy arrays. The list based functions in this file are thin
+    wrappers around it and accept either nested lists or arrays. Callers that run several stages on the same data
+    should convert it once with 'as_matrix(matrix)' and pass the array to every stage.
 '''
 
-import copy
 import math
 import numpy
-from numpy import dot
-from numpy.linalg import norm
+
+from . import engine
+from .engine import as_matrix
 
 
 def clean_input(original_data):
@@ -91,11 +98,7 @@ def sum_item_score(matrix):
     :param matrix:  The original data.
     :return:    List that containing each column's scores.
     """
-    result = []
-    for i in range(len(matrix[0])):
-        sum_item = sum([row[i] for row in matrix])
-        result.append(sum_item)
-    return result
+    return engine.sum_item_score(as_matrix(matrix)).tolist()
 
 
 # This will be helpful for later use.
@@ -127,29 +130,7 @@ def detect_full_score(matrix):
 # Receive a student matrix. Wants to accumulate the score rate accumulated matrix.
 # Assume the input is cleaned and sorted. No more sorting needed.
 def cal_scorerate_accumulated_matrix(matrix, is_student):
-    transposed = transpose_matrix(matrix)
-
-    accumulated_score = []
-    scorerate_accumulated = []
-
-    full_marks = detect_full_score(transposed)  # Full mark for each question.
-    # print(full_marks)
-    # if is_student:
-
-    full_marks_accumulated = numpy.cumsum(full_marks).tolist()
-    # print("This is the accumulated full marks, ", full_marks_accumulated)
-
-    for i in range(len(matrix)):
-        accumulated_score.append(numpy.cumsum(matrix[i]).tolist())
-    # print("This is the accumulated score, ", accumulated_score)
-
-    for item in accumulated_score:
-        temp = []
-        for i in range(len(item)):
-            temp.append(item[i] / full_marks_accumulated[i])
-        scorerate_accumulated.append(temp)
-
-    return scorerate_accumulated
+    return engine.cal_scorerate_accumulated_matrix(as_matrix(matrix)).tolist()
 
 
 def get_0staddv_index(matrix):
@@ -158,15 +139,7 @@ def get_0staddv_index(matrix):
     :param matrix:  The input data after cleaning up.
     :return:    Indexes of students that have zero standard deviation.
     """
-    zero_staddv_index = []
-    try:
-        for i in range(len(matrix)):
-            if numpy.std(matrix[i]) == 0:
-                zero_staddv_index.append(i)
-    except:
-        pass
-
-    return zero_staddv_index
+    return engine.get_0staddv_index(as_matrix(matrix)).tolist()
 
 
 def in_danger_list(danger_list, current_index):
@@ -184,44 +157,8 @@ def in_danger_list(danger_list, current_index):
 
 
 def irregular_calculation(matrix, flag, is_student):
-    scorerate = cal_scorerate_accumulated_matrix(matrix, is_student)
-
-    zero_stddiv_accumulated_list = get_0staddv_index(scorerate)
-
-    accumulation_result = []
-    similarity_result = []
-    correlation_result = []
-
-    if zero_stddiv_accumulated_list:
-        accumulation_0stddv_is_empty = False  # Exist 0 standard deviation accumulation data
-    else:
-        accumulation_0stddv_is_empty = True
-
-    # Remove the element that contains zero standard deviation.
-    matrix_copy = copy.deepcopy(matrix)
-    for e in reversed(zero_stddiv_accumulated_list):
-        matrix_copy.pop(e)
-
-    scorerate = cal_scorerate_accumulated_matrix(matrix_copy, is_student)
-    for i in range(len(matrix_copy)):
-        similarity_result.append(irregular_cal(matrix_copy, i, 'Similarity', scorerate,
-                                               zero_stddiv_accumulated_list, accumulation_0stddv_is_empty))
-        accumulation_result.append(irregular_cal(matrix_copy, i, 'Accumulation', scorerate,
-                                                 zero_stddiv_accumulated_list, accumulation_0stddv_is_empty))
-        correlation_result.append(irregular_cal(matrix_copy, i, 'Correlation', scorerate,
-                                                zero_stddiv_accumulated_list, accumulation_0stddv_is_empty))
-    # Data needs to be put back.
-    # The value is not full. There are values deleted.
-    temp = [j for i in accumulation_result for j in i]
-    for e in zero_stddiv_accumulated_list:
-        temp.insert(e, 0.0)
-
-    if flag == 'Correlation':
-        return [j for i in correlation_result for j in i]
-    elif flag == 'Accumulation':
-        return temp
-    elif flag == 'Similarity':
-        return [j for i in similarity_result for j in i]
+    result = engine.irregular_calculation(as_matrix(matrix), flag)
+    return None if result is None else result.tolist()
 
 
 def return_irregular_index(original_data, is_student, flag):
@@ -231,107 +168,14 @@ def return_irregular_index(original_data, is_student, flag):
     :param is_student:  A boolean value, specifying if the user wants the row/column detection.
     :return:    A list of irregular pattern.
     """
-    sorted_item = original_data
-
-    matrix = sorted_item
-    transpose = transpose_matrix(matrix)
-
-    if not is_student:
-        columns_similarity = irregular_calculation(transpose, flag, is_student)
-        return detect_item_irregular(columns_similarity, transpose)
-    elif is_student:
-        student_similarity = irregular_calculation(matrix, flag, is_student)
-        return detect_item_irregular(student_similarity, matrix)
+    return engine.return_irregular_index(as_matrix(original_data), is_student, flag).tolist()
 
 
 def irregular_cal(matrix, current_index, flag, scorerate, danger_accumulated_list, is_empty):
-    correlation_result = []
-    accumulation_correlation_result = []
-    similarity_result = []
-    range_correlation = math.floor(math.sqrt(len(matrix))) - 1
-
-    temp_correlation = 0.0
-    temp_accumulation_correlation = 0.0
-    temp_similarity = 0.0
-    calculation_counter = 0
-    for i in range(range_correlation):
-        if (current_index - i - 1) <= 0:
-            try:
-                temp_correlation_mid = numpy.corrcoef(matrix[current_index], matrix[current_index + i + 1])[0, 1]
-                temp_accumulation_correlation_mid = \
-                    numpy.corrcoef(scorerate[current_index], scorerate[current_index + i + 1])[0, 1]
-                temp_similarity_mid = dot(matrix[current_index], matrix[current_index + i + 1]) / (
-                        norm(matrix[current_index]) *
-                        norm(matrix[current_index + i + 1]))
-
-                temp_accumulation_correlation += temp_accumulation_correlation_mid
-                temp_correlation += temp_correlation_mid
-                temp_similarity += temp_similarity_mid
-                calculation_counter += 1
-
-            except:
-                pass
-        elif (current_index + i + i) >= (len(matrix) - 1):
-            try:
-                temp_correlation_mid = numpy.corrcoef(matrix[current_index], matrix[current_index - i - 1])[0, 1]
-                temp_accumulation_correlation_mid = \
-                    numpy.corrcoef(scorerate[current_index], scorerate[current_index - i - 1])[0, 1]
-                temp_similarity_mid = dot(matrix[current_index], matrix[current_index - i - 1]) / (
-                        norm(matrix[current_index]) *
-                        norm(matrix[current_index - i - 1]))
-
-                temp_accumulation_correlation += temp_accumulation_correlation_mid
-                temp_correlation += temp_correlation_mid
-                temp_similarity += temp_similarity_mid
-
-                calculation_counter += 1
-
-            except:
-                pass
-        else:
-            try:
-                temp_accumulation_correlation_mid = \
-                    numpy.corrcoef(scorerate[current_index], scorerate[current_index - i - 1])[0, 1]
-                temp_correlation_mid = numpy.corrcoef(matrix[current_index], matrix[current_index - i - 1])[0, 1]
-                temp_similarity_mid = dot(matrix[current_index], matrix[current_index - i - 1]) / (
-                        norm(matrix[current_index]) *
-                        norm(matrix[current_index - i - 1]))
-
-                temp_accumulation_correlation += temp_accumulation_correlation_mid
-                temp_correlation += temp_correlation_mid
-                temp_similarity += temp_similarity_mid
-
-                calculation_counter += 1
-
-            except:
-                pass
-            try:
-                temp_correlation_mid = numpy.corrcoef(matrix[current_index], matrix[current_index + i + 1])[0, 1]
-                temp_accumulation_correlation_mid = \
-                    numpy.corrcoef(scorerate[current_index], scorerate[current_index + i + 1])[0, 1]
-                temp_similarity_mid = dot(matrix[current_index], matrix[current_index + i + 1]) / (
-                        norm(matrix[current_index]) *
-                        norm(matrix[current_index + i + 1]))
-
-                temp_accumulation_correlation += temp_accumulation_correlation_mid
-                temp_correlation += temp_correlation_mid
-                temp_similarity += temp_similarity_mid
-
-                calculation_counter += 1
-
-            except:
-                pass
-
-    correlation_result.append(temp_correlation / calculation_counter)
-    accumulation_correlation_result.append(temp_accumulation_correlation / calculation_counter)
-    similarity_result.append(temp_similarity / calculation_counter)
-
-    if flag == 'Accumulation':
-        return accumulation_correlation_result
-    elif flag == 'Correlation':
-        return correlation_result
-    elif flag == 'Similarity':
-        return similarity_result
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    scorerate = numpy.asarray(scorerate, dtype=numpy.float64)
+    # only the requested row is scored, callers loop over the rows
+    return engine.neighbour_scores(matrix, scorerate, flag, [current_index]).tolist()
 
 
 def detect_item_irregular(similarities, matrix):
@@ -346,19 +190,7 @@ def detect_item_irregular(similarities, matrix):
     re-format the data)
     :return: the list of index/position that is irregular
     """
-    result = []
-    # Set the boundary value for the number of irregular detection.
-    range_irregular = math.floor(math.log(len(matrix)))
-
-    positions = [i for i in range(len(matrix))]
-    potential_list = list(zip(similarities, positions))
-    potential_list = sorted(potential_list, key=lambda x: x[0])
-    zero_result = []
-
-    for i in potential_list[0:range_irregular]:
-        if i[0] < 0.0:
-            result.append(i[1])
-    return result
+    return engine.detect_item_irregular(similarities, len(matrix)).tolist()
 
 
 # Getter for correlations
@@ -373,83 +205,32 @@ def return_correlation(original_data, is_student, flag):
     :param is_student:  A boolean value, specifying if the user wants the row/column detection.
     :return: A list of correlations of each item/column.
     """
-    sorted_item = original_data
+    result = engine.return_correlation(as_matrix(original_data), is_student, flag)
+    return None if result is None else result.tolist()
 
-    # Orginal data is manipulated into either matrix(student as row) or transpose(criteria as row)
-    matrix = sorted_item
-    transpose = transpose_matrix(matrix)
 
-    # Retrieve the correlation of columns, use transpose
-    if not is_student:
-        return irregular_calculation(transpose, flag, is_student)
-    elif is_student:
-        return irregular_calculation(matrix, flag, is_student)
+def update_correlation(original_data, is_student, flag, previous_data, previous_correlation):
+    """
+    Return the same as return_correlation, reusing the correlations of a previous version of the data. Only the scores
+    near the changed rows/columns are calculated again, see engine.update_irregular_calculation.
+    :param original_data:   Original data.
+    :param is_student:  A boolean value, specifying if the user wants the row/column detection.
+    :param previous_data:   The previous data, None to calculate everything.
+    :param previous_correlation:    return_correlation of the previous data.
+    :return: A list of correlations of each item/column.
+    """
+    previous_data = None if previous_data is None else as_matrix(previous_data)
+    result = engine.update_correlation(as_matrix(original_data), is_student, flag, previous_data, previous_correlation)
+    return None if result is None else result.tolist()
 
 
 def irregular_box(matrix):
-    if len(matrix[0]) < 2 or len(matrix) < 4:
-        return []
-    section_qty = min(math.floor(math.sqrt(len(matrix[0]))), 5)
-    min_height = math.ceil(math.sqrt(len(matrix)))
-    sample_height = math.ceil(math.log(len(matrix)))
-
-    item_sum = sum_item_score(matrix)
-    item_diff = [item_sum[i] - item_sum[i + 1] for i in range(len(item_sum) - 1)]
-    tuple_diff = [(item_diff[i], i) for i in range(len(item_diff))]
-    tuple_diff.sort(reverse=True)
-    selected_tuple = tuple_diff[:section_qty - 1]
-    selected_col = [i for _, i in selected_tuple]
-    selected_col.append(-1)
-    selected_col.append(len(matrix[0]) - 1)
-    selected_col.sort()
-    result = []
-    for i in range(len(selected_col) - 1):
-        best = 99999999
-        best_j_k = (-1, -1)
-        col1, col2 = selected_col[i] + 1, selected_col[i + 1]
-        pre_box_sample_sum = sum([sum(row[col1: col2 + 1]) for row in matrix[:sample_height]])
-        pre_box_sample_correct_rate = pre_box_sample_sum / (sample_height * (col2 - col1 + 1))
-        post_box_sample_sum = sum([sum(row[col1: col2 + 1]) for row in matrix[-sample_height:]])
-        post_box_sample_correct_rate = post_box_sample_sum / (sample_height * (col2 - col1 + 1))
-
-        for j in [0] + list(range(math.ceil(min_height / 2), len(matrix))):
-            pre_box_sum = 0
-            for n in range(j):
-                pre_box_sum += sum(matrix[n][col1: col2 + 1])
-            pre_box_correct_rate = pre_box_sample_correct_rate if j == 0 \
-                else pre_box_sum / (j * (col2 - col1 + 1))
-
-            box_sum = -1
-            post_box_sum = -1
-            for k in range(j + min_height - 1, len(matrix)):
-                if box_sum == -1:
-                    box_sum, post_box_sum = 0, 0
-                    for n in range(j, k + 1):
-                        box_sum += sum(matrix[n][col1: col2 + 1])
-                    for n in range(k + 1, len(matrix)):
-                        post_box_sum += sum(matrix[n][col1: col2 + 1])
-                else:
-                    edge_row_sum = sum(matrix[k][col1: col2 + 1])
-                    box_sum += edge_row_sum
-                    post_box_sum -= edge_row_sum
-                box_correct_rate = box_sum / ((k - j + 1) * (col2 - col1 + 1))
-
-                post_box_correct_rate = post_box_sample_correct_rate if k + 1 == len(matrix) \
-                    else post_box_sum / ((len(matrix) - k - 1) * (col2 - col1 + 1))
-
-                dis = 2 + (abs(box_correct_rate - 0.5) ** 2) * 3 - \
-                    (abs(pre_box_correct_rate - box_correct_rate) ** 2) - \
-                    (abs(post_box_correct_rate - box_correct_rate) ** 2)
-
-                dis *= 1 + (k - j) / (len(matrix) ** 1.5) if abs(box_correct_rate - 0.5) < 0.4 \
-                    else 10 - (k - j) / (len(matrix) ** 1.5)
-
-                if dis < best:
-                    best = dis
-                    best_j_k = (j, k)
-        result.append((col1, col2, best_j_k))
-    # print("BOXES: ", result)
-    return result
+    """
+    Search the irregular box of every column section, see engine.irregular_box.
+    :param matrix:  The input data after cleaning up and sorting.
+    :return:    A list of (col1, col2, (row1, row2)), one for each section.
+    """
+    return engine.irregular_box(as_matrix(matrix))
 
 
 def get_neighbours(radius):
@@ -484,40 +265,21 @@ def calculate_radius(array):
 
 def odd_cells(matrix):
     """
-    this function is to find anomalies in a 2d array
+    this function is to find anomalies in a 2d array, see engine.odd_cells
+    :param matrix: a 2d array
+    :return: an array of sets of anomalies' coordinates
+    """
+    return engine.odd_cells(as_matrix(matrix))
+
+
+def update_odd_cells(matrix, previous_matrix, previous_odd_cells):
+    """
+    this function returns the same as odd_cells, only checking the cells near the changed cells again, see
+    engine.update_odd_cells
     :param matrix: a 2d array
-    :param neighbours: neighbours of a particular cell, in order to calculate the cell's neighbours value
+    :param previous_matrix: the previous version of the 2d array, None to check every cell
+    :param previous_odd_cells: odd_cells of the previous 2d array
     :return: an array of sets of anomalies' coordinates
     """
-    max_mark = []
-    for i in range(0, len(matrix[0])):
-        # assume the maximum mark of this task is 1
-        max = 1
-        for j in range(0, len(matrix)):
-            if max < int(matrix[j][i]):
-                max = int(matrix[j][i])
-        max_mark.append(max)
-
-    neighbours = get_neighbours(calculate_radius(matrix))
-    cells = []
-    threshold = 0.90
-    for i in range(0, len(matrix)):
-        for j in range(0, len(matrix[0])):
-            count_zeros = 0
-            count_ones = 0
-            total_neighbours = 0
-            for (x, y) in neighbours:
-                if 0 <= i + x < len(matrix) and 0 <= j + y < len(matrix[0]):
-                    if matrix[i + x][j + y] == 0:
-                        count_zeros += 1
-                        total_neighbours += 1
-                    else:
-                        # substitute with count_ones += matrix[i + x][j + y] if scoring rate is chosen
-                        count_ones += 1
-                        total_neighbours += 1
-
-            if matrix[i][j] == 0 and count_ones / total_neighbours > threshold:
-                cells.append((i, j))
-            elif matrix[i][j] > 0 and count_zeros / total_neighbours > threshold:
-                cells.append((i, j))
-    return cells
+    previous_matrix = None if previous_matrix is None else as_matrix(previous_matrix)
+    return engine.update_odd_cells(as_matrix(matrix), previous_matrix, previous_odd_cells)
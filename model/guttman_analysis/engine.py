@@ -0,0 +1,546 @@
+'''
+
+Matrix-native implementation of the Guttman analysis stages.
+
+    Every function in this file works on a single 2-d numpy array (row: student, column: sub-criteria, or the
+transpose of it when items are analysed) instead of nested lists. The list based interface functions in __init__.py
+are thin wrappers around these, so other modules can keep passing nested lists, while the upload pipeline converts
+the cleaned data once with 'as_matrix' and passes the array to every stage.
+
+'''
+
+import math
+import numpy
+
+
+def as_matrix(matrix):
+    """
+    Convert the cleaned input data into a 2-d numpy array. Non-negative integer marks that fit into one byte (the 0/1
+    data produced by break_down_marks) are stored as uint8, anything else keeps the dtype numpy picks for it.
+    An array passed in is returned as it is.
+    :param matrix:  Cleaned data, either nested list or 2-d numpy array.
+    :return:    2-d numpy array.
+    """
+    if isinstance(matrix, numpy.ndarray) and matrix.ndim == 2:
+        return matrix
+    array = numpy.array(matrix)
+    if array.size == 0:
+        return array.reshape(len(matrix), 0).astype(numpy.uint8)
+    if array.dtype.kind in 'biu' and array.min() >= 0 and array.max() <= 255:
+        array = array.astype(numpy.uint8)
+    return array
+
+
+def clean_input(original_data):
+    """
+    Remove the two header rows and the student id column, then convert the marks into a 2-d numpy array.
+    :param original_data:   Data from file_importing, with both columns name and rows name.
+    :return:    2-d numpy array, row: student, column: sub-criteria.
+    """
+    return as_matrix([row[1:] for row in original_data[2:]])
+
+
+def sum_item_score(matrix):
+    """
+    Summation of item scores.
+    :param matrix:  2-d numpy array.
+    :return:    1-d numpy array containing each column's scores.
+    """
+    return matrix.sum(axis=0)
+
+
+def cal_scorerate_accumulated_matrix(matrix):
+    """
+    Accumulated score rate of every row. The full mark of each sub-criteria is 1, so the accumulated full mark of
+    column j is j + 1.
+    :param matrix:  2-d numpy array, assumed to be cleaned and sorted.
+    :return:    2-d float array with the same shape as the input.
+    """
+    accumulated_score = numpy.cumsum(matrix, axis=1, dtype=numpy.int64)
+    full_marks_accumulated = numpy.arange(1, matrix.shape[1] + 1)
+    return accumulated_score / full_marks_accumulated
+
+
+def get_0staddv_index(matrix):
+    """
+    Return the positions of rows that have a zero standard deviation.
+    :param matrix:  2-d numpy array.
+    :return:    1-d int array of row indexes.
+    """
+    return numpy.flatnonzero(numpy.std(matrix, axis=1) == 0)
+
+
+# scores closer to 0 than this are rounding errors of the dot products, a correlation of exactly 0 must not come out
+# slightly negative and be detected as irregular
+ZERO_TOLERANCE = 1e-12
+
+
+def snap_zero(scores):
+    """
+    Round the scores that are only rounding errors away from 0 to 0.
+    :param scores:  1-d float array.
+    :return:    1-d float array.
+    """
+    return numpy.where(numpy.abs(scores) < ZERO_TOLERANCE, 0.0, scores)
+
+
+def standardize_rows(matrix, flag):
+    """
+    Scale every row once, so the score of two rows is the dot product of their scaled rows.
+    'Correlation' and 'Accumulation' centre the row and divide it by the norm of the centred row (Pearson correlation),
+    'Similarity' divides the row by its norm (cosine similarity).
+    :param matrix:  2-d float array.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :return:    2-d float array with the same shape as the input.
+    """
+    if flag != 'Similarity':
+        matrix = matrix - matrix.mean(axis=1, keepdims=True)
+    return matrix / numpy.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def neighbour_scores(matrix, scorerate, flag, rows=None):
+    """
+    Average score between every row and its neighbours, within a band of floor(sqrt(rows)) - 1 rows.
+    The rows are standardized once, then each offset of the band is one vectorized pass over all rows, the score of
+    row j and row j + offset being shared by both rows. The neighbours chosen for each row and the order the scores are
+    added up are exactly those of the original per-row loop:
+        - rows close to the top only use the row below,
+        - rows close to the bottom only use the row above,
+        - all other rows use both.
+    :param matrix:  2-d float array (any number type when 'rows' is given), rows with zero standard deviation removed.
+    :param scorerate:   Accumulated score rate of the matrix, only used for 'Accumulation'.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :param rows:    1-d int array, only score these rows if given.
+    :return:    1-d float array, the average score of each row (of each of 'rows' if given).
+    """
+    length = len(matrix)
+    range_correlation = math.floor(math.sqrt(length)) - 1
+    source = scorerate if flag == 'Accumulation' else matrix
+    if rows is not None:
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        # only the rows within the band of the scored rows are needed
+        needed = band_mask(rows, length, range_correlation)
+        standardized = numpy.zeros(source.shape)
+        standardized[needed] = standardize_rows(source[needed].astype(numpy.float64), flag)
+        return neighbour_scores_at(standardized, flag, range_correlation, rows)
+    standardized = standardize_rows(source, flag)
+
+    current_index = numpy.arange(length)
+    total = numpy.zeros(length)
+    calculation_counter = numpy.zeros(length, dtype=numpy.int64)
+    for i in range(range_correlation):
+        offset = i + 1
+        pair = numpy.einsum('ij,ij->i', standardized[:-offset], standardized[offset:])
+        if flag != 'Similarity':
+            pair = numpy.clip(pair, -1, 1)
+
+        near_top = current_index - offset <= 0
+        near_bottom = ~near_top & (current_index + i + i >= length - 1)
+        use_before = ~near_top
+        use_after = (near_top & (current_index + offset < length)) | (~near_top & ~near_bottom)
+
+        before = numpy.zeros(length)
+        before[offset:] = pair
+        after = numpy.zeros(length)
+        after[:-offset] = pair
+        total += numpy.where(use_before, before, 0.0)
+        total += numpy.where(use_after, after, 0.0)
+        calculation_counter += use_before
+        calculation_counter += use_after
+
+    if length and not calculation_counter.all():
+        # Fewer than 4 rows leave no neighbour to average over.
+        raise ZeroDivisionError('float division by zero')
+    return snap_zero(total / calculation_counter)
+
+
+def band_mask(rows, length, range_correlation):
+    """
+    Mark the rows within range_correlation of any of the given rows.
+    :param rows:    1-d int array of rows.
+    :param length:  Number of rows.
+    :param range_correlation:   Number of neighbours on each side.
+    :return:    1-d bool array of the given length.
+    """
+    # a running count of the bands opened and closed at every row
+    bounds = numpy.zeros(length + 1, dtype=numpy.int64)
+    numpy.add.at(bounds, numpy.maximum(rows - range_correlation, 0), 1)
+    numpy.add.at(bounds, numpy.minimum(rows + range_correlation + 1, length), -1)
+    return numpy.cumsum(bounds[:-1]) > 0
+
+
+def neighbour_scores_at(standardized, flag, range_correlation, rows):
+    """
+    The scores of neighbour_scores for some rows only, added up in the same order so they are exactly the same.
+    :param standardized:    2-d float array, the standardized rows.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :param range_correlation:   Number of neighbours on each side.
+    :param rows:    1-d int array of the rows to score.
+    :return:    1-d float array, the average score of each of the rows.
+    """
+    length = len(standardized)
+    total = numpy.zeros(len(rows))
+    calculation_counter = numpy.zeros(len(rows), dtype=numpy.int64)
+    for i in range(range_correlation):
+        offset = i + 1
+        near_top = rows - offset <= 0
+        near_bottom = ~near_top & (rows + i + i >= length - 1)
+        use_before = ~near_top
+        use_after = (near_top & (rows + offset < length)) | (~near_top & ~near_bottom)
+
+        before = numpy.zeros(len(rows))
+        index = rows[use_before]
+        before[use_before] = numpy.einsum('ij,ij->i', standardized[index - offset], standardized[index])
+        after = numpy.zeros(len(rows))
+        index = rows[use_after]
+        after[use_after] = numpy.einsum('ij,ij->i', standardized[index], standardized[index + offset])
+        if flag != 'Similarity':
+            before = numpy.clip(before, -1, 1)
+            after = numpy.clip(after, -1, 1)
+        total += numpy.where(use_before, before, 0.0)
+        total += numpy.where(use_after, after, 0.0)
+        calculation_counter += use_before
+        calculation_counter += use_after
+
+    if len(rows) and not calculation_counter.all():
+        raise ZeroDivisionError('float division by zero')
+    return snap_zero(total / calculation_counter)
+
+
+def irregular_calculation(matrix, flag):
+    """
+    Neighbourhood score of every row of the matrix.
+    Rows with zero standard deviation are left out of the calculation. For 'Accumulation' they are put back with a
+    score of 0.0, for the other flags the result only contains the remaining rows.
+    :param matrix:  2-d numpy array.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :return:    1-d float array, or None for an unknown flag.
+    """
+    if flag not in ('Correlation', 'Accumulation', 'Similarity'):
+        return None
+
+    scorerate = cal_scorerate_accumulated_matrix(matrix)
+    zero_stddiv_index = get_0staddv_index(scorerate)
+
+    keep = numpy.ones(len(matrix), dtype=bool)
+    keep[zero_stddiv_index] = False
+    # Float copy, so dot products of uint8 rows can not overflow.
+    reduced = matrix[keep].astype(numpy.float64)
+    scorerate = scorerate[keep]
+
+    scores = neighbour_scores(reduced, scorerate, flag)
+    if flag == 'Accumulation':
+        result = numpy.zeros(len(matrix))
+        result[keep] = scores
+        return result
+    return scores
+
+
+def update_irregular_calculation(matrix, flag, previous_matrix, previous_scores):
+    """
+    The result of irregular_calculation(matrix, flag), reusing its result for a previous matrix of the same shape.
+    The score of a row only depends on the rows within its band, so only the rows within the band of a changed row are
+    scored again. Everything is calculated again when the shape or the rows with zero standard deviation changed.
+    :param matrix:  2-d numpy array.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :param previous_matrix: 2-d numpy array, the matrix the previous scores were calculated for.
+    :param previous_scores: 1-d float array, irregular_calculation(previous_matrix, flag).
+    :return:    1-d float array, or None for an unknown flag.
+    """
+    if flag not in ('Correlation', 'Accumulation', 'Similarity') or previous_matrix is None or \
+            previous_scores is None or previous_matrix.shape != matrix.shape:
+        return irregular_calculation(matrix, flag)
+
+    changed = numpy.flatnonzero((matrix != previous_matrix).any(axis=1))
+    scorerate = cal_scorerate_accumulated_matrix(matrix)
+    keep = numpy.ones(len(matrix), dtype=bool)
+    keep[get_0staddv_index(scorerate)] = False
+    # only a changed row can have gained or lost its zero standard deviation
+    previous_keep = numpy.ones(len(changed), dtype=bool)
+    previous_keep[get_0staddv_index(cal_scorerate_accumulated_matrix(previous_matrix[changed]))] = False
+    length = int(keep.sum())
+    previous_scores = numpy.asarray(previous_scores, dtype=numpy.float64)
+    if (keep[changed] != previous_keep).any() or \
+            len(previous_scores) != (len(matrix) if flag == 'Accumulation' else length) or length < 4:
+        return irregular_calculation(matrix, flag)
+
+    scores = previous_scores[keep] if flag == 'Accumulation' else previous_scores.copy()
+    # positions of the changed rows once the rows with zero standard deviation are left out
+    changed = (numpy.cumsum(keep) - 1)[changed[keep[changed]]]
+    rows = numpy.flatnonzero(band_mask(changed, length, math.floor(math.sqrt(length)) - 1))
+    if len(rows):
+        scores[rows] = neighbour_scores(matrix[keep], scorerate[keep], flag, rows)
+    if flag == 'Accumulation':
+        result = numpy.zeros(len(matrix))
+        result[keep] = scores
+        return result
+    return scores
+
+
+def detect_item_irregular(similarities, length):
+    """
+    Positions of the floor(log(length)) lowest scores, if they are negative.
+    :param similarities:    1-d array of scores.
+    :param length:  Number of rows the scores were calculated for.
+    :return:    1-d int array of irregular positions.
+    """
+    similarities = numpy.asarray(similarities, dtype=numpy.float64)
+    range_irregular = math.floor(math.log(length))
+    positions = numpy.arange(len(similarities))
+    # Sort by score, ties broken by position.
+    lowest = numpy.lexsort((positions, similarities))[:range_irregular]
+    return lowest[similarities[lowest] < 0.0]
+
+
+def return_irregular_index(matrix, is_student, flag):
+    """
+    Return the index of irregular column/ row.
+    :param matrix:  2-d numpy array, row: student, column: sub-criteria.
+    :param is_student:  True for row (student) detection, False for column (item) detection.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :return:    1-d int array of irregular positions.
+    """
+    target = matrix if is_student else matrix.T
+    return detect_item_irregular(irregular_calculation(target, flag), len(target))
+
+
+def return_correlation(matrix, is_student, flag):
+    """
+    Return the neighbourhood score of each row (is_student) or column.
+    :param matrix:  2-d numpy array, row: student, column: sub-criteria.
+    :param is_student:  True for row (student) scores, False for column (item) scores.
+    :param flag:    'Correlation', 'Accumulation' or 'Similarity'.
+    :return:    1-d float array.
+    """
+    target = matrix if is_student else matrix.T
+    return irregular_calculation(target, flag)
+
+
+def update_correlation(matrix, is_student, flag, previous_matrix, previous_scores):
+    """
+    The result of return_correlation(matrix, is_student, flag), reusing its result for a previous matrix, see
+    update_irregular_calculation.
+    :param previous_matrix: 2-d numpy array, the matrix the previous scores were calculated for.
+    :param previous_scores: 1-d float array, return_correlation(previous_matrix, is_student, flag).
+    :return:    1-d float array.
+    """
+    target = matrix if is_student else matrix.T
+    if previous_matrix is not None and not is_student:
+        previous_matrix = previous_matrix.T
+    return update_irregular_calculation(target, flag, previous_matrix, previous_scores)
+
+
+def summed_area_table(matrix):
+    """
+    2-d prefix sums of the matrix, table[r, c] is the sum of matrix[:r, :c].
+    :param matrix:  2-d numpy array.
+    :return:    2-d int array with one more row and column than the input.
+    """
+    table = numpy.zeros((matrix.shape[0] + 1, matrix.shape[1] + 1), dtype=numpy.int64)
+    numpy.cumsum(numpy.cumsum(matrix, axis=0, dtype=numpy.int64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def box_distances(prefix, width, start, end, min_height, pre_sample_rate, post_sample_rate):
+    """
+    Distance score of every candidate box, from one of the rows in 'start' to one of the rows in 'end'.
+    :param prefix:  1-d int array, prefix[r] is the sum of the first r rows within the section's columns.
+    :param width:   Number of columns of the section.
+    :param start:   1-d int array of first rows j.
+    :param end: 1-d int array of last rows k.
+    :param min_height:  Minimum number of rows of a box.
+    :param pre_sample_rate: Correct rate used before a box starting at the first row.
+    :param post_sample_rate:    Correct rate used after a box ending at the last row.
+    :return:    2-d float array, [j, k] is the score of the box from row start[j] to row end[k], inf if the box is
+    lower than min_height.
+    """
+    length = len(prefix) - 1
+    j = start[:, None]
+    k = end[None, :]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        pre_box_correct_rate = numpy.where(j == 0, pre_sample_rate, prefix[j] / (j * width))
+        post_box_correct_rate = numpy.where(k + 1 == length, post_sample_rate,
+                                            (prefix[length] - prefix[k + 1]) / ((length - k - 1) * width))
+        box_correct_rate = (prefix[k + 1] - prefix[j]) / ((k - j + 1) * width)
+
+    deviation = numpy.abs(box_correct_rate - 0.5)
+    dis = deviation ** 2
+    dis *= 3
+    dis += 2
+    dis -= (pre_box_correct_rate - box_correct_rate) ** 2
+    dis -= (post_box_correct_rate - box_correct_rate) ** 2
+
+    height = (k - j) / (length ** 1.5)
+    dis *= numpy.where(deviation < 0.4, 1 + height, 10 - height)
+    dis[k < j + min_height - 1] = numpy.inf
+    return dis
+
+
+def irregular_box(matrix, block_size=1 << 20):
+    """
+    Search the irregular box of every column section.
+    The columns are split at the (at most 4) largest drops of the item scores, then for each section the rows j..k
+    with the lowest distance score are chosen. All box, pre-box and post-box sums come from a summed-area table, and
+    the scores of all (j, k) pairs are evaluated on a grid, 'block_size' cells at a time.
+    :param matrix:  2-d numpy array, assumed to be cleaned and sorted.
+    :param block_size:  Maximum number of (j, k) pairs evaluated at once.
+    :return:    A list of (col1, col2, (row1, row2)), one for each section.
+    """
+    length, columns = matrix.shape
+    if columns < 2 or length < 4:
+        return []
+    section_qty = min(math.floor(math.sqrt(columns)), 5)
+    min_height = math.ceil(math.sqrt(length))
+    sample_height = math.ceil(math.log(length))
+
+    table = summed_area_table(matrix)
+    item_sum = table[length, 1:] - table[length, :-1]
+    item_diff = item_sum[:-1] - item_sum[1:]
+    # Largest drops first, ties broken by the larger index.
+    selected_col = numpy.lexsort((numpy.arange(len(item_diff)), item_diff))[::-1][:section_qty - 1].tolist()
+    selected_col.append(-1)
+    selected_col.append(columns - 1)
+    selected_col.sort()
+
+    start = numpy.array([0] + list(range(math.ceil(min_height / 2), length)))
+    rows_per_block = max(block_size // length, 1)
+    result = []
+    for i in range(len(selected_col) - 1):
+        col1, col2 = selected_col[i] + 1, selected_col[i + 1]
+        width = col2 - col1 + 1
+        prefix = table[:, col2 + 1] - table[:, col1]
+        pre_box_sample_correct_rate = prefix[min(sample_height, length)] / (sample_height * width)
+        post_box_sample_correct_rate = (prefix[length] - prefix[max(length - sample_height, 0)]) / \
+            (sample_height * width)
+
+        best = 99999999
+        best_j_k = (-1, -1)
+        for block in range(0, len(start), rows_per_block):
+            block_start = start[block:block + rows_per_block]
+            block_end = numpy.arange(block_start[0] + min_height - 1, length)
+            if not len(block_end):
+                break
+            dis = box_distances(prefix, width, block_start, block_end, min_height,
+                                pre_box_sample_correct_rate, post_box_sample_correct_rate)
+            # argmin returns the first minimum in (j, k) order, as the original loops kept the first one found.
+            position = numpy.argmin(dis)
+            if dis.flat[position] < best:
+                best = dis.flat[position]
+                j, k = numpy.unravel_index(position, dis.shape)
+                best_j_k = (int(block_start[j]), int(block_end[k]))
+        result.append((col1, col2, best_j_k))
+    return result
+
+
+def calculate_radius(matrix):
+    """
+    Radius of the neighbourhood used by odd_cells, according to the size of the matrix.
+    :param matrix:  2-d numpy array.
+    :return:    The radius.
+    """
+    return round(math.log(matrix.size) / 2) + 1
+
+
+def diamond_sum(matrix, radius):
+    """
+    Sum of the cells within a diamond (manhattan distance <= radius) around every cell, the cell itself included,
+    cells outside the matrix count as 0.
+    Each row of the diamond is a horizontal window of half-width radius - |dy|, read from row-wise prefix sums, so the
+    cost is one vectorized pass per row of the diamond.
+    :param matrix:  2-d numpy array.
+    :param radius:  Radius of the diamond.
+    :return:    2-d int array with the same shape as the input.
+    """
+    rows, columns = matrix.shape
+    prefix = numpy.zeros((rows, columns + 1), dtype=numpy.int64)
+    numpy.cumsum(matrix, axis=1, dtype=numpy.int64, out=prefix[:, 1:])
+    column = numpy.arange(columns)
+
+    result = numpy.zeros((rows, columns), dtype=numpy.int64)
+    for dy in range(-radius, radius + 1):
+        if abs(dy) >= rows:
+            continue
+        half_width = radius - abs(dy)
+        window = prefix[:, numpy.minimum(column + half_width + 1, columns)] - \
+            prefix[:, numpy.maximum(column - half_width, 0)]
+        # Row i adds the window of row i + dy.
+        if dy >= 0:
+            result[:rows - dy] += window[dy:]
+        else:
+            result[-dy:] += window[:rows + dy]
+    return result
+
+
+def odd_mask(matrix, radius, threshold):
+    """
+    Mark the odd cells of the matrix, see odd_cells.
+    :param matrix:  2-d numpy array, not empty.
+    :param radius:  Radius of the neighbourhood.
+    :param threshold:   Share of disagreeing neighbours above which a cell is odd.
+    :return:    2-d bool array with the same shape as the input.
+    """
+    nonzero = matrix != 0
+    count_ones = diamond_sum(nonzero, radius) - nonzero
+    total_neighbours = diamond_sum(numpy.ones(matrix.shape, dtype=numpy.uint8), radius) - 1
+    count_zeros = total_neighbours - count_ones
+
+    # A cell without any neighbour (1 x 1 matrix) is never odd.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return ((matrix == 0) & (count_ones / total_neighbours > threshold)) | \
+               ((matrix > 0) & (count_zeros / total_neighbours > threshold))
+
+
+def odd_cells(matrix, threshold=0.90):
+    """
+    Find the cells that disagree with almost all of their neighbours: a 0 surrounded by more than 'threshold' non-zero
+    cells, or a non-zero cell surrounded by more than 'threshold' zeros. The neighbours of a cell are the cells within
+    a diamond of radius calculate_radius(matrix), excluding the cell itself.
+    :param matrix:  2-d numpy array.
+    :param threshold:   Share of disagreeing neighbours above which a cell is odd.
+    :return:    A list of (row, column) of odd cells, in row order.
+    """
+    if not matrix.size:
+        return []
+    odd = odd_mask(matrix, calculate_radius(matrix), threshold)
+    return [(int(i), int(j)) for i, j in numpy.argwhere(odd)]
+
+
+def update_odd_cells(matrix, previous_matrix, previous_odd_cells, threshold=0.90):
+    """
+    The result of odd_cells(matrix), reusing its result for a previous matrix of the same shape. Only the cells within
+    the radius of a changed cell can change, they are checked again on a window around each group of changed rows;
+    the window reaches another radius further, so the neighbourhood of every checked cell is inside it.
+    :param matrix:  2-d numpy array.
+    :param previous_matrix: 2-d numpy array, the matrix the previous odd cells were found in.
+    :param previous_odd_cells:  A list of (row, column), odd_cells(previous_matrix, threshold).
+    :param threshold:   Share of disagreeing neighbours above which a cell is odd.
+    :return:    A list of (row, column) of odd cells, in row order.
+    """
+    if previous_matrix is None or previous_odd_cells is None or previous_matrix.shape != matrix.shape or \
+            not matrix.size:
+        return odd_cells(matrix, threshold)
+    rows, columns = matrix.shape
+    radius = calculate_radius(matrix)
+    changed = numpy.argwhere(matrix != previous_matrix)
+    # changed rows further apart than the reach of two windows are checked separately
+    groups = numpy.split(changed, numpy.flatnonzero(numpy.diff(changed[:, 0]) > 4 * radius) + 1) if len(changed) else []
+
+    odd = set((int(i), int(j)) for i, j in previous_odd_cells)
+    checked = 0
+    for group in groups:
+        row1, row2 = group[:, 0].min(), group[:, 0].max()
+        col1, col2 = group[:, 1].min(), group[:, 1].max()
+        top, left = max(row1 - 2 * radius, 0), max(col1 - 2 * radius, 0)
+        window = matrix[top:row2 + 2 * radius + 1, left:col2 + 2 * radius + 1]
+        checked += window.size
+        if checked > matrix.size // 2:
+            return odd_cells(matrix, threshold)
+        window_odd = odd_mask(window, radius, threshold)
+        for i in range(max(row1 - radius, 0), min(row2 + radius + 1, rows)):
+            for j in range(max(col1 - radius, 0), min(col2 + radius + 1, columns)):
+                if window_odd[i - top, j - left]:
+                    odd.add((i, j))
+                else:
+                    odd.discard((i, j))
+    return sorted(odd)
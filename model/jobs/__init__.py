@@ -0,0 +1,524 @@
+'''
+Background processing of uploaded files.
+
+Uploads are handed to a pool of worker processes, so the analysis runs outside the web server and the upload request
+returns as soon as the file is saved. The status of a job can be looked up by its file id with 'get_status(file_id)'.
+It is kept in the upload index, so every process of the web server sees it, and 'recover()' takes over the jobs of a
+process that stopped before they finished.
+The excel file to export is only written when it is downloaded for the first time.
+
+A processed file can be revised with an edited version of its workbook, 'revise(file_id, path)'. The revision keeps
+the file id, and only the analysis near the changed marks is done again, see model.pipeline.
+'''
+
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+
+from ..excel_processing.ExcelOutput import ExcelOutput
+from ..pipeline import Pipeline
+from .. import storage, file_importing, guttman_analysis, metrics, profiling
+
+# part of the cache key of every result, bump it when a change to the analysis changes the results
+PIPELINE_VERSION = '4'
+
+_executor = None
+_lock = threading.Lock()
+# file id: (future, whether the job is a revision), of the unfinished jobs queued by this process
+_jobs = {}
+_recovered = False
+
+
+def process_file(file_id, filename, path, spans=None, previous=None, results_dir=None):
+    """
+    Run the whole analysis of an uploaded file and save the results of both patterns.
+    The excel file to export is built from these results by 'export_file(file_id)' when it is first asked for.
+    :param file_id: id of the uploaded file.
+    :param filename: name of the uploaded file.
+    :param path: path of the saved original file.
+    :param spans: a list to add the spans of every stage to, they are saved with the results.
+    :param previous: the analysis of the previous version of a revised file, see 'previous_result'.
+    :param results_dir: directory to save the results in instead of the upload directory. The file is then not marked
+    as processed, see 'run_revision'.
+    :return: the saved results of both patterns.
+    """
+    start = time.time()
+    spans = spans if spans is not None else []
+    result = Pipeline().run(path, spans, previous)
+    new_data, array, row_totals = result['sheet'], result['matrix'], result['row_totals']
+    irregular_item, corr_item = result['irregular_item'], result['item_performance']
+    content_list = []
+
+    for i in range(len(new_data)):
+        tail = "total" if i == 0 else "" if i == 1 else int(row_totals[i - 2])
+        content_list.append({
+            new_data[i][0]: new_data[i][1:]
+        })
+        content_list[i][new_data[i][0]].append(tail)
+    content_list.append({
+        'total': guttman_analysis.sum_item_score(array)
+    })
+
+    json = {
+        'file_id': file_id,
+        'file_name': filename,
+        'export_url': '/export/' + str(file_id),
+        'irregular_student': [],
+        'irregular_item': [new_data[1][i + 1] for i in irregular_item],
+        'irregular_item_index': irregular_item,
+        'item_performance': corr_item,
+        'boxes': [],
+        'content': content_list,
+        'odd_cells': []
+    }
+    with metrics.span('save_result_0', spans):
+        storage.save_result(json, file_id, 0, results_dir)
+    result_0 = json
+
+    new_data, array, row_totals = result['sheet_1'], result['matrix_1'], result['row_totals_1']
+    irregular_student = result['irregular_student']
+    boxes = result['boxes']
+    boxes_json = []
+    for i in boxes:
+        col1, col2, rows = i
+        row1, row2 = rows
+        boxes_json.append({
+            'row_range': [row1 + 2, row2 + 2],
+            'column_range': [col1 + 1, col2 + 1]
+        })
+
+    content_list = []
+
+    for i in range(len(new_data)):
+        tail = "total" if i == 0 else "" if i == 1 else int(row_totals[i - 2])
+        content_list.append({
+            new_data[i][0]: new_data[i][1:]
+        })
+        content_list[i][new_data[i][0]].append(tail)
+    content_list.append({
+        'total': guttman_analysis.sum_item_score(array)
+    })
+    odd_cells = result['odd_cells']
+    odd_cells_str_tuple = []
+    for (r, c) in odd_cells:
+        odd_cells_str_tuple.append("(%d, %d)" % (c, r + 1))
+
+    json = {
+        'file_id': file_id,
+        'file_name': filename,
+        'export_url': '/export/' + str(file_id),
+        'irregular_student': [new_data[i + 2][0] for i in irregular_student],
+        'irregular_student_index': irregular_student,
+        'student_performance': result['student_performance'],
+        'irregular_item': [],
+        'content': content_list,
+        'boxes': boxes_json,
+        'odd_cells': odd_cells_str_tuple,
+        'odd_cells_index': [[r, c] for (r, c) in odd_cells]
+    }
+    profiling.take_snapshot()
+    with metrics.span('save_result_1', spans):
+        storage.save_result(json, file_id, 1, results_dir)
+    storage.save_metrics(file_id, spans)
+    if results_dir is None:
+        storage.set_processed(file_id, result_0, json)
+    end = time.time()
+    print("took ", end - start, " sec to process.")
+    return result_0, json
+
+
+def content_rows(content):
+    """
+    Rebuild the rows of the analysed data from the 'content' of a saved result.
+    :param content: a list of {row name: row values followed by the row total}, ending with the column totals.
+    :return: the data as a 2d array, with the row names in the first column.
+    """
+    rows = []
+    for row in content[:-1]:
+        for name, values in row.items():
+            rows.append([name] + values[:-1])
+    return rows
+
+
+def previous_result(file_id):
+    """
+    Rebuild the analysis of a processed file from its saved results, as much of it as a revision reuses.
+    Results saved by earlier versions lack some of it, e.g. the student correlations or the index of the odd cells; the
+    stages of what is missing are run in full, see model.pipeline.
+    :param file_id: id of the processed file.
+    :return: a dict of the matrices, correlations and odd cells of both patterns, see Pipeline.run.
+    """
+    result_0, result_1 = storage.get_result(file_id, 0), storage.get_result(file_id, 1)
+    previous = {}
+    if 'content' in result_0:
+        sheet = content_rows(result_0['content'])
+        previous['matrix'] = guttman_analysis.as_matrix(guttman_analysis.clean_input(sheet))
+    if 'item_performance' in result_0:
+        previous['item_performance'] = result_0['item_performance']
+    if 'content' in result_1:
+        sheet = content_rows(result_1['content'])
+        previous['matrix_1'] = guttman_analysis.as_matrix(guttman_analysis.clean_input(sheet))
+    if 'student_performance' in result_1:
+        previous['student_performance'] = result_1['student_performance']
+    if 'odd_cells_index' in result_1:
+        previous['odd_cells'] = [tuple(cell) for cell in result_1['odd_cells_index']]
+    return previous
+
+
+def write_export(mod_path, result_0, result_1, spans=None):
+    """
+    Write the excel file to export, with a sheet for each pattern.
+    :param mod_path: path of the excel file.
+    :param result_0: saved result of the first pattern.
+    :param result_1: saved result of the second pattern.
+    :param spans: a list to add the spans of every step to.
+    :return: null
+    """
+    spans = spans if spans is not None else []
+    excel = ExcelOutput(mod_path, constant_memory=True)
+    with metrics.span('excel.write_excel_0', spans):
+        excel.add_array(content_rows(result_0['content']))
+        excel.write_excel(0)
+    with metrics.span('excel.highlight_items_0', spans):
+        for col in result_0['irregular_item_index']:
+            excel.highlight_area(0, 0, col + 1, col + 1, '#95e1d3', 0)
+    with metrics.span('excel.add_total_score_0', spans):
+        excel.add_total_score(0)
+    with metrics.span('excel.add_correlation_0', spans):
+        excel.add_correlation(result_0['item_performance'], 'column', 0)
+
+    with metrics.span('excel.write_excel_1', spans):
+        excel.add_array(content_rows(result_1['content']))
+        excel.write_excel(1)
+    with metrics.span('excel.highlight_students_1', spans):
+        for row in result_1['irregular_student_index']:
+            excel.highlight_area(row + 2, row + 2, 0, 0, '#f9ed69', 1)
+    with metrics.span('excel.add_total_score_1', spans):
+        excel.add_total_score(1)
+    with metrics.span('excel.add_border_1', spans):
+        for box in result_1['boxes']:
+            row1, row2 = box['row_range']
+            col1, col2 = box['column_range']
+            excel.add_border(row1, row2, col1, col2, 1)
+    with metrics.span('excel.highlight_odd_cells_1', spans):
+        for r, c in result_1['odd_cells_index']:
+            excel.highlight_area(r + 2, r + 2, c + 1, c + 1, '#b063c5', 1)
+    with metrics.span('excel.close_workbook', spans):
+        excel.close_workbook()
+
+
+def export_file(file_id):
+    """
+    Return the excel file to export, it is written from the saved results the first time it is asked for.
+    :param file_id: id of the processed file.
+    :return: the directory and the name of the excel file.
+    """
+    export_path = storage.get_export_path(file_id)
+    if export_path is not None:
+        return export_path
+    result_0 = storage.get_result(file_id, 0)
+    mod_path = storage.get_base_dir(file_id) + 'mod/' + result_0['file_name']
+    # write aside and rename, so a concurrent download never sends a half written file
+    tmp_path = '%s.%d.%d.tmp' % (mod_path, os.getpid(), threading.get_ident())
+    spans = []
+    write_export(tmp_path, result_0, storage.get_result(file_id, 1), spans)
+    os.replace(tmp_path, mod_path)
+    storage.save_metrics(file_id, spans)
+    metrics.observe(spans)
+    storage.set_export_name(file_id, result_0['file_name'])
+    return storage.get_export_path(file_id)
+
+
+def run_job(file_id, filename, path, key, spans, profile=False):
+    """
+    Process a file inside a worker process. A failed job removes the files of its upload, apart from the reports of a
+    profiled job, and records its error in the upload index. The results of a successful job are cached under the
+    given key.
+    :param profile: process the file under the profiler, see model.profiling.
+    :return: a dict with the spans of the job, and the error message if the job failed.
+    """
+    storage.set_status(file_id, 'processing')
+    try:
+        if profile:
+            profiling.run(file_id, process_file, file_id, filename, path, spans)
+        else:
+            process_file(file_id, filename, path, spans)
+    except Exception as e:
+        # the reports of a failed job are what its profile is for, they stay at /profile/<file_id>
+        storage.set_failed(file_id, str(e), keep=['profile'] if profile else [])
+        return {'err_msg': str(e), 'spans': spans}
+    cache_result(key, file_id)
+    return {'spans': spans}
+
+
+def cache_result(key, file_id):
+    """
+    Cache the results of a processed file. The cache only saves work, a failure to write it, e.g. on a full disk, is
+    reported and ignored, and the processed file is kept.
+    :return: null
+    """
+    try:
+        storage.cache_result(key, file_id)
+    except Exception as e:
+        print("could not cache the results of file", file_id, ":", e)
+
+
+def run_revision(file_id, filename, path, key, spans):
+    """
+    Process a revised file inside a worker process, reusing the analysis of its previous version. The results are
+    saved in the revision directory, and only replace the previous ones once the revision is processed. A failed
+    revision only removes the revised file and records its error, the previous results are kept. The results of a
+    successful revision are cached under the given key.
+    :return: a dict with the spans of the job, and the error message if the job failed.
+    """
+    storage.set_status(file_id, 'processing')
+    try:
+        result_0, result_1 = process_file(file_id, filename, path, spans, previous_result(file_id),
+                                          storage.get_revision_dir(file_id))
+        storage.keep_revision(file_id, result_0, result_1)
+    except Exception as e:
+        storage.discard_revision(file_id)
+        storage.set_status(file_id, 'error', str(e))
+        return {'err_msg': str(e), 'spans': spans}
+    cache_result(key, file_id)
+    return {'spans': spans}
+
+
+def finish_job(file_id, revision, future):
+    """
+    Called in the web server once a job finished. Records the error of a job that crashed, drops the job, and adds the
+    spans of the job to the metrics of the web server.
+    """
+    if future.cancelled() or future.exception() is not None:
+        record_crash(file_id, revision, future)
+        drop_job(file_id, future)
+        metrics.observe([], 'error')
+        return
+    drop_job(file_id, future)
+    result = future.result()
+    metrics.observe(result['spans'], 'error' if 'err_msg' in result else 'done')
+
+
+def drop_job(file_id, future):
+    """
+    Forget a finished job, its status is in the upload index. A newer job of the same file is kept.
+    """
+    with _lock:
+        if file_id in _jobs and _jobs[file_id][0] is future:
+            del _jobs[file_id]
+
+
+def record_crash(file_id, revision, future):
+    """
+    Record the error of a job that crashed, e.g. its worker was killed for running out of memory, so the job could not
+    record it itself. A crashed upload is removed, a crashed revision only removes the revised file.
+    :param revision: the job is a revision.
+    :param future: the future of the job, cancelled or finished with an exception.
+    :return: null
+    """
+    job = storage.get_job(file_id)
+    if job is None or job['status'] not in ['queued', 'processing']:
+        # already recorded, or the file was deleted
+        return
+    err_msg = 'The job was cancelled.' if future.cancelled() else str(future.exception())
+    if revision:
+        storage.discard_revision(file_id)
+        storage.set_status(file_id, 'error', err_msg)
+    else:
+        storage.set_failed(file_id, err_msg)
+
+
+def get_executor(broken=None):
+    """
+    Return the worker pool, a new pool is started the first time or when the given pool is broken.
+    :param broken: a pool that failed to take a job.
+    :return: the worker pool.
+    """
+    global _executor
+    with _lock:
+        if _executor is None or _executor is broken:
+            _executor = ProcessPoolExecutor()
+        return _executor
+
+
+def submit(file_id, filename, path, spans=None, profile=False):
+    """
+    Queue a saved upload for processing. A file identical to an earlier upload gets the cached results of that
+    upload, and is not queued at all, unless it is to be profiled. Other files are validated before they are queued,
+    a badly formatted file raises its error at once.
+    :param file_id: id of the uploaded file.
+    :param spans: spans already recorded for the upload, e.g. of saving the file.
+    :param profile: process the file under the profiler, see model.profiling.
+    :return: null
+    """
+    spans = spans if spans is not None else []
+    with metrics.span('cache_lookup', spans):
+        key = PIPELINE_VERSION + '-' + storage.file_hash(path)
+        restored = not profile and storage.restore_result(key, file_id, filename)
+    if restored:
+        storage.save_metrics(file_id, spans)
+        metrics.observe(spans, 'done')
+        return
+    with metrics.span('validate', spans):
+        file_importing.validate(path)
+    queue(file_id, run_job, (file_id, filename, path, key, spans, profile))
+
+
+def revise(file_id, path, spans=None):
+    """
+    Queue a revised version of a processed file. It keeps the id and the name of the file, and its results are
+    replaced once the revision is processed. A revision identical to an earlier upload gets the cached results of that
+    upload. Other revisions are validated before they are queued, a badly formatted file raises its error at once and
+    the previous results are kept.
+    :param file_id: id of the processed file.
+    :param path: path of the saved revision, see storage.make_revision_path.
+    :param spans: spans already recorded for the upload, e.g. of saving the file.
+    :return: null
+    """
+    spans = spans if spans is not None else []
+    filename = storage.get_summary(file_id)['file_name']
+    with metrics.span('cache_lookup', spans):
+        key = PIPELINE_VERSION + '-' + storage.file_hash(path)
+        # restored aside, the previous results are only replaced once all of the cached ones are saved
+        restored = storage.restore_result(key, file_id, filename, storage.get_revision_dir(file_id))
+    if restored:
+        storage.keep_revision(file_id, *restored)
+        storage.save_metrics(file_id, spans)
+        metrics.observe(spans, 'done')
+        return
+    with metrics.span('validate', spans):
+        file_importing.validate(path)
+    # recorded before the job starts, the worker marks it 'processing'
+    storage.set_status(file_id, 'queued', owner=os.getpid())
+    try:
+        queue(file_id, run_revision, (file_id, filename, path, key, spans), revision=True)
+    except Exception:
+        storage.set_status(file_id, 'done')
+        raise
+
+
+def queue(file_id, function, args, revision=False):
+    """
+    Run a job of a file in the worker pool.
+    :param file_id: id of the file, the status of the job is looked up with it.
+    :param function: the job, called in a worker process.
+    :param args: the arguments of the job.
+    :param revision: the job is a revision, a crash only removes the revised file.
+    :return: null
+    """
+    executor = get_executor()
+    try:
+        future = executor.submit(function, *args)
+    except BrokenProcessPool:
+        # a worker died, e.g. killed for running out of memory
+        future = get_executor(executor).submit(function, *args)
+    with _lock:
+        _jobs[file_id] = (future, revision)
+    future.add_done_callback(functools.partial(finish_job, file_id, revision))
+
+
+def get_status(file_id):
+    """
+    Return the status of a job: 'queued', 'processing', 'done' or 'error'.
+    The status is read from the upload index, so it is the same in every process of the web server and survives a
+    restart. A failed revision is reported as an error once, the file is 'done' with its previous results afterwards.
+    :param file_id: id of the uploaded file.
+    :return: a dict with the status, and the error message or the file details once the job finished.
+    """
+    job = storage.get_job(file_id)
+    if job is None:
+        return {'file_id': file_id, 'status': 'error', 'err_msg': 'No such file'}
+    if job['status'] in ['queued', 'processing']:
+        return {'file_id': file_id, 'status': job['status']}
+    if job['status'] == 'error':
+        if job['summary'] is not None:
+            storage.set_status(file_id, 'done')
+        return {'file_id': file_id, 'status': 'error', 'err_msg': job['err_msg']}
+    return {
+        'file_id': file_id,
+        'status': 'done',
+        'file_name': job['summary']['file_name'],
+        'export_url': job['summary']['export_url']
+    }
+
+
+def wait(file_ids):
+    """
+    Wait for the jobs this process queued for several files to finish. The status of the other files, e.g. finished
+    already, is read from the upload index.
+    :param file_ids: ids of the uploaded files.
+    :return: a list with the status of every job.
+    """
+    with _lock:
+        jobs = [(file_id,) + _jobs[file_id] for file_id in file_ids if file_id in _jobs]
+    wait_futures([future for file_id, future, revision in jobs])
+    for file_id, future, revision in jobs:
+        # the done callback of the job may not have run yet
+        if future.cancelled() or future.exception() is not None:
+            record_crash(file_id, revision, future)
+        drop_job(file_id, future)
+    return [get_status(file_id) for file_id in file_ids]
+
+
+def is_pending(file_id):
+    job = storage.get_job(file_id)
+    return job is not None and job['status'] in ['queued', 'processing']
+
+
+def forget(file_id):
+    with _lock:
+        _jobs.pop(file_id, None)
+
+
+def recover():
+    """
+    Take over the jobs left unfinished by web server processes that are gone, e.g. after a restart of the server. It
+    runs once in every process, and only one process takes over each job. An upload is queued again, without its
+    profile. A revision is reported as failed, and the file keeps its previous results.
+    :return: null
+    """
+    global _recovered
+    with _lock:
+        if _recovered:
+            return
+        # listed before any other request of this process queues a job
+        unfinished = [job for job in storage.get_unfinished_jobs()
+                      if job['file_id'] not in _jobs or _jobs[job['file_id']][0].done()]
+        _recovered = True
+    for job in unfinished:
+        file_id, owner = job['file_id'], job['owner']
+        # a job with the pid of this process is left from an earlier run with the same pid
+        if owner != os.getpid() and is_alive(owner):
+            continue
+        if not storage.claim_job(file_id, owner, os.getpid()):
+            continue
+        if job['processed']:
+            storage.discard_revision(file_id)
+            storage.set_status(file_id, 'error', 'The server stopped before the revision was processed.')
+            continue
+        print("queueing file", file_id, "again, its server process stopped")
+        try:
+            submit(file_id, job['file_name'], storage.get_base_dir(file_id) + 'ori/' + job['file_name'])
+        except Exception as e:
+            storage.set_failed(file_id, str(e))
+
+
+def is_alive(pid):
+    """
+    Whether the process with the given pid is running. On Windows a process can not be looked up with signal 0, every
+    other process counts as stopped there.
+    """
+    if pid is None:
+        return False
+    if os.name != 'posix':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
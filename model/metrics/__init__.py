@@ -0,0 +1,186 @@
+'''
+Spans timing the stages of the analysis, and their totals in the Prometheus text format.
+
+A span records the wall time, the CPU time of its thread, and the peak resident memory of the process when it ends:
+
+    spans = []
+    with span('sort', spans):
+        ...
+
+Spans are plain dicts, so they can be returned from a worker process and saved with the result. The web server adds
+the spans of every job and export to the totals with 'observe(spans)', and serves them with 'prometheus_text()'.
+With TRACE_MEMORY on, a span also records the peak of the memory allocated while it was open, traced by tracemalloc
+while any span is open. It covers the allocations of all threads.
+'''
+
+import contextlib
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# trace the memory allocated in spans, it makes list heavy stages such as sorting several times slower
+TRACE_MEMORY = False
+# upper bounds of the buckets of the wall time histogram, in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_local = threading.local()
+_tracing = 0
+_started = False
+_totals = {}
+_jobs = {}
+
+
+def max_rss():
+    """
+    Return the peak resident memory of the process in bytes, None where it is not known.
+    """
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def start_tracing():
+    global _tracing, _started
+    with _lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started = True
+        _tracing += 1
+
+
+def stop_tracing():
+    global _tracing, _started
+    with _lock:
+        _tracing -= 1
+        # tracing started by someone else, e.g. a profiled job, is left on
+        if _tracing == 0 and _started:
+            tracemalloc.stop()
+            _started = False
+
+
+@contextlib.contextmanager
+def span(name, spans):
+    """
+    Time a block of code. With TRACE_MEMORY on, the memory peaks of spans opened inside it count towards its own.
+    :param name: name of the stage.
+    :param spans: a list the span is appended to when the block ends, even if it raised.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    trace = TRACE_MEMORY
+    if trace:
+        if not stack:
+            start_tracing()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    frame = {'memory': memory if trace else 0, 'peak': 0}
+    stack.append(frame)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        record = {
+            'stage': name,
+            'wall': time.perf_counter() - wall,
+            'cpu': time.thread_time() - cpu,
+            'max_rss': max_rss(),
+            'peak': None
+        }
+        stack.pop()
+        if trace:
+            peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            record['peak'] = max(peak - frame['memory'], 0)
+            if stack:
+                # the peak was reset for this span, hand it on to the enclosing one
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+                tracemalloc.reset_peak()
+            else:
+                stop_tracing()
+        spans.append(record)
+
+
+def observe(spans, status=None):
+    """
+    Add spans to the totals served as metrics.
+    :param spans: spans recorded by 'span'.
+    :param status: status of the job that recorded them, 'done' or 'error', None for other spans.
+    :return: null
+    """
+    with _lock:
+        for record in spans:
+            totals = _totals.get(record['stage'])
+            if totals is None:
+                totals = _totals[record['stage']] = {
+                    'count': 0, 'wall': 0.0, 'cpu': 0.0, 'max_rss': None, 'peak': None, 'buckets': [0] * len(BUCKETS)
+                }
+            totals['count'] += 1
+            totals['wall'] += record['wall']
+            totals['cpu'] += record['cpu']
+            for key in ['max_rss', 'peak']:
+                if record.get(key) is not None:
+                    totals[key] = max(totals[key] or 0, record[key])
+            for i, bound in enumerate(BUCKETS):
+                if record['wall'] <= bound:
+                    totals['buckets'][i] += 1
+        if status is not None:
+            _jobs[status] = _jobs.get(status, 0) + 1
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+        _jobs.clear()
+
+
+def prometheus_text():
+    """
+    Return the totals of the observed spans in the Prometheus text format.
+    """
+    with _lock:
+        totals = {stage: dict(values, buckets=list(values['buckets'])) for stage, values in _totals.items()}
+        jobs = dict(_jobs)
+    lines = [
+        '# HELP analysis_jobs_total Analysis jobs finished, by status.',
+        '# TYPE analysis_jobs_total counter'
+    ]
+    for status, count in sorted(jobs.items()):
+        lines.append('analysis_jobs_total{status="%s"} %d' % (status, count))
+    lines += [
+        '# HELP analysis_stage_seconds Wall time of the stages of the analysis.',
+        '# TYPE analysis_stage_seconds histogram'
+    ]
+    for stage, values in sorted(totals.items()):
+        for bound, count in zip(BUCKETS, values['buckets']):
+            lines.append('analysis_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, count))
+        lines.append('analysis_stage_seconds_bucket{stage="%s",le="+Inf"} %d' % (stage, values['count']))
+        lines.append('analysis_stage_seconds_sum{stage="%s"} %r' % (stage, values['wall']))
+        lines.append('analysis_stage_seconds_count{stage="%s"} %d' % (stage, values['count']))
+    lines += [
+        '# HELP analysis_stage_cpu_seconds_total CPU time of the stages of the analysis.',
+        '# TYPE analysis_stage_cpu_seconds_total counter'
+    ]
+    for stage, values in sorted(totals.items()):
+        lines.append('analysis_stage_cpu_seconds_total{stage="%s"} %r' % (stage, values['cpu']))
+    lines += [
+        '# HELP analysis_stage_max_rss_bytes Largest peak resident memory of a process at the end of a stage.',
+        '# TYPE analysis_stage_max_rss_bytes gauge'
+    ]
+    for stage, values in sorted(totals.items()):
+        if values['max_rss'] is not None:
+            lines.append('analysis_stage_max_rss_bytes{stage="%s"} %d' % (stage, values['max_rss']))
+    lines += [
+        '# HELP analysis_stage_peak_bytes Largest peak of memory allocated in a stage of the analysis.',
+        '# TYPE analysis_stage_peak_bytes gauge'
+    ]
+    for stage, values in sorted(totals.items()):
+        if values['peak'] is not None:
+            lines.append('analysis_stage_peak_bytes{stage="%s"} %d' % (stage, values['peak']))
+    return '\n'.join(lines) + '\n'
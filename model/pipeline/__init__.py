@@ -0,0 +1,209 @@
+'''
+The analysis of a mark sheet as a pipeline of stages, usable without the web server.
+
+A Pipeline runs its stages in order on a dict holding the state of one analysis. Every stage is a function that takes
+the state and adds its outputs to it, so a stage can be swapped for another function or skipped by name, and every
+stage is timed on its own. The state is returned as the result:
+
+    result = Pipeline().run('testdata/SampleAssessmentResult.xlsx')
+    result['irregular_item'], result['timings']['analyse_items']
+
+The source is the path of a workbook, a sheet that is already broken down into sub-criteria (a 2d array with two header
+rows and one student id column, as made by file_importing.break_down_marks), or a 2d numpy array of 0/1 marks.
+
+Keys of the result:
+    sheet, matrix:          the sorted sheet and its marks, for the first pattern
+    row_totals:             total mark of every row of the matrix
+    irregular_item:         column indexes of the irregular items in the matrix
+    item_performance:       correlation of every item
+    sheet_1, matrix_1, row_totals_1:
+                            the same for the second pattern, which leaves out the irregular items
+    irregular_student:      row indexes of the irregular students in matrix_1
+    student_performance:    correlation of every student of matrix_1
+    boxes:                  irregular boxes in matrix_1, as (first column, last column, (first row, last row))
+    odd_cells:              (row, column) of the odd cells in matrix_1
+    timings:                seconds taken by every stage that ran
+    spans:                  wall time, CPU time and peak memory of every stage that ran, see model.metrics
+
+A workbook that was edited can be analysed again with the result of its previous version, 'run(source, previous=old)'.
+The correlations are then only calculated again near the students and items whose marks changed, and the odd cells
+only near the changed cells; the result is the same as a full analysis. Reading, sorting and the irregular boxes,
+which depend on the whole sheet, always run in full. Only these keys of the previous result are used, a missing one
+makes its stage run in full: matrix, item_performance, matrix_1, student_performance and odd_cells.
+'''
+
+import numpy
+
+from .. import file_importing, guttman_analysis, metrics
+
+
+def read(state):
+    """
+    Read both worksheets of the workbook, when the source is a path.
+    """
+    if 'path' in state:
+        state['data'], state['index'] = file_importing.readfile(state['path'])
+
+
+def transpose(state):
+    """
+    Turn the marks of the first worksheet into one row per student, when the source is a path.
+    """
+    if 'data' in state:
+        state['data'] = file_importing.transpose(state['data'])
+
+
+def break_down(state):
+    """
+    Break the marks of the tasks down into 0/1 marks of their sub-criteria, when the source is a path.
+    """
+    if 'data' in state:
+        state['sheet'] = file_importing.break_down_marks(state['data'], state['index'])
+
+
+def sort(state):
+    """
+    Sort the students and the items by their total marks, and convert the marks into a matrix.
+    """
+    file_importing.sort_2d_array_mark(state['sheet'])
+    state['matrix'] = guttman_analysis.as_matrix(guttman_analysis.clean_input(state['sheet']))
+    state['row_totals'] = state['matrix'].sum(axis=1, dtype=numpy.int64)
+
+
+def analyse_items(state):
+    """
+    Find the irregular items and the correlation of every item.
+    """
+    previous = state['previous']
+    state['item_performance'] = guttman_analysis.update_correlation(
+        state['matrix'], False, state['flag'], previous.get('matrix'), previous.get('item_performance'))
+    state['irregular_item'] = guttman_analysis.detect_item_irregular(state['item_performance'], state['matrix'].T)
+
+
+def remove_items(state):
+    """
+    Leave the irregular items out for the second pattern. They are masked out of the sorted matrix and what is left is
+    reordered, the totals only lose the marks of the removed items.
+    """
+    matrix, sheet = state['matrix'], state['sheet']
+    keep = numpy.ones(matrix.shape[1], dtype=bool)
+    keep[state.get('irregular_item', [])] = False
+    row_totals = state['row_totals'] - matrix[:, ~keep].sum(axis=1, dtype=numpy.int64)
+    matrix = matrix[:, keep]
+    student_order, task_order = file_importing.marks_order(matrix, row_totals)
+    state['matrix_1'] = matrix[student_order][:, task_order]
+    state['row_totals_1'] = row_totals[student_order]
+    column_order = [0] + (numpy.flatnonzero(keep)[task_order] + 1).tolist()
+    state['sheet_1'] = [[row[j] for j in column_order] for row in sheet[:2]] + \
+                       [[sheet[i + 2][0]] + marks for i, marks in zip(student_order.tolist(), state['matrix_1'].tolist())]
+
+
+def analyse_students(state):
+    """
+    Find the irregular students of the second pattern, and the correlation of every student.
+    """
+    previous = state['previous']
+    state['student_performance'] = guttman_analysis.update_correlation(
+        state['matrix_1'], True, state['flag'], previous.get('matrix_1'), previous.get('student_performance'))
+    state['irregular_student'] = guttman_analysis.detect_item_irregular(state['student_performance'], state['matrix_1'])
+
+
+def find_boxes(state):
+    """
+    Find the irregular boxes of the second pattern.
+    """
+    state['boxes'] = guttman_analysis.irregular_box(state['matrix_1'])
+
+
+def find_odd_cells(state):
+    """
+    Find the odd cells of the second pattern.
+    """
+    previous = state['previous']
+    state['odd_cells'] = guttman_analysis.update_odd_cells(
+        state['matrix_1'], previous.get('matrix_1'), previous.get('odd_cells'))
+
+
+STAGES = [
+    ('read', read),
+    ('transpose', transpose),
+    ('break_down', break_down),
+    ('sort', sort),
+    ('analyse_items', analyse_items),
+    ('remove_items', remove_items),
+    ('analyse_students', analyse_students),
+    ('find_boxes', find_boxes),
+    ('find_odd_cells', find_odd_cells)
+]
+
+
+def named_sheet(matrix):
+    """
+    Add header rows and student ids to a matrix of marks, numbering the items and the students from 1.
+    :param matrix: a 2d array of marks.
+    :return: the sheet as a 2d array.
+    """
+    matrix = numpy.asarray(matrix)
+    names = [str(j + 1) for j in range(matrix.shape[1])]
+    return [[''] + names, ['student_id'] + names] + \
+           [[str(i + 1)] + row for i, row in enumerate(matrix.tolist())]
+
+
+class Pipeline:
+    """
+    Run the stages of the analysis in order, timing each of them.
+    :param flag: how the irregular items and students are scored: 'Accumulation', 'Correlation' or 'Similarity'.
+    :param skip: names of the stages not to run.
+    :param stages: functions to run instead of the stages with the same names.
+    """
+
+    def __init__(self, flag='Accumulation', skip=(), stages=None):
+        self.flag = flag
+        self.skip = set(skip)
+        self.stages = list(STAGES)
+        for name, function in (stages or {}).items():
+            self.replace(name, function)
+        for name in self.skip:
+            self.index(name)
+
+    def index(self, name):
+        """
+        Return the position of a stage, raise an exception for an unknown name.
+        """
+        for i, (stage, function) in enumerate(self.stages):
+            if stage == name:
+                return i
+        raise Exception("Unknown stage '%s'." % name)
+
+    def replace(self, name, function):
+        """
+        Run the given function instead of a stage.
+        :param name: name of the stage.
+        :param function: a function that takes the state of the analysis.
+        :return: null
+        """
+        self.stages[self.index(name)] = (name, function)
+
+    def run(self, source, spans=None, previous=None):
+        """
+        Analyse a mark sheet.
+        :param source: path of a workbook, a broken down sheet, or a 2d numpy array of marks.
+        :param spans: a list to add the spans of the stages to, as they finish.
+        :param previous: the result of the analysis of a previous version of the sheet, with the same flag.
+        :return: the state of the analysis, as a dict.
+        """
+        state = {'flag': self.flag, 'timings': {}, 'spans': spans if spans is not None else [],
+                 'previous': previous or {}}
+        if isinstance(source, str):
+            state['path'] = source
+        elif isinstance(source, numpy.ndarray):
+            state['sheet'] = named_sheet(source)
+        else:
+            state['sheet'] = [list(row) for row in source]
+        for name, function in self.stages:
+            if name in self.skip:
+                continue
+            with metrics.span(name, state['spans']):
+                function(state)
+            state['timings'][name] = state['spans'][-1]['wall']
+        return state
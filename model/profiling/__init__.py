@@ -0,0 +1,103 @@
+'''
+Profiling of a single upload.
+
+An upload posted with 'profile=1' is processed under cProfile and tracemalloc, and the reports are saved in
+upload/<id>/profile/:
+
+    profile.pstats      the cProfile stats, to load with pstats or snakeviz
+    profile.txt         the functions taking the most time, by cumulative and by internal time
+    allocations.txt     the peak of the traced memory, and the lines holding the most memory once the analysis is done
+
+Nothing here runs for the other uploads, 'take_snapshot' returns at once when no profiled job is running.
+'''
+
+import cProfile
+import os
+import pstats
+import tracemalloc
+
+from .. import storage
+
+# number of functions and of allocating lines in the reports
+TOP = 50
+# frames kept for every traced allocation, and number of tracebacks in the report
+FRAMES = 10
+TRACEBACKS = 10
+REPORTS = ['profile.pstats', 'profile.txt', 'allocations.txt']
+
+_profiling = False
+_snapshot = None
+
+
+def get_profile_dir(file_id):
+    return storage.get_base_dir(file_id) + 'profile/'
+
+
+def get_reports(file_id):
+    """
+    Return the names of the reports saved for a file, empty if it was not profiled or its job is not finished.
+    """
+    return [name for name in REPORTS if os.path.exists(get_profile_dir(file_id) + name)]
+
+
+def take_snapshot():
+    """
+    Keep a snapshot of the traced memory of a profiled job, call it while the data of the analysis is still held.
+    :return: null
+    """
+    global _snapshot
+    if _profiling:
+        _snapshot = tracemalloc.take_snapshot()
+
+
+def run(file_id, function, *args):
+    """
+    Call a function under cProfile and tracemalloc, and save the reports for a file. The reports are saved even if the
+    function raised.
+    :param file_id: id of the profiled file.
+    :param function: the function to profile, called with the other arguments.
+    :return: what the function returned.
+    """
+    global _profiling, _snapshot
+    profiler = cProfile.Profile()
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(FRAMES)
+    _profiling, _snapshot = True, None
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        snapshot = _snapshot if _snapshot is not None else tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started:
+            tracemalloc.stop()
+        _profiling, _snapshot = False, None
+        write_reports(get_profile_dir(file_id), profiler, snapshot, peak)
+
+
+def write_reports(profile_dir, profiler, snapshot, peak):
+    """
+    Save the cProfile stats and the memory snapshot of a profiled job.
+    :param profile_dir: directory to save the reports in.
+    :param profiler: the cProfile.Profile that ran the job.
+    :param snapshot: a tracemalloc snapshot.
+    :param peak: peak of the traced memory in bytes.
+    :return: null
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.dump_stats(profile_dir + 'profile.pstats')
+    with open(profile_dir + 'profile.txt', 'w') as file:
+        stats = pstats.Stats(profiler, stream=file)
+        stats.sort_stats('cumulative').print_stats(TOP)
+        stats.sort_stats('tottime').print_stats(TOP)
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    with open(profile_dir + 'allocations.txt', 'w') as file:
+        file.write('peak of the traced memory: %d bytes\n\n' % peak)
+        file.write('top %d lines by memory held once the analysis is done:\n' % TOP)
+        for statistic in snapshot.statistics('lineno')[:TOP]:
+            file.write(str(statistic) + '\n')
+        file.write('\ntop %d tracebacks:\n' % TRACEBACKS)
+        for statistic in snapshot.statistics('traceback')[:TRACEBACKS]:
+            file.write('%s\n' % statistic)
+            for line in statistic.traceback.format():
+                file.write(line + '\n')
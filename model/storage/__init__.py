@@ -1,16 +1,307 @@
 import os
 import shutil
 import json
+import hashlib
+import sqlite3
+import time
+import contextlib
+import gzip
+import threading
+import collections
+import numpy
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# results of processed files, keyed by the content hash of the uploaded file
+CACHE_DIR = 'cache/'
+# the least recently used entries are evicted once the cache grows over this many bytes
+CACHE_LIMIT = 256 * 1024 * 1024
+
+# loaded results kept in memory by each process, in bytes
+RESULT_CACHE_LIMIT = 64 * 1024 * 1024
+# files of a saved result, after 'result_<pattern id>'
+RESULT_FILES = ['.json', '.npy', '.json.gz', '.json.br']
+
+# limits of a zip archive posted to the batch upload: number of members, and uncompressed bytes of its excel files
+ZIP_MAX_MEMBERS = 1000
+ZIP_MAX_SIZE = 512 * 1024 * 1024
+
+# index of the uploads, kept next to them so it is removed together with the upload directory
+INDEX_PATH = 'upload/index.sqlite3'
+# version of the index, see migrate_index
+INDEX_VERSION = 2
+# status is the one of the last job of the file: 'queued', 'processing', 'done' or 'error', see model.jobs. owner is
+# the pid of the web server process that queued the job, the job is lost with that process.
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS uploads (
+    file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    export_name TEXT,
+    summary TEXT,
+    err_msg TEXT,
+    owner INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_status ON uploads (status, file_id);
+'''
 
 if not os.path.exists('upload/'):
     os.mkdir('upload/')
+if not os.path.exists(CACHE_DIR):
+    os.mkdir(CACHE_DIR)
+
+
+class LRUCache:
+    """
+    A thread safe cache that drops the least recently used values once their total size is over a limit in bytes.
+    Every value is stored with a version, such as the modification time of its file, and a get for another version
+    is a miss.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.values = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.values.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value, size):
+        with self.lock:
+            self.remove(key)
+            if size > self.limit:
+                return
+            self.values[key] = (version, value, size)
+            self.size += size
+            while self.size > self.limit:
+                self.remove(next(iter(self.values)))
+
+    def remove(self, key):
+        entry = self.values.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def invalidate(self, prefix):
+        """
+        Drop every value whose key starts with the prefix.
+        """
+        with self.lock:
+            for key in [key for key in self.values if key.startswith(prefix)]:
+                self.remove(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.values),
+                'bytes': self.size,
+                'limit': self.limit
+            }
+
+
+result_cache = LRUCache(RESULT_CACHE_LIMIT)
+_metrics_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def open_index():
+    """
+    Open the upload index in a transaction. The tables are created if they do not exist yet, and the first time the
+    index is opened the upload directories are imported into it.
+    :return: a sqlite3 connection.
+    """
+    connection = sqlite3.connect(INDEX_PATH, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        # every statement of the schema is IF NOT EXISTS, another process may have just created the file
+        connection.executescript(INDEX_SCHEMA)
+        if index_version(connection) < INDEX_VERSION:
+            with connection:
+                # one process at a time migrates, the others see its version once it committed
+                connection.execute('BEGIN IMMEDIATE')
+                migrate_index(connection, index_version(connection))
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def index_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate_index(connection, version):
+    """
+    Bring the upload index up to INDEX_VERSION, inside the transaction of the caller.
+    Version 1 holds the upload directories written before the index existed, version 2 adds the error message and
+    the owner of a job.
+    :param connection: connection to the upload index.
+    :param version: the current version of the index, 0 for a new index.
+    :return: null
+    """
+    if version < 1:
+        import_upload_dirs(connection)
+    if version < 2:
+        # a new index is created with them
+        columns = [row['name'] for row in connection.execute('PRAGMA table_info(uploads)')]
+        for column, column_type in [('err_msg', 'TEXT'), ('owner', 'INTEGER')]:
+            if column not in columns:
+                connection.execute('ALTER TABLE uploads ADD COLUMN %s %s' % (column, column_type))
+    connection.execute('PRAGMA user_version = %d' % INDEX_VERSION)
+
+
+def import_upload_dirs(connection):
+    """
+    Add the upload directories written before the index existed to the index.
+    :param connection: connection to the upload index.
+    :return: null
+    """
+    for file_id in os.listdir('upload/'):
+        base_dir = get_base_dir(file_id)
+        if not file_id.isnumeric() or not os.path.isdir(base_dir + 'ori/'):
+            continue
+        names = [file for file in os.listdir(base_dir + 'ori/') if file.endswith(".xls") or file.endswith(".xlsx")]
+        exports = [file for file in os.listdir(base_dir + 'mod/') if file.endswith(".xls") or file.endswith(".xlsx")]
+        status = 'done' if os.path.exists(base_dir + 'result_1.json') else 'queued'
+        summary = None
+        if status == 'done':
+            summary = json.dumps(result_summary(get_result(file_id, 0), get_result(file_id, 1)))
+        modified = os.path.getmtime(base_dir)
+        connection.execute('''INSERT OR IGNORE INTO uploads (file_id, file_name, status, export_name, summary, created, updated)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           (int(file_id), names[0] if names else '', status, exports[0] if exports else None, summary,
+                            modified, modified))
+
+
+def result_summary(result_0, result_1):
+    """
+    Return the fields of a processed file that are listed without loading its results.
+    :param result_0: saved result of the first pattern.
+    :param result_1: saved result of the second pattern.
+    :return: a dict with the file id, name, export url and the size of the analysis.
+    """
+    return {
+        'file_id': result_0['file_id'],
+        'file_name': result_0['file_name'],
+        'export_url': result_0['export_url'],
+        'students': len(result_0['content']) - 3,
+        'items': len(result_0['item_performance']),
+        'irregular_items': len(result_0['irregular_item']),
+        'irregular_students': len(result_1['irregular_student'])
+    }
+
+
+def set_processed(file_id, result_0, result_1):
+    """
+    Mark a file as processed, once both of its results are saved.
+    :return: null
+    """
+    with open_index() as connection:
+        connection.execute('''UPDATE uploads SET status = 'done', summary = ?, err_msg = NULL, updated = ?
+                              WHERE file_id = ?''',
+                           (json.dumps(result_summary(result_0, result_1)), time.time(), file_id))
+
+
+def set_export_name(file_id, name):
+    with open_index() as connection:
+        connection.execute("UPDATE uploads SET export_name = ?, updated = ? WHERE file_id = ?",
+                           (name, time.time(), file_id))
+
+
+def get_summary(file_id):
+    """
+    Return the summary of a processed file, None if the file is not processed. A file being revised keeps the summary
+    of its previous results.
+    """
+    with open_index() as connection:
+        row = connection.execute("SELECT summary FROM uploads WHERE file_id = ? AND summary IS NOT NULL",
+                                 (file_id,)).fetchone()
+    return None if row is None else json.loads(row['summary'])
+
+
+def get_job(file_id):
+    """
+    Return the index entry of a file, None for an unknown file.
+    :return: a dict with the file name, the status and error message of its last job, the owner of the job and the
+    summary, None if the file was never processed.
+    """
+    with open_index() as connection:
+        row = connection.execute("SELECT file_name, status, err_msg, owner, summary FROM uploads WHERE file_id = ?",
+                                 (file_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['summary'] = None if row['summary'] is None else json.loads(row['summary'])
+    return job
+
+
+def set_status(file_id, status, err_msg=None, owner=None):
+    """
+    Record the status of the job of a file: 'queued', 'processing', 'done' or 'error'. A file is only marked 'done'
+    this way when it keeps its previous results, see set_processed.
+    :param err_msg: the error message of a failed job.
+    :param owner: pid of the web server process that queued the job, the owner is kept if None.
+    :return: null
+    """
+    with open_index() as connection:
+        connection.execute('''UPDATE uploads SET status = ?, err_msg = ?, owner = COALESCE(?, owner), updated = ?
+                              WHERE file_id = ?''', (status, err_msg, owner, time.time(), file_id))
+
+
+def set_failed(file_id, err_msg, keep=()):
+    """
+    Record that the job of a new upload failed. The files of the upload are removed, and its index entry is kept with
+    the error message, so the error is reported by every process until the file is deleted.
+    :param keep: names of sub directories of the upload to leave on disk, e.g. the profile of the job.
+    :return: null
+    """
+    remove_upload_files(file_id, keep)
+    set_status(file_id, 'error', err_msg)
+
+
+def get_unfinished_jobs():
+    """
+    List the files whose last job is still 'queued' or 'processing'.
+    :return: a list of dicts with the file id, file name, owner and whether the file has earlier results.
+    """
+    with open_index() as connection:
+        rows = connection.execute('''SELECT file_id, file_name, owner, summary IS NOT NULL AS processed FROM uploads
+                                     WHERE status IN ('queued', 'processing') ORDER BY file_id''').fetchall()
+    return [dict(row) for row in rows]
+
+
+def claim_job(file_id, owner, new_owner):
+    """
+    Take over the unfinished job of a file from its owner, only one process succeeds.
+    :return: whether the job was taken over.
+    """
+    with open_index() as connection:
+        return connection.execute('''UPDATE uploads SET owner = ?, updated = ? WHERE file_id = ? AND owner IS ?
+                                     AND status IN ('queued', 'processing')''',
+                                  (new_owner, time.time(), file_id, owner)).rowcount == 1
 
 
 def get_export_path(file_id):
-    file_dir = get_base_dir(file_id) + 'mod/'
-    for file in os.listdir(file_dir):
-        if file.endswith(".xls") or file.endswith(".xlsx"):
-            return file_dir, file
+    with open_index() as connection:
+        row = connection.execute("SELECT export_name FROM uploads WHERE file_id = ?", (file_id,)).fetchone()
+    if row is not None and row['export_name'] is not None:
+        return get_base_dir(file_id) + 'mod/', row['export_name']
 
 
 def get_base_dir(file_id):
@@ -18,40 +309,544 @@ def get_base_dir(file_id):
 
 
 def make_new_path(name):
-    last_id = 0
-    for file in os.listdir('upload/'):
-        if file.isnumeric():
-            last_id = int(file) if int(file) > last_id else last_id
-    new_id = last_id + 1
-    os.mkdir('upload/' + str(new_id))
-    os.mkdir('upload/' + str(new_id) + '/ori/')
-    os.mkdir('upload/' + str(new_id) + '/mod/')
-    
+    now = time.time()
+    with open_index() as connection:
+        new_id = connection.execute('''INSERT INTO uploads (file_name, status, owner, created, updated)
+                                       VALUES (?, 'queued', ?, ?, ?)''', (name, os.getpid(), now, now)).lastrowid
+    os.makedirs('upload/' + str(new_id) + '/ori/', exist_ok=True)
+    os.makedirs('upload/' + str(new_id) + '/mod/', exist_ok=True)
+
     return new_id, 'upload/' + str(new_id) + '/ori/' + name, 'upload/' + str(new_id) + '/mod/' + name
 
 
+def get_revision_dir(file_id):
+    return get_base_dir(file_id) + 'revision/'
+
+
+def make_revision_path(file_id, name):
+    """
+    Return the path to save a revised version of a processed file at. The revision and its results are kept aside in
+    the revision directory until its analysis succeeded, see keep_revision.
+    """
+    revision_dir = get_revision_dir(file_id)
+    shutil.rmtree(revision_dir, ignore_errors=True)
+    os.makedirs(revision_dir + 'ori/')
+    return revision_dir + 'ori/' + name
+
+
+def keep_revision(file_id, result_0, result_1):
+    """
+    Replace the original and the results of a file with those of its revision, saved in its revision directory.
+    If a file can not be moved, the previous version is put back and the error is raised. The export written from the
+    previous results is removed, it is written again when it is downloaded.
+    :param result_0: the result of the first pattern of the revision.
+    :param result_1: the result of the second pattern of the revision.
+    :return: null
+    """
+    base_dir, revision_dir = get_base_dir(file_id), get_revision_dir(file_id)
+    previous_dir = revision_dir + 'previous/'
+    os.makedirs(previous_dir, exist_ok=True)
+    names = ['ori'] + ['result_' + str(pattern_id) + extension for pattern_id in [0, 1] for extension in RESULT_FILES]
+    moved, added = [], []
+    try:
+        for name in names:
+            if os.path.exists(base_dir + name):
+                os.rename(base_dir + name, previous_dir + name)
+                moved.append(name)
+            if os.path.exists(revision_dir + name):
+                os.rename(revision_dir + name, base_dir + name)
+                added.append(name)
+    except OSError:
+        for name in added:
+            os.rename(base_dir + name, revision_dir + name)
+        for name in moved:
+            os.rename(previous_dir + name, base_dir + name)
+        raise
+    finally:
+        result_cache.invalidate(base_dir + 'result_')
+    set_processed(file_id, result_0, result_1)
+    set_export_name(file_id, None)
+    for name in os.listdir(base_dir + 'mod/'):
+        # an export being written is left to its download
+        if not name.endswith('.tmp'):
+            os.remove(base_dir + 'mod/' + name)
+    shutil.rmtree(revision_dir, ignore_errors=True)
+
+
+def discard_revision(file_id):
+    shutil.rmtree(get_revision_dir(file_id), ignore_errors=True)
+
+
 def allowed_file(name):
     return '.' in name and name.rsplit('.', 1)[1].lower() in ['xls', 'xlsx']
 
 
-def get_file_list():
-    file_list = []
-    for file_id in os.listdir('upload/'):
-        for file in os.listdir('upload/' + file_id + '/ori/'):
-            if file.endswith(".xls") or file.endswith(".xlsx"):
-                file_list.append(get_result(file_id, 0))
-    return file_list
+def read_zip(archive):
+    """
+    List the excel files packed in a zip archive, folders inside the archive are ignored. An archive with more members
+    or more uncompressed bytes of excel files than the limits is refused before anything is extracted.
+    :param archive: an open zipfile.ZipFile.
+    :return: a list of (file name, zip info), extract each file with 'extract_member'.
+    """
+    members = archive.infolist()
+    if len(members) > ZIP_MAX_MEMBERS:
+        raise Exception("The archive has more than %d files." % ZIP_MAX_MEMBERS)
+    files = []
+    for info in members:
+        name = os.path.basename(info.filename)
+        if info.is_dir() or info.filename.startswith('__MACOSX/') or not allowed_file(name):
+            continue
+        files.append((name, info))
+    if sum(info.file_size for name, info in files) > ZIP_MAX_SIZE:
+        raise Exception("The files in the archive are larger than %d MB." % (ZIP_MAX_SIZE // (1024 * 1024)))
+    return files
+
+
+def extract_member(archive, info, path):
+    """
+    Write a file packed in a zip archive to a path, a block at a time. zipfile reads no more than the size the
+    archive gives for the file.
+    :return: null
+    """
+    with archive.open(info) as source, open(path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+
+
+def get_file_list(cursor=None, limit=100, name=None):
+    """
+    List the uploads from the newest, a page at a time.
+    :param cursor: only list the uploads older than this file id, the 'next_cursor' of the previous page.
+    :param limit: the maximum number of uploads in the page.
+    :param name: only list the uploads whose file name contains this text, case insensitive.
+    :return: a list of uploads with their id, file name, export url and status, and the cursor of the next page,
+    None on the last page.
+    """
+    query = "SELECT file_id, file_name, status FROM uploads WHERE 1 = 1"
+    params = []
+    if cursor is not None:
+        query += " AND file_id < ?"
+        params.append(cursor)
+    if name:
+        query += " AND file_name LIKE ? ESCAPE '\\'"
+        params.append('%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    query += " ORDER BY file_id DESC LIMIT ?"
+    params.append(limit + 1)
+    with open_index() as connection:
+        rows = connection.execute(query, params).fetchall()
+    file_list = [{
+        'file_id': row['file_id'],
+        'file_name': row['file_name'],
+        'export_url': '/export/' + str(row['file_id']),
+        'status': row['status']
+    } for row in rows[:limit]]
+    next_cursor = file_list[-1]['file_id'] if len(rows) > limit else None
+    return file_list, next_cursor
+
+
+def is_processed(file_id):
+    return get_summary(file_id) is not None
+
+
+def delete_file(file_id, keep=()):
+    """
+    Remove an upload and its index entry.
+    :param keep: names of sub directories of the upload to leave on disk, e.g. the profile of a failed job.
+    :return: null
+    """
+    remove_upload_files(file_id, keep)
+    with open_index() as connection:
+        connection.execute("DELETE FROM uploads WHERE file_id = ?", (file_id,))
+
+
+def remove_upload_files(file_id, keep=()):
+    base_dir = 'upload/' + str(file_id) + '/'
+    if not keep:
+        shutil.rmtree(base_dir, ignore_errors=True, onerror=None)
+    elif os.path.isdir(base_dir):
+        for name in os.listdir(base_dir):
+            if name in keep:
+                continue
+            if os.path.isdir(base_dir + name):
+                shutil.rmtree(base_dir + name, ignore_errors=True, onerror=None)
+            else:
+                os.remove(base_dir + name)
+    result_cache.invalidate('upload/' + str(file_id) + '/')
+
+
+def get_result(file_id, pattern_id, rows=None, columns=None):
+    """
+    Read the result of a pattern. Only part of the 'content' is read when a range of rows or columns is given.
+    :param rows: (start, end) range of the students to read, all of them if None.
+    :param columns: (start, end) range of the items to read, all of them if None.
+    :return: the result as it was saved; with a 'content_range' describing the slice when a range is given.
+    """
+    return read_result('upload/' + str(file_id) + '/result_' + str(pattern_id), rows, columns)
+
+
+def save_result(json_dict, file_id, pattern_id, base_dir=None):
+    """
+    Save the result of a pattern, with its compressed response bodies.
+    :param base_dir: directory to save the result in, the upload directory of the file by default.
+    :return: null
+    """
+    prefix = (base_dir or get_base_dir(file_id)) + 'result_' + str(pattern_id)
+    result_cache.invalidate(prefix + '.')
+    write_result(prefix, json_dict)
+    compress_result(file_id, pattern_id, json_dict, base_dir)
+
+
+def compress_result(file_id, pattern_id, json_dict=None, base_dir=None):
+    """
+    Write the compressed response bodies of a result: gzip, and brotli when the brotli package is installed.
+    :param json_dict: the result, read from the saved files if None.
+    :param base_dir: directory of the result, the upload directory of the file by default.
+    :return: null
+    """
+    prefix = (base_dir or get_base_dir(file_id)) + 'result_' + str(pattern_id)
+    if json_dict is None:
+        json_dict = get_result(file_id, pattern_id)
+    body = json.dumps(json_dict, separators=(',', ':')).encode()
+    if brotli is not None:
+        write_file(prefix + '.json.br', brotli.compress(body))
+    elif os.path.exists(prefix + '.json.br'):
+        os.remove(prefix + '.json.br')
+    # gzip is written last, a result without it is compressed again when it is requested
+    write_file(prefix + '.json.gz', gzip.compress(body, mtime=0))
+
+
+def get_result_body(file_id, pattern_id, encodings):
+    """
+    Return the whole result of a pattern as a response body, in the first accepted encoding that is available.
+    :param encodings: the accepted content encodings, in order of preference: 'br' and/or 'gzip'.
+    :return: (body, content encoding or None for plain JSON, etag); each encoding has its own etag.
+    """
+    prefix = 'upload/' + str(file_id) + '/result_' + str(pattern_id)
+    if not os.path.exists(prefix + '.json.gz'):
+        compress_result(file_id, pattern_id)
+    body = read_cached(prefix + '.json.gz')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    for encoding in encodings:
+        if encoding == 'gzip':
+            return body, 'gzip', etag + '-gzip'
+        if encoding == 'br' and os.path.exists(prefix + '.json.br'):
+            return read_cached(prefix + '.json.br'), 'br', etag + '-br'
+    return gzip.decompress(body), None, etag
+
+
+def get_result_slice_body(file_id, pattern_id, rows, columns, encodings):
+    """
+    Return part of the result of a pattern as a response body, compressed in the first accepted encoding. The bodies
+    are kept in the result cache, for as long as the result files do not change.
+    :param rows: (start, end) range of the students, all of them if None.
+    :param columns: (start, end) range of the items, all of them if None.
+    :param encodings: the accepted content encodings, in order of preference: 'br' and/or 'gzip'.
+    :return: (body, content encoding or None for plain JSON, etag), see get_result_body.
+    """
+    prefix = 'upload/' + str(file_id) + '/result_' + str(pattern_id)
+    encoding = next((encoding for encoding in encodings if encoding == 'gzip' or brotli is not None), None)
+    # every save replaces the files, taken before reading so a result saved meanwhile is not cached as this version
+    paths = [prefix + extension for extension in ['.json', '.npy'] if os.path.exists(prefix + extension)]
+    version = tuple((stat.st_ino, stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths))
+    key = '%s.json?rows=%s&columns=%s&encoding=%s' % (prefix, rows, columns, encoding)
+    etag = hashlib.sha256(repr((version, rows, columns)).encode()).hexdigest()[:32]
+    body = result_cache.get(key, version)
+    if body is None:
+        body = json.dumps(read_result(prefix, rows, columns), separators=(',', ':')).encode()
+        if encoding == 'gzip':
+            body = gzip.compress(body, mtime=0)
+        elif encoding == 'br':
+            body = brotli.compress(body)
+        result_cache.put(key, version, body, len(body))
+    return body, encoding, etag if encoding is None else etag + '-' + encoding
+
+
+def read_cached(path):
+    """
+    Read a file through the result cache.
+    """
+    version = os.stat(path).st_mtime_ns
+    content = result_cache.get(path, version)
+    if content is None:
+        with open(path, 'rb') as file:
+            content = file.read()
+        result_cache.put(path, version, content, len(content))
+    return content
+
+
+def write_file(path, content):
+    """
+    Replace a file at once, so it is never read half written.
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def save_metrics(file_id, spans):
+    """
+    Add spans to the ones saved with the results of a file.
+    :param spans: spans recorded by model.metrics.
+    :return: null
+    """
+    with _metrics_lock:
+        write_file(get_base_dir(file_id) + 'metrics.json', json.dumps(get_metrics(file_id) + spans).encode())
+
+
+def get_metrics(file_id):
+    """
+    Return the spans saved with the results of a file, in the order they were recorded.
+    """
+    try:
+        with open(get_base_dir(file_id) + 'metrics.json') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
+
+
+def pack_content(content):
+    """
+    Split the 'content' of a result into its layout and its 0/1 marks, the marks are packed 8 to a byte.
+    :param content: a list of {row name: row values}, two header rows, a row for each student and the column totals.
+    :return: (layout, packed marks), or None if the student rows are not 0/1 marks followed by their total.
+    """
+    if len(content) < 3:
+        return None
+    names = []
+    marks = []
+    totals = []
+    for row in content[2:-1]:
+        if len(row) != 1:
+            return None
+        for name, values in row.items():
+            names.append(name)
+            marks.append(values[:-1])
+            totals.append(values[-1:])
+    try:
+        matrix = numpy.array(marks)
+        totals = numpy.array(totals)
+    except ValueError:
+        return None
+    if matrix.ndim != 2 or matrix.dtype.kind not in 'iu' or totals.dtype.kind not in 'iu' or totals.shape != (len(names), 1):
+        return None
+    if not ((matrix == 0) | (matrix == 1)).all() or (matrix.sum(axis=1) != totals[:, 0]).any():
+        return None
+    layout = {
+        'header': content[:2],
+        'names': names,
+        'footer': content[-1],
+        'items': matrix.shape[1]
+    }
+    return layout, numpy.packbits(matrix.astype(numpy.uint8), axis=1)
+
+
+def unpack_content(layout, packed, rows, columns):
+    """
+    Rebuild the rows of 'content' in the given ranges from its layout and packed marks.
+    :return: the content, with the two header rows and the column totals cut to the column range.
+    """
+    row_start, row_end = rows
+    column_start, column_end = columns
+    block = numpy.unpackbits(packed[row_start:row_end], axis=1, count=layout['items'])
+    totals = block.sum(axis=1, dtype=numpy.int64).tolist()
+    block = block[:, column_start:column_end].tolist()
+    content = [{name: values[:-1][column_start:column_end] + values[-1:] for name, values in row.items()}
+               for row in layout['header']]
+    for name, values, total in zip(layout['names'][row_start:row_end], block, totals):
+        content.append({name: values + [total]})
+    content.append({name: values[column_start:column_end] for name, values in layout['footer'].items()})
+    return content
+
+
+def slice_range(value, size):
+    start, end = (0, size) if value is None else value
+    start = min(max(start, 0), size)
+    return start, min(max(end, start), size)
+
+
+def load_result(prefix):
+    """
+    Return the JSON header of a result as text and its packed marks, from the result cache if the files did not change.
+    A result too large for the cache keeps its marks memory mapped.
+    :param prefix: path of the result files, without extension.
+    :return: (header, packed marks or None)
+    """
+    version = os.stat(prefix + '.json').st_mtime_ns
+    cached = result_cache.get(prefix + '.json', version)
+    if cached is not None:
+        return cached
+    with open(prefix + '.json', 'r') as json_file:
+        header = json_file.read()
+    packed = None
+    size = len(header)
+    if os.path.exists(prefix + '.npy'):
+        packed = numpy.load(prefix + '.npy', mmap_mode='r')
+        size += packed.nbytes
+        if size <= result_cache.limit:
+            packed = numpy.array(packed)
+            packed.setflags(write=False)
+    result_cache.put(prefix + '.json', version, (header, packed), size)
+    return header, packed
+
+
+def read_result(prefix, rows=None, columns=None):
+    """
+    Read a result written by write_result, the packed marks are memory mapped so a slice only reads its own rows.
+    :param prefix: path of the result files, without extension.
+    :return: the result, see get_result.
+    """
+    header, packed = load_result(prefix)
+    result = json.loads(header)
+    layout = result.pop('content_layout', None)
+    if layout is not None:
+        students, items = len(layout['names']), layout['items']
+    else:
+        content = result['content']
+        students, items = len(content) - 3, len(content[-1].get('total', []))
+        if rows is None and columns is None:
+            return result
+        packed_content = pack_content(content)
+        if packed_content is None:
+            raise Exception("The content of this result can not be sliced.")
+        layout, packed = packed_content
+    row_range, column_range = slice_range(rows, students), slice_range(columns, items)
+    result['content'] = unpack_content(layout, packed, row_range, column_range)
+    if rows is not None or columns is not None:
+        result['content_range'] = {
+            'rows': list(row_range),
+            'columns': list(column_range),
+            'students': students,
+            'items': items
+        }
+    return result
+
+
+def write_result(prefix, json_dict):
+    """
+    Write a result as a JSON header and, when its content holds 0/1 marks, a packed .npy matrix of the marks.
+    :param prefix: path of the result files, without extension.
+    :param json_dict: the result.
+    :return: null
+    """
+    packed_content = pack_content(json_dict.get('content', []))
+    if packed_content is None:
+        header = json_dict
+        if os.path.exists(prefix + '.npy'):
+            os.remove(prefix + '.npy')
+    else:
+        layout, packed = packed_content
+        header = dict(json_dict)
+        del header['content']
+        header['content_layout'] = layout
+        numpy.save(prefix + '.npy', packed)
+    with open(prefix + '.json', 'w') as json_file:
+        json.dump(header, json_file, separators=(',', ':'))
+
+
+def file_hash(path):
+    """
+    Return the sha256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_result(key, file_id):
+    """
+    Copy the results of a processed file into the cache.
+    :param key: cache key of the uploaded file.
+    :param file_id: id of the processed file.
+    :return: null
+    """
+    entry = CACHE_DIR + key
+    if os.path.isdir(entry):
+        return
+    # build the entry aside and rename it, so a half written entry is never read
+    tmp = CACHE_DIR + '.' + key + '.' + str(os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.mkdir(tmp)
+    for pattern_id in [0, 1]:
+        for extension in ['.json', '.npy']:
+            path = get_base_dir(file_id) + 'result_' + str(pattern_id) + extension
+            if os.path.exists(path):
+                shutil.copyfile(path, tmp + '/result_' + str(pattern_id) + extension)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # the same content was cached by another worker in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict_cache()
 
 
-def delete_file(file_id):
-    shutil.rmtree('upload/' + str(file_id), ignore_errors=True, onerror=None)
+def load_cached_result(key, file_id, file_name):
+    """
+    Read the cached results of a file identical to an upload, as the results of the upload.
+    :param key: cache key of the uploaded file.
+    :param file_id: id of the upload.
+    :param file_name: name of the upload.
+    :return: the results of both patterns, None on a cache miss.
+    """
+    entry = CACHE_DIR + key + '/'
+    if not os.path.isdir(entry):
+        return None
+    try:
+        results = []
+        for pattern_id in [0, 1]:
+            result = read_result(entry + 'result_' + str(pattern_id))
+            result['file_id'] = file_id
+            result['file_name'] = file_name
+            result['export_url'] = '/export/' + str(file_id)
+            results.append(result)
+        os.utime(entry)
+    except OSError:
+        # the entry was evicted while it was read
+        return None
+    return results
 
 
-def get_result(file_id, pattern_id):
-    with open('upload/' + str(file_id) + '/result_' + str(pattern_id) + '.json', 'r') as json_file:
-        return json.load(json_file)
+def restore_result(key, file_id, file_name, base_dir=None):
+    """
+    Give an upload the cached results of an identical file. They are read completely before anything is saved, so
+    the entry being evicted meanwhile is a plain cache miss.
+    :param key: cache key of the uploaded file.
+    :param file_id: id of the upload.
+    :param file_name: name of the upload.
+    :param base_dir: directory to save the results in, e.g. the revision directory. The upload is then not marked as
+    processed, see keep_revision.
+    :return: the restored results of both patterns, None on a cache miss.
+    """
+    results = load_cached_result(key, file_id, file_name)
+    if results is None:
+        return None
+    for pattern_id in [0, 1]:
+        save_result(results[pattern_id], file_id, pattern_id, base_dir)
+    if base_dir is None:
+        set_processed(file_id, results[0], results[1])
+    return results
 
 
-def save_result(json_dict, file_id, pattern_id):
-    with open('upload/' + str(file_id) + '/result_' + str(pattern_id) + '.json', 'w') as json_file:
-        json.dump(json_dict, json_file)
+def evict_cache():
+    """
+    Remove the least recently used cache entries until the cache fits in CACHE_LIMIT.
+    :return: null
+    """
+    entries = []
+    total = 0
+    for key in os.listdir(CACHE_DIR):
+        if key.startswith('.'):
+            continue
+        entry = CACHE_DIR + key
+        try:
+            size = sum(os.path.getsize(entry + '/' + file) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), entry, size))
+        except OSError:
+            continue
+        total += size
+    for mtime, entry, size in sorted(entries):
+        if total <= CACHE_LIMIT:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
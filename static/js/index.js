@@ -6,27 +6,49 @@ const INVALID_FORMAT = 'INVALID_FORMAT';
 const INSTRUCTION = 'INSTRUCTION';
 const SERVER_DOWN = "SERVER_DOWN";
 
+const PAGE_SIZE = 24;
+const SEARCH_DELAY = 300;
+
+// the shown part of the file list: the cursor of its next page, null on the last page, and the name searched for
+const fileList = { cursor: null, name: '', request: 0 };
+
 // initial query to server asking for processed files
 const init = async () => {
 
-    const jsonData = await initFetch(); // data should be an array of processed files
-
-    // render inital processed files
-    jsonData.file_list.forEach(json => {
-        fileView.renderProcessDone(json.file_id, json.file_name, json.export_url);
-    });
+    // only the first page, the others are loaded with the 'More files' button
+    await fetchFiles();
 
     // render instruction
     fileView.renderPopupWindow(null, INSTRUCTION, null);
 };
 
-const initFetch = async () => {
+// fetch the next page of the uploads, from the newest, and render its processed files below those already shown
+const fetchFiles = async () => {
 
-    const url = '/filelist';
-    const response = await fetch(url, { method: 'GET' });
+    const request = ++fileList.request;
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (fileList.cursor !== null) params.set('cursor', fileList.cursor);
+    if (fileList.name !== '') params.set('name', fileList.name);
+
+    const response = await fetch(`/filelist?${params}`, { method: 'GET' });
     const json = await response.json();
 
-    return json;
+    // another page or search was asked for meanwhile
+    if (request !== fileList.request) return;
+
+    json.file_list.filter(json => json.status === 'done').forEach(json => {
+        fileView.renderProcessDone(json.file_id, json.file_name, json.export_url, true);
+    });
+    fileList.cursor = json.next_cursor === undefined ? null : json.next_cursor;
+    fileView.renderMoreFiles(fileList.cursor !== null);
+};
+
+// list the files whose name contains the text, from the first page
+const searchFiles = name => {
+    fileList.name = name.trim();
+    fileList.cursor = null;
+    fileView.clearProcessedFiles();
+    fetchFiles();
 };
 
 window.onload = init;
@@ -49,6 +71,45 @@ const validateFile = element => {
     }
 };
 
+const STATUS_INTERVAL = 1000;
+
+// the upload that is waiting for the server to finish processing
+let polling = null;
+
+const pollStatus = (fileID, file) => {
+
+    const job = { fileID, timer: null, cancelled: false };
+    polling = job;
+
+    const check = async () => {
+        let json;
+        try {
+            const response = await fetch(`/status/${fileID}`, { method: 'GET' });
+            json = await response.json();
+        } catch (error) {
+            json = null;
+        }
+        if (job.cancelled) return;
+
+        if (json === null || json.status === 'queued' || json.status === 'processing') {
+            job.timer = setTimeout(check, STATUS_INTERVAL);
+            return;
+        }
+
+        polling = null;
+        fileView.clearNode('.file-container.processing');
+        if (json.status === 'done') {
+            fileView.renderProcessDone(fileID, file.name, json.export_url);
+        } else {
+            // something wrong, render the error msg sent from server
+            fileView.renderPopupWindow(file.name, null, json.err_msg);
+        }
+        fileView.renderNewFileUpload();
+    };
+
+    job.timer = setTimeout(check, STATUS_INTERVAL);
+};
+
 const uploadFile = file => {
 
     const url = '/upload';
@@ -63,6 +124,12 @@ const uploadFile = file => {
 
         document.querySelector('.processing-delete').addEventListener('click', () => {
             xhr.abort();
+            if (polling !== null) {
+                clearTimeout(polling.timer);
+                polling.cancelled = true;
+                deleteFile(polling.fileID, null);
+                polling = null;
+            }
             fileView.clearNode('.file-container.processing');
             fileView.renderNewFileUpload();
         });
@@ -76,12 +143,10 @@ const uploadFile = file => {
 
             // non error msg returns from the server, everything works fine
             if (!isErrorOccur) {
+                // the file is queued on the server, wait for the analysis to finish
                 const fileID = JSON.parse(xhr.responseText).file_id;
-                const downloadURL = JSON.parse(xhr.responseText).export_url;
 
-                fileView.clearNode('.file-container.processing');
-                fileView.renderProcessDone(fileID, file.name, downloadURL);
-                fileView.renderNewFileUpload();
+                pollStatus(fileID, file);
             } else {
                 // something wrong, render the error msg sent from server
                 fileView.renderPopupWindow(file.name, null, errorMsg);
@@ -116,13 +181,15 @@ const deleteFile = (fileID, element) => {
         .catch(error => console.error(`Delete error: ${error}`));
 
     // remove data and node
-    if (element.dataset.fileId == fileID) element.remove();
+    if (element !== null && element.dataset.fileId == fileID) element.remove();
 };
 
 document.querySelector('.right-panel').addEventListener('click', e => {
 
     if (e.target.matches('.upload, .upload *')) {
         openDialog();
+    } else if (e.target.matches('.more-files-button')) {
+        fetchFiles();
     } else if (e.target.matches('.delete')) {
         const fileID = e.target.dataset.fileId;
         const element = e.target.closest('.file-container.processed');
@@ -133,9 +200,19 @@ document.querySelector('.right-panel').addEventListener('click', e => {
 
 document.querySelector('.right-panel').addEventListener('change', e => {
 
-    if (e.target.matches('.import, .import *')) validateFile(e.target);
-    // set the target to empty so that 'change' will fire even select the same file
-    e.target.value = '';
+    if (e.target.matches('.import, .import *')) {
+        validateFile(e.target);
+        // set the target to empty so that 'change' will fire even select the same file
+        e.target.value = '';
+    }
+});
+
+let searchTimer = null;
+
+// search once the user stopped typing
+document.querySelector('.file-search-input').addEventListener('input', e => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => searchFiles(e.target.value), SEARCH_DELAY);
 });
 
 const openDialog = () => document.querySelector('.import').click();
\ No newline at end of file
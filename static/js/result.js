@@ -1,10 +1,18 @@
 import * as resultView from './view/resultView.js';
 
-const getProcessedResult = async (fileID, typeID) => {
+// students fetched at a time, the next ones are fetched when the chart is scrolled to its end
+const ROW_PAGE = 100;
+const SCROLL_MARGIN = 200;
+
+// the rows of the chart fetched so far
+const chart = { fileID: null, typeID: null, next: 0, students: 0, loading: false };
+
+const getProcessedResult = async (fileID, typeID, rowStart) => {
 
     // const url = `/result/${fileID}`;
 
-    const url = `/result/${fileID}/pattern/${typeID}`;
+    // every item, and a window of the students
+    const url = `/result/${fileID}/pattern/${typeID}?row_start=${rowStart}&row_end=${rowStart + ROW_PAGE}`;
 
     const response = await fetch(url, { method: 'GET' });
     const json = await response.json();
@@ -23,11 +31,39 @@ const renderResult = async () => {
     console.log(`fileID: ${fileID}`);
     console.log(`typeID: ${typeID}`);
 
-    const processedData = await getProcessedResult(fileID, typeID);  // should be a JSON object
+    const processedData = await getProcessedResult(fileID, typeID, 0);  // should be a JSON object
+
+    chart.fileID = fileID;
+    chart.typeID = typeID;
+    chart.next = processedData.content_range.rows[1];
+    chart.students = processedData.content_range.students;
 
-    resultView.renderParsedResult(typeID, processedData);
+    resultView.renderParsedResult(typeID, processedData, chart.next >= chart.students);
+    fillChart();
 };
 
+// fetch the next windows of rows while the end of the chart is in view
+const fillChart = async () => {
+
+    const element = document.querySelector('#data');
+    const nearEnd = () => element.scrollTop + element.clientHeight >= element.scrollHeight - SCROLL_MARGIN
+        && element.getBoundingClientRect().bottom <= window.innerHeight + SCROLL_MARGIN;
+
+    if (chart.loading) return;
+    chart.loading = true;
+    while (chart.next < chart.students && nearEnd()) {
+        const data = await getProcessedResult(chart.fileID, chart.typeID, chart.next);
+
+        chart.next = data.content_range.rows[1];
+        resultView.renderMoreRows(data, chart.next >= chart.students);
+    }
+    chart.loading = false;
+};
+
+// the chart scrolls inside its panel, or with the page on a small screen
+document.querySelector('#data').addEventListener('scroll', fillChart);
+window.addEventListener('scroll', fillChart);
+
 // document.querySelector('.left-panel').addEventListener('click', e => {
 //     if (e.target.matches('.other-pattern, .other-pattern *')) {
 //         renderOtherPattern();
@@ -81,11 +81,12 @@ export const renderFileProcessing = () => {
         </div>
     `;
 
-    document.querySelector('.right-panel').insertAdjacentHTML('afterbegin', markup);
+    document.querySelector('.file-search').insertAdjacentHTML('afterend', markup);
 };
 
 
-export const renderProcessDone = (fileID, fileName, downloadURL) => {
+// a new file goes on top, a file of an older page of the file list below those already shown
+export const renderProcessDone = (fileID, fileName, downloadURL, older = false) => {
 
     // const query = `?fileID=${fileID}`;
     const query = `?fileID=${fileID}&typeID=0`;
@@ -111,7 +112,12 @@ export const renderProcessDone = (fileID, fileName, downloadURL) => {
         </div>
     `;
 
-    document.querySelector('.right-panel').insertAdjacentHTML('afterbegin', markup);
+    if (older) {
+        const next = document.querySelector('.file-container.new') || document.querySelector('.more-files');
+        next.insertAdjacentHTML('beforebegin', markup);
+    } else {
+        document.querySelector('.file-search').insertAdjacentHTML('afterend', markup);
+    }
 };
 
 export const renderNewFileUpload = () => {
@@ -131,7 +137,16 @@ export const renderNewFileUpload = () => {
             </form>
         </div>
     `;
-    document.querySelector('.right-panel').insertAdjacentHTML('beforeend', markup);
+    document.querySelector('.more-files').insertAdjacentHTML('beforebegin', markup);
+};
+
+// show the button for the next page of the file list while there is one
+export const renderMoreFiles = visible => {
+    document.querySelector('.more-files').style.display = visible ? '' : 'none';
+};
+
+export const clearProcessedFiles = () => {
+    document.querySelectorAll('.file-container.processed').forEach(element => element.remove());
 };
 
 export const clearNode = className => {
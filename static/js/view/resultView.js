@@ -6,16 +6,12 @@ Array.prototype.Exists = function (v) {
     return b;
 };
 
-const parseJSON = data => {
-    let irregularStudent = data.irregular_student;
-    let irregularItem = data.irregular_item;
-    let boxs = data.boxes;
-    let odd_cells = data.odd_cells;
-    let j = 0;
+// data is a window of the rows of the chart, see 'content_range' of /result/<file_id>/pattern/<pattern_id>
+const parseJSON = (data, last) => {
     let temp = "";
 
     let font_size = "";
-    if ((data.content.length * data.content[0][Object.keys(data.content[0])].length) < 300) {
+    if (((data.content_range.students + 3) * data.content[0][Object.keys(data.content[0])].length) < 300) {
         font_size = "24px";
     }
     else {
@@ -23,67 +19,88 @@ const parseJSON = data => {
     }
     temp += "<table table cellspacing=\"0\" style=\"font-size: " + font_size + "\"width= 90%>\n" +
         "<tbody  class = \"test\">";
+    temp += parseRows(data, true, last);
+    temp += "</tbody>\n" +
+        "</table>";
+    return temp;
+};
+
+// the header rows are only rendered with the first window, and the totals with the last one
+const parseRows = (data, first, last) => {
+    let temp = "";
 
     for (let l = 0; l < data.content.length; l++) {
-        let stu = Object.keys(data.content[l]).toString();
-        j++;
-        temp += "<tr>";
-        if (irregularStudent.Exists(stu)) {
-            temp += "<td  class='irregular-student'>" + stu + "</td>";
-        } else {
-            temp += "<td  >" + stu + "</td>";
-        }
+        const footer = l === data.content.length - 1;
+        if ((l < 2 && !first) || (footer && !last)) continue;
+        // the number of the row in the whole chart
+        const j = l < 2 ? l + 1 : footer ? data.content_range.students + 3 : l + data.content_range.rows[0] + 1;
+        temp += parseRow(data, l, j);
+    }
+    return temp;
+};
 
-        for (let i = 0; i < data.content[l][stu].length; i++) {
-            let class_ = "";
-            if(l === 0 || l === 1){
-                class_ += " all_border";
-            }
-            for (let k = 0; k < boxs.length; k++) {
-                if (j > boxs[k]["row_range"][0] && j <= boxs[k]["row_range"][1] + 1) {
-                    if (i === boxs[k]["column_range"][0] - 1) {
-                        class_ += " border-left";
-                    }
-                    if (i === boxs[k]["column_range"][1] - 1) {
-                        class_ += " border-right";
-                    }
-                }
+const parseRow = (data, l, j) => {
+    let irregularStudent = data.irregular_student;
+    let irregularItem = data.irregular_item;
+    let boxs = data.boxes;
+    let odd_cells = data.odd_cells;
+    let temp = "";
 
-                if (i >= boxs[k]["column_range"][0] - 1 && i < boxs[k]["column_range"][1]) {
+    let stu = Object.keys(data.content[l]).toString();
+    temp += "<tr>";
+    if (irregularStudent.Exists(stu)) {
+        temp += "<td  class='irregular-student'>" + stu + "</td>";
+    } else {
+        temp += "<td  >" + stu + "</td>";
+    }
 
-                    if (j === boxs[k]["row_range"][0] + 1) {
-                        class_ += " border-top";
-                    }
-                    if (j === boxs[k]["row_range"][1] + 1) {
-                        class_ += " border-bottom";
-                    }
+    for (let i = 0; i < data.content[l][stu].length; i++) {
+        let class_ = "";
+        if(j === 1 || j === 2){
+            class_ += " all_border";
+        }
+        for (let k = 0; k < boxs.length; k++) {
+            if (j > boxs[k]["row_range"][0] && j <= boxs[k]["row_range"][1] + 1) {
+                if (i === boxs[k]["column_range"][0] - 1) {
+                    class_ += " border-left";
+                }
+                if (i === boxs[k]["column_range"][1] - 1) {
+                    class_ += " border-right";
                 }
             }
 
-            let coordinate = ("(" + (i) + ", " + (j - 2) + ")");
-            if (l > 0 && data.content[l][stu][i] > 0 && (i !== data.content[l][stu].length - 1) && (stu !== "total")) {
-                if (odd_cells.Exists(coordinate)) {
-                    class_ += " odd-cells";
+            if (i >= boxs[k]["column_range"][0] - 1 && i < boxs[k]["column_range"][1]) {
+
+                if (j === boxs[k]["row_range"][0] + 1) {
+                    class_ += " border-top";
                 }
-                else {
-                    class_ += " greater-than-0";
+                if (j === boxs[k]["row_range"][1] + 1) {
+                    class_ += " border-bottom";
                 }
             }
-            else if (irregularItem.Exists(data.content[l][stu][i])) {
-                class_ += " irregular-item"
+        }
+
+        let coordinate = ("(" + (i) + ", " + (j - 2) + ")");
+        if (j > 1 && data.content[l][stu][i] > 0 && (i !== data.content[l][stu].length - 1) && (stu !== "total")) {
+            if (odd_cells.Exists(coordinate)) {
+                class_ += " odd-cells";
             }
             else {
-                if (odd_cells.Exists(coordinate)) {
-                    class_ += " odd-cells";
-                }
+                class_ += " greater-than-0";
             }
-
-            temp += "<td class = \" " + class_ + "\" >" + data.content[l][stu][i] + "</td>";
         }
-        temp += "</tr>";
+        else if (irregularItem.Exists(data.content[l][stu][i])) {
+            class_ += " irregular-item"
+        }
+        else {
+            if (odd_cells.Exists(coordinate)) {
+                class_ += " odd-cells";
+            }
+        }
+
+        temp += "<td class = \" " + class_ + "\" >" + data.content[l][stu][i] + "</td>";
     }
-    temp += "</tbody>\n" +
-        "</table>";
+    temp += "</tr>";
     return temp;
 };
 
@@ -208,14 +225,20 @@ const renderFeedback = (typeID, data) => {
     document.querySelector('.guttman-page-left').insertAdjacentHTML('afterbegin', markup);
 };
 
-const renderGuttmanChart = data => {
-    const resultMarkup = parseJSON(data);
+const renderGuttmanChart = (data, last) => {
+    const resultMarkup = parseJSON(data, last);
 
     document.querySelector('#data').insertAdjacentHTML('beforeend', resultMarkup);
 };
 
-export const renderParsedResult = (typeID, data) => {
+// render the page with the first window of rows, last tells whether it holds all of them
+export const renderParsedResult = (typeID, data, last) => {
     renderLeftPanel(data);
     renderFeedback(typeID, data);
-    renderGuttmanChart(data);
+    renderGuttmanChart(data, last);
+};
+
+// add the next window of rows to the chart
+export const renderMoreRows = (data, last) => {
+    document.querySelector('#data tbody').insertAdjacentHTML('beforeend', parseRows(data, false, last));
 };
\ No newline at end of file
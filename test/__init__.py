@@ -1,5 +1,9 @@
-from .test_storage import StorageTestCase
-from .test_excel_output import ExcelOutputTestCase
+from .test_storage import StorageTestCase, LRUCacheTestCase
+from .test_excel_output import ExcelOutputTestCase, ExcelStyleTestCase
 from .test_guttman_analysis import GuttmanAnalysisTestCase
-from .test_file_import import FileImportTestCase
-
+from .test_guttman_engine import GuttmanEngineTestCase
+from .test_file_import import FileImportTestCase, SortOrderTestCase, ReadXlsxTestCase, BreakDownMarksTestCase
+from .test_jobs import JobsTestCase
+from .test_pipeline import PipelineTestCase
+from .test_benchmark import BenchmarkTestCase
+from .test_metrics import MetricsTestCase
@@ -0,0 +1,35 @@
+import unittest
+import benchmark
+import model.file_importing as fi
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_guttman_matrix(self):
+        matrix = benchmark.guttman_matrix(50, 8, noise=0)
+        self.assertEqual(matrix.shape, (50, 8))
+        # without noise every student passes the items easier than the hardest item they passed
+        columns = matrix[:, (-matrix.sum(axis=0, dtype=int)).argsort(kind='stable')]
+        self.assertTrue((columns[:, 1:] <= columns[:, :-1]).all())
+
+    def test_mark_sheet(self):
+        data, index = benchmark.mark_sheet(20, 5, criteria=3, noise=0.5)
+        self.assertEqual(len(data), 21)
+        self.assertEqual(len(index[0]), 15)
+        sheet = fi.break_down_marks(data, index)
+        self.assertEqual(len(sheet[2]), 16)
+        self.assertEqual([sum(row[1:]) for row in sheet[2:]], [sum(row[1:]) for row in data[1:]])
+
+    def test_compare(self):
+        baseline = {'noise': 0.05, 'scales': {'small': (1, 1, 1)}, 'results': {'small': {'a': 1.0, 'b': 1.0}}}
+        results = {'noise': 0.05, 'scales': {'small': (1, 1, 1)}, 'results': {'small': {'a': 1.1, 'b': 2.0, 'c': 5}}}
+        self.assertEqual(benchmark.compare(results, baseline), [('small', 'b', 2.0, 1.0)])
+        baseline['scales']['small'] = (2, 1, 1)
+        self.assertEqual(benchmark.compare(results, baseline), [])
+
+    def test_run(self):
+        results = benchmark.run(['small'], repeat=1)
+        self.assertEqual(set(results['results']['small']), {
+            'break_down_marks', 'sort_2d_array_mark', 'return_correlation', 'return_irregular_index',
+            'return_irregular_index_students', 'irregular_box', 'odd_cells', 'ExcelOutput'})
+        self.assertEqual(benchmark.compare(results, results), [])
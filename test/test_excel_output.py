@@ -1,4 +1,6 @@
 import unittest
+import os
+import openpyxl
 import xlsxwriter
 import model.excel_processing.ExcelOutput as ep
 import model.file_importing as fi
@@ -32,3 +34,47 @@ class ExcelOutputTestCase(unittest.TestCase):
         array = fi.readfile(self.file_name)
         array = fi.transpose(array)
         self.assertTrue(array[1][6] == 5)
+
+
+class ExcelStyleTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.array = [['', 'a', 'b', 'c'], ['student_id', '1.1', '1.2', '1.3'],
+                      ['student1', 1, 1, 0], ['student2', 1, 0, 0], ['student3', 0, 1, 1]]
+        self.file_name = 'test_styles.xlsx'
+        self.excel = ep.ExcelOutput(self.file_name)
+
+    def tearDown(self) -> None:
+        os.remove(self.file_name)
+
+    def test_cell_styles(self):
+        self.excel.add_array(self.array)
+        self.excel.write_excel(0)
+        self.excel.highlight_area(0, 0, 2, 2, '#95e1d3', 0)
+        self.excel.add_border(2, 3, 1, 2, 0)
+        self.excel.close_workbook()
+        # plain, positive, highlighted and four kinds of bordered cells share formats
+        self.assertEqual(len(self.excel.format_cache), 7)
+        sheet = openpyxl.load_workbook(self.file_name).worksheets[0]
+        self.assertEqual([cell.value for cell in sheet[3]], ['student1', 1, 1, 0])
+        self.assertEqual(sheet['B3'].fill.fgColor.rgb, 'FFFFD5D5')
+        self.assertIsNone(sheet['D3'].fill.fill_type)
+        self.assertEqual(sheet['C1'].fill.fgColor.rgb, 'FF95E1D3')
+        self.assertEqual((sheet['B3'].border.top.style, sheet['B3'].border.left.style), ('medium', 'medium'))
+        self.assertEqual((sheet['C4'].border.bottom.style, sheet['C4'].border.right.style), ('medium', 'medium'))
+        self.assertIsNone(sheet['C4'].border.top.style)
+
+    def test_constant_memory(self):
+        self.excel = ep.ExcelOutput(self.file_name, constant_memory=True)
+        self.excel.add_array(self.array)
+        self.excel.write_excel(0)
+        self.excel.add_total_score(0)
+        self.excel.add_correlation([0.5, 0.25, float('nan')], 'column', 0)
+        # decorations added after the totals still land in the streamed rows
+        self.excel.highlight_area(2, 2, 0, 0, '#f9ed69', 0)
+        self.excel.close_workbook()
+        sheet = openpyxl.load_workbook(self.file_name).worksheets[0]
+        self.assertEqual([cell.value for cell in sheet[3]], ['student1', 1, 1, 0, 2])
+        self.assertEqual([cell.value for cell in sheet[6]], ['total score', 2, 2, 1, None])
+        self.assertEqual([cell.value for cell in sheet[7]], ['item_performance', 0.5, 0.25, 'nan', None])
+        self.assertEqual(sheet['E1'].value, 'total score')
+        self.assertEqual(sheet['A3'].fill.fgColor.rgb, 'FFF9ED69')
@@ -1,4 +1,5 @@
 import unittest
+import numpy
 import model.file_importing as fi
 
 
@@ -22,3 +23,96 @@ class FileImportTestCase(unittest.TestCase):
         fi.sort_2d_array_mark(self.array)
         print(self.array)
         self.assertTrue(self.array[2][2] == 4)
+
+
+class SortOrderTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.array = [['', 'a', 'b', 'c'], ['student_id', '1.1', '1.2', '1.3'],
+                      ['s1', 1, 0, 0], ['s2', 1, 0, 0], ['s3', 1, 1, 0], ['s4', 0, 0, 1]]
+
+    def test_sort_keeps_exchange_order_for_ties(self):
+        row_order, column_order = fi.sort_2d_array_mark(self.array)
+        # s3 is swapped to the top, s1 moves to where s3 was, so s2 comes before s1
+        self.assertEqual([row[0] for row in self.array], ['', 'student_id', 's3', 's2', 's1', 's4'])
+        self.assertEqual(row_order.tolist(), [0, 1, 4, 3, 2, 5])
+        self.assertEqual(column_order.tolist(), [0, 1, 2, 3])
+
+    def test_sort_columns_by_total(self):
+        array = [['', 'a', 'b'], ['student_id', '1.1', '1.2'], ['s1', 0, 1], ['s2', 0, 1], ['s3', 1, 0]]
+        row_order, column_order = fi.sort_2d_array_mark(array)
+        self.assertEqual(column_order.tolist(), [0, 2, 1])
+        self.assertEqual(array[1], ['student_id', '1.2', '1.1'])
+
+    def test_marks_order(self):
+        marks = numpy.array([row[1:] for row in self.array[2:]])
+        student_order, task_order = fi.marks_order(marks, marks.sum(axis=1))
+        row_order, column_order = fi.sort_order(self.array)
+        self.assertEqual(student_order.tolist(), (row_order[2:] - 2).tolist())
+        self.assertEqual(task_order.tolist(), (column_order[1:] - 1).tolist())
+
+    def test_exchange_order(self):
+        self.assertEqual(fi.exchange_order([1, 1, 2]).tolist(), [2, 1, 0])
+        self.assertEqual(fi.exchange_order([1, 2, 2]).tolist(), [1, 2, 0])
+
+
+class ReadXlsxTestCase(unittest.TestCase):
+
+    def test_read_xlsx(self):
+        array1, array2 = fi.readfile('testdata/SampleAssessmentResult.xlsx')
+        self.assertEqual(array1[0][:2], ['student_id', '651'])
+        self.assertEqual(array1[1][:3], [1.1, 1, 2])
+        self.assertEqual(array2[0][0], '1.1.1')
+
+    def test_wrong_formats(self):
+        errors = {
+            'criteria-not-in-order.xlsx': "the criteria in worksheet 2 is not listed in order",
+            'dupe-item-id.xlsx': "Duplicate item name detected.",
+            'dupe-student-id.xlsx': "Duplicate student name detected.",
+            'empty-mark.xlsx': fi.MARK_ERROR,
+            'no-description-row.xlsx': "Second row should be item names, digit value detected.",
+            'no-second-sheet.xlsx': "Excel file has less than 2 work sheets",
+            'no-sufficient-mark-for-item.xlsx': "the max mark of this task is greater than its total sub-criteria",
+        }
+        for file_name, message in errors.items():
+            with self.assertRaises(Exception) as context:
+                fi.readfile('testdata/wrong-formats/' + file_name)
+            self.assertEqual(str(context.exception), message)
+
+    def test_validate(self):
+        errors = {
+            'criteria-not-in-order.xlsx': "the criteria in worksheet 2 is not listed in order",
+            'dupe-item-id.xlsx': "Duplicate item name detected.",
+            'no-description-row.xlsx': "Second row should be item names, digit value detected.",
+            'no-second-sheet.xlsx': "Excel file has less than 2 work sheets",
+        }
+        for file_name, message in errors.items():
+            with self.assertRaises(Exception) as context:
+                fi.validate('testdata/wrong-formats/' + file_name)
+            self.assertEqual(str(context.exception), message)
+        # these are only found once the marks and student names are read
+        for file_name in ['dupe-student-id.xlsx', 'empty-mark.xlsx', 'no-sufficient-mark-for-item.xlsx']:
+            fi.validate('testdata/wrong-formats/' + file_name)
+        fi.validate('testdata/SampleAssessmentResult.xlsx')
+
+
+class BreakDownMarksTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.array = [['student_id', '1.1', '1.2'], ['s1', 2, 0], ['s2', 1, 1], ['s3', 0, 1]]
+        self.index = [['1.1.1', '1.1.2', '1.2.1'], ['a', 'b', 'c']]
+
+    def test_break_down_marks(self):
+        new_array = fi.break_down_marks(self.array, self.index)
+        self.assertEqual(new_array, [['', 'a', 'b', 'c'],
+                                     ['student_id', '1.1.1', '1.1.2', '1.2.1'],
+                                     ['s1', 1, 1, 0],
+                                     ['s2', 1, 0, 1],
+                                     ['s3', 0, 0, 1]])
+        self.assertEqual(self.array[1], ['s1', 2, 0])
+
+    def test_max_mark_check(self):
+        self.array[2][2] = 2
+        with self.assertRaises(Exception) as context:
+            fi.break_down_marks(self.array, self.index)
+        self.assertEqual(str(context.exception), "the max mark of this task is greater than its total sub-criteria")
@@ -0,0 +1,177 @@
+import math
+import unittest
+import numpy
+import model.guttman_analysis as ad
+import model.guttman_analysis.engine as engine
+
+
+class GuttmanEngineTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.data = [[1, 1, 1, 1, 1, 1, 0, 1],
+                     [1, 1, 1, 1, 1, 0, 1, 0],
+                     [1, 1, 1, 1, 0, 1, 0, 0],
+                     [1, 1, 0, 1, 1, 0, 0, 0],
+                     [1, 1, 1, 0, 1, 0, 0, 0],
+                     [1, 0, 1, 1, 0, 0, 0, 0],
+                     [0, 1, 1, 0, 0, 0, 0, 0],
+                     [1, 1, 0, 0, 0, 0, 0, 0],
+                     [1, 0, 0, 0, 0, 0, 0, 1],
+                     [0, 0, 0, 0, 0, 0, 0, 0]]
+        self.matrix = engine.as_matrix(self.data)
+
+    def test_as_matrix(self):
+        self.assertEqual(self.matrix.dtype, numpy.uint8)
+        self.assertEqual(self.matrix.shape, (10, 8))
+        self.assertIs(engine.as_matrix(self.matrix), self.matrix)
+
+    def test_clean_input(self):
+        original_data = [['', 'a', 'b'], ['student_id', '1.1', '1.2'], ['651', 1, 0], ['652', 0, 1]]
+        self.assertEqual(engine.clean_input(original_data).tolist(), [[1, 0], [0, 1]])
+
+    def test_sum_item_score(self):
+        self.assertEqual(ad.sum_item_score(self.matrix), [8, 7, 6, 5, 4, 2, 1, 2])
+        self.assertEqual(ad.sum_item_score(self.data), [8, 7, 6, 5, 4, 2, 1, 2])
+
+    def test_cal_scorerate_accumulated_matrix(self):
+        scorerate = engine.cal_scorerate_accumulated_matrix(self.matrix)
+        self.assertEqual(scorerate[3].tolist(), [1.0, 1.0, 2 / 3, 0.75, 0.8, 4 / 6, 4 / 7, 0.5])
+
+    def test_get_0staddv_index(self):
+        scorerate = engine.cal_scorerate_accumulated_matrix(self.matrix)
+        self.assertEqual(engine.get_0staddv_index(scorerate).tolist(), [9])
+
+    def test_return_correlation(self):
+        correlation = ad.return_correlation(self.data, True, 'Accumulation')
+        self.assertEqual(len(correlation), 10)
+        self.assertEqual(correlation[9], 0.0)
+        self.assertAlmostEqual(correlation[0], 0.7814387081218634)
+        self.assertAlmostEqual(correlation[6], -0.027184598213045873)
+        # Rows with zero standard deviation are left out for the other flags.
+        self.assertEqual(len(ad.return_correlation(self.data, True, 'Correlation')), 9)
+        self.assertAlmostEqual(ad.return_correlation(self.data, False, 'Similarity')[5], 0.17677669529663687)
+
+    def test_return_irregular_index(self):
+        self.assertEqual(ad.return_irregular_index(self.data, True, 'Accumulation'), [6])
+        self.assertEqual(ad.return_irregular_index(self.data, False, 'Accumulation'), [7, 6])
+        # Items 6 and 7 tie at -1/6, their order is down to rounding.
+        self.assertCountEqual(ad.return_irregular_index(self.matrix, False, 'Correlation'), [6, 7])
+        self.assertEqual(ad.return_irregular_index(self.matrix, True, 'Similarity'), [])
+
+    def reference_scores(self, matrix, scorerate, flag):
+        """
+        Score every row against its neighbours one pair at a time, with numpy.corrcoef.
+        """
+        length = len(matrix)
+        scores = []
+        for row in range(length):
+            neighbours = []
+            for i in range(math.floor(math.sqrt(length)) - 1):
+                if row - i - 1 <= 0:
+                    neighbours.append(row + i + 1)
+                elif row + i + i >= length - 1:
+                    neighbours.append(row - i - 1)
+                else:
+                    neighbours += [row - i - 1, row + i + 1]
+            pairs = []
+            for other in neighbours:
+                if other >= length:
+                    continue
+                if flag == 'Accumulation':
+                    pairs.append(numpy.corrcoef(scorerate[row], scorerate[other])[0, 1])
+                elif flag == 'Correlation':
+                    pairs.append(numpy.corrcoef(matrix[row], matrix[other])[0, 1])
+                else:
+                    pairs.append(numpy.dot(matrix[row], matrix[other]) /
+                                 (numpy.linalg.norm(matrix[row]) * numpy.linalg.norm(matrix[other])))
+            scores.append(sum(pairs) / len(pairs))
+        return scores
+
+    def test_neighbour_scores(self):
+        matrix = numpy.array(self.data[:9], dtype=numpy.float64)
+        scorerate = engine.cal_scorerate_accumulated_matrix(matrix)
+        for flag in ['Accumulation', 'Correlation', 'Similarity']:
+            scores = engine.neighbour_scores(matrix, scorerate, flag)
+            for score, reference in zip(scores, self.reference_scores(matrix, scorerate, flag)):
+                self.assertAlmostEqual(score, reference)
+            self.assertEqual(ad.irregular_cal(matrix, 4, flag, scorerate, [], True), [scores[4]])
+        self.assertAlmostEqual(engine.neighbour_scores(matrix, scorerate, 'Correlation')[0],
+                               (numpy.corrcoef(matrix[0], matrix[1])[0, 1] + numpy.corrcoef(matrix[0], matrix[2])[0, 1]) / 2)
+        with self.assertRaises(ZeroDivisionError):
+            engine.neighbour_scores(matrix[:3], scorerate[:3], 'Correlation')
+
+    def test_zero_correlation(self):
+        # the dot products of row 1 add up to -2.8e-17 instead of 0, it must not be detected as irregular
+        data = [[0, 0, 0, 1, 0, 1, 1, 1], [0, 1, 0, 0, 1, 0, 1, 1], [1, 0, 1, 0, 0, 0, 1, 1],
+                [0, 1, 0, 1, 0, 0, 0, 1], [1, 0, 0, 0, 1, 0, 1, 0], [0, 1, 1, 0, 0, 1, 0, 0]]
+        matrix = numpy.array(data, dtype=numpy.float64)
+        scores = engine.neighbour_scores(matrix, None, 'Correlation')
+        reference = self.reference_scores(matrix, None, 'Correlation')
+        self.assertEqual((scores[1], reference[1]), (0.0, 0.0))
+        for score, expected in zip(scores, reference):
+            self.assertAlmostEqual(score, expected)
+        self.assertNotIn(1, ad.return_irregular_index(data, True, 'Correlation'))
+
+    def test_summed_area_table(self):
+        table = engine.summed_area_table(self.matrix)
+        self.assertEqual(table.shape, (11, 9))
+        self.assertEqual(table[10, 8], sum(map(sum, self.data)))
+        self.assertEqual(table[3, 2] - table[1, 2] - table[3, 0] + table[1, 0], 4)
+
+    def test_irregular_box(self):
+        self.assertEqual(ad.irregular_box(self.data), [(0, 4, (2, 8)), (5, 7, (0, 3))])
+        self.assertEqual(engine.irregular_box(self.matrix, block_size=1), [(0, 4, (2, 8)), (5, 7, (0, 3))])
+        self.assertEqual(ad.irregular_box(self.data[:3]), [])
+
+    def test_diamond_sum(self):
+        ones = numpy.ones((5, 5), dtype=numpy.uint8)
+        counts = engine.diamond_sum(ones, 1)
+        self.assertEqual(counts[2, 2], 5)
+        self.assertEqual(counts[0, 0], 3)
+        self.assertEqual(engine.diamond_sum(ones, 2)[2, 2], 13)
+
+    def test_odd_cells(self):
+        matrix = numpy.ones((6, 6), dtype=numpy.uint8)
+        matrix[2, 3] = 0
+        self.assertEqual(ad.odd_cells(matrix), [(2, 3)])
+        self.assertEqual(ad.odd_cells(matrix.tolist()), [(2, 3)])
+        self.assertEqual(ad.odd_cells(numpy.zeros((6, 6), dtype=numpy.uint8)), [])
+
+    def test_update_correlation(self):
+        generator = numpy.random.RandomState(0)
+        matrix = (generator.rand(60, 12) < numpy.linspace(0.9, 0.1, 12)).astype(numpy.uint8)
+        revised = matrix.copy()
+        revised[[3, 40], [5, 2]] ^= 1
+        for flag in ['Accumulation', 'Correlation', 'Similarity']:
+            for is_student in [True, False]:
+                previous = engine.return_correlation(matrix, is_student, flag)
+                # exactly the same as calculating everything again
+                self.assertTrue(numpy.array_equal(engine.update_correlation(revised, is_student, flag, matrix, previous),
+                                                  engine.return_correlation(revised, is_student, flag)))
+        previous = engine.return_correlation(matrix, True, 'Accumulation')
+        self.assertTrue(numpy.array_equal(engine.update_correlation(matrix, True, 'Accumulation', matrix, previous),
+                                          previous))
+        self.assertEqual(ad.update_correlation(self.data, True, 'Accumulation', None, None),
+                         ad.return_correlation(self.data, True, 'Accumulation'))
+        self.assertEqual(ad.update_correlation(self.data, True, 'Accumulation', self.data[:9], previous[:9]),
+                         ad.return_correlation(self.data, True, 'Accumulation'))
+
+    def test_update_odd_cells(self):
+        matrix = numpy.ones((40, 40), dtype=numpy.uint8)
+        matrix[2, 3] = matrix[30, 30] = 0
+        revised = matrix.copy()
+        revised[2, 3] = revised[20, 10] = 0
+        self.assertEqual(ad.update_odd_cells(revised, matrix, ad.odd_cells(matrix)), [(2, 3), (20, 10), (30, 30)])
+        revised[30, 30] = 1
+        self.assertEqual(ad.update_odd_cells(revised, matrix, ad.odd_cells(matrix)), ad.odd_cells(revised))
+        self.assertEqual(ad.update_odd_cells(revised, None, None), ad.odd_cells(revised))
+        generator = numpy.random.RandomState(0)
+        matrix = (generator.rand(50, 30) < 0.5).astype(numpy.uint8)
+        revised = matrix.copy()
+        revised[[0, 25, 49], [0, 10, 29]] ^= 1
+        self.assertEqual(engine.update_odd_cells(revised, matrix, engine.odd_cells(matrix, 0.6), 0.6),
+                         engine.odd_cells(revised, 0.6))
+
+    def test_wrappers_return_lists(self):
+        self.assertIsInstance(ad.return_correlation(self.matrix, False, 'Accumulation')[0], float)
+        self.assertIsInstance(ad.return_irregular_index(self.matrix, False, 'Accumulation')[0], int)
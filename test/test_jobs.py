@@ -0,0 +1,310 @@
+import unittest
+import os
+import shutil
+import subprocess
+import openpyxl
+import model.storage as st
+import model.jobs as jobs
+import model.profiling as profiling
+
+
+class JobsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        shutil.copytree('upload/', 'upload_bak/')
+        shutil.rmtree('upload/', ignore_errors=True, onerror=None)
+        os.mkdir('upload/')
+        shutil.copytree(st.CACHE_DIR, 'cache_bak/')
+        shutil.rmtree(st.CACHE_DIR, ignore_errors=True, onerror=None)
+        os.mkdir(st.CACHE_DIR)
+
+    def tearDown(self) -> None:
+        shutil.rmtree('upload/', ignore_errors=True, onerror=None)
+        shutil.copytree('upload_bak/', 'upload/')
+        shutil.rmtree('upload_bak/', ignore_errors=True, onerror=None)
+        shutil.rmtree(st.CACHE_DIR, ignore_errors=True, onerror=None)
+        shutil.copytree('cache_bak/', st.CACHE_DIR)
+        shutil.rmtree('cache_bak/', ignore_errors=True, onerror=None)
+
+    def submit(self, test_file):
+        file_id, path, mod_path = st.make_new_path(os.path.basename(test_file))
+        shutil.copyfile(test_file, path)
+        jobs.submit(file_id, os.path.basename(test_file), path)
+        # the file is marked 'done' before its job caches the results
+        return file_id, jobs.wait([file_id])[0]
+
+    def test_job_done(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['export_url'], '/export/1')
+        self.assertTrue(st.is_processed(file_id))
+        self.assertEqual(st.get_result(file_id, 1)['file_name'], 'SampleAssessmentResult.xlsx')
+        stages = [span['stage'] for span in st.get_metrics(file_id)]
+        self.assertEqual(stages[:3], ['cache_lookup', 'validate', 'read'])
+        self.assertEqual(stages[-2:], ['save_result_0', 'save_result_1'])
+
+    def test_export_file(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        # the excel file is only written when it is first exported
+        self.assertIsNone(st.get_export_path(file_id))
+        file_dir, file_name = jobs.export_file(file_id)
+        self.assertEqual((file_dir, file_name), (st.get_base_dir(file_id) + 'mod/', 'SampleAssessmentResult.xlsx'))
+        self.assertEqual(os.listdir(file_dir), [file_name])
+        modified = os.path.getmtime(file_dir + file_name)
+        self.assertEqual(jobs.export_file(file_id), (file_dir, file_name))
+        self.assertEqual(st.get_metrics(file_id)[-1]['stage'], 'excel.close_workbook')
+        self.assertEqual(os.path.getmtime(file_dir + file_name), modified)
+
+    def test_profiled_job(self):
+        file_id, path, mod_path = st.make_new_path('Sample.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        jobs.submit(file_id, 'Sample.xlsx', path, profile=True)
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'done')
+        self.assertEqual(profiling.get_reports(file_id), profiling.REPORTS)
+        with open(profiling.get_profile_dir(file_id) + 'profile.txt') as file:
+            self.assertIn('process_file', file.read())
+        # a profiled file is processed even when its results are cached
+        file_id, path, mod_path = st.make_new_path('Copy.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        jobs.submit(file_id, 'Copy.xlsx', path, profile=True)
+        self.assertIn(file_id, jobs._jobs)
+        jobs.wait([file_id])
+        self.assertEqual(profiling.get_reports(file_id), profiling.REPORTS)
+        self.assertEqual(profiling.get_reports(1 + file_id), [])
+
+    def test_profiled_job_error(self):
+        file_id, path, mod_path = st.make_new_path('dupe-student-id.xlsx')
+        shutil.copyfile('testdata/wrong-formats/dupe-student-id.xlsx', path)
+        jobs.submit(file_id, 'dupe-student-id.xlsx', path, profile=True)
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'error')
+        # the upload is removed, but not the reports of its profile
+        self.assertFalse(st.is_processed(file_id))
+        self.assertEqual(os.listdir(st.get_base_dir(file_id)), ['profile'])
+        self.assertEqual(profiling.get_reports(file_id), profiling.REPORTS)
+
+    def test_content_rows(self):
+        content = [{'': ['a', 'b', 'total']}, {'student_id': ['1.1', '1.2', '']}, {'s1': [1, 0, 1]}, {'total': [1, 0]}]
+        self.assertEqual(jobs.content_rows(content), [['', 'a', 'b'], ['student_id', '1.1', '1.2'], ['s1', 1, 0]])
+
+    def test_job_error(self):
+        file_id, status = self.submit('testdata/wrong-formats/dupe-student-id.xlsx')
+        self.assertEqual(status, {'file_id': file_id, 'status': 'error', 'err_msg': 'Duplicate student name detected.'})
+        self.assertFalse(os.path.isdir(st.get_base_dir(file_id)))
+
+    def test_status_in_index(self):
+        done_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        error_id, status = self.submit('testdata/wrong-formats/dupe-student-id.xlsx')
+        # finished jobs are dropped, their status is read from the index as in any other process of the web server
+        self.assertEqual(jobs._jobs, {})
+        self.assertEqual(jobs.get_status(done_id)['status'], 'done')
+        self.assertEqual(jobs.get_status(error_id)['err_msg'], 'Duplicate student name detected.')
+        self.assertEqual([status['status'] for status in jobs.wait([done_id, error_id])], ['done', 'error'])
+        self.assertEqual([file['status'] for file in st.get_file_list()[0]], ['error', 'done'])
+
+    def test_recover(self):
+        stopped = subprocess.Popen(['python', '-c', ''])
+        stopped.wait()
+        file_id, path, mod_path = st.make_new_path('Sample.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        st.set_status(file_id, 'queued', owner=stopped.pid)
+        revised_id, status = self.submit('testdata/AssessmentResult_CPS.xlsx')
+        st.make_revision_path(revised_id, 'Revised.xlsx')
+        st.set_status(revised_id, 'processing', owner=stopped.pid)
+        # a job of a running process is left to it
+        running_id, path, mod_path = st.make_new_path('Running.xlsx')
+        st.set_status(running_id, 'queued', owner=os.getppid())
+        jobs._recovered = False
+        jobs.recover()
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'done')
+        self.assertEqual(jobs.get_status(revised_id)['status'], 'error')
+        self.assertEqual(jobs.get_status(revised_id)['status'], 'done')
+        self.assertFalse(os.path.exists(st.get_revision_dir(revised_id)))
+        self.assertEqual(jobs.get_status(running_id)['status'], 'queued')
+        # once per process
+        st.set_status(running_id, 'queued', owner=stopped.pid)
+        jobs.recover()
+        self.assertEqual(jobs.get_status(running_id)['status'], 'queued')
+
+    def test_validate(self):
+        file_id, path, mod_path = st.make_new_path('dupe-item-id.xlsx')
+        shutil.copyfile('testdata/wrong-formats/dupe-item-id.xlsx', path)
+        # a badly formatted file is rejected before it is queued
+        with self.assertRaises(Exception) as context:
+            jobs.submit(file_id, 'dupe-item-id.xlsx', path)
+        self.assertEqual(str(context.exception), 'Duplicate item name detected.')
+        self.assertNotIn(file_id, jobs._jobs)
+
+    def test_wait(self):
+        file_ids = []
+        for test_file in ['testdata/SampleAssessmentResult.xlsx', 'testdata/wrong-formats/dupe-student-id.xlsx']:
+            file_id, path, mod_path = st.make_new_path(os.path.basename(test_file))
+            shutil.copyfile(test_file, path)
+            jobs.submit(file_id, os.path.basename(test_file), path)
+            file_ids.append(file_id)
+        statuses = jobs.wait(file_ids)
+        self.assertEqual([status['status'] for status in statuses], ['done', 'error'])
+
+    def test_cached_result(self):
+        first_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        file_id, path, mod_path = st.make_new_path('Copy.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        jobs.submit(file_id, 'Copy.xlsx', path)
+        # a cache hit is finished without queueing a job
+        self.assertEqual(jobs.get_status(file_id)['status'], 'done')
+        self.assertEqual(jobs.export_file(file_id), (st.get_base_dir(file_id) + 'mod/', 'Copy.xlsx'))
+        for pattern_id in [0, 1]:
+            first, copy = st.get_result(first_id, pattern_id), st.get_result(file_id, pattern_id)
+            self.assertEqual((copy['file_id'], copy['file_name'], copy['export_url']), (file_id, 'Copy.xlsx', '/export/2'))
+            self.assertEqual(first['content'], copy['content'])
+
+    def test_cache_failure_keeps_upload(self):
+        file_id, path, mod_path = st.make_new_path('Sample.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+
+        def cache_result(key, file_id):
+            raise OSError('No space left on device')
+        cache = st.cache_result
+        st.cache_result = cache_result
+        try:
+            result = jobs.run_job(file_id, 'Sample.xlsx', path, 'key', [])
+        finally:
+            st.cache_result = cache
+        self.assertNotIn('err_msg', result)
+        self.assertEqual(jobs.get_status(file_id)['status'], 'done')
+        self.assertEqual(os.listdir(st.CACHE_DIR), [])
+
+    def test_pattern_1_leaves_out_irregular_items(self):
+        file_id, path, mod_path = st.make_new_path('Sample.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        jobs.process_file(file_id, 'Sample.xlsx', path)
+        result_0, result_1 = st.get_result(file_id, 0), st.get_result(file_id, 1)
+        rows_0, rows_1 = jobs.content_rows(result_0['content']), jobs.content_rows(result_1['content'])
+        self.assertTrue(result_0['irregular_item'])
+        self.assertEqual(sorted(rows_1[1][1:]), sorted(set(rows_0[1][1:]) - set(result_0['irregular_item'])))
+        for row in result_1['content'][2:-1]:
+            for name, values in row.items():
+                self.assertEqual(values[-1], sum(values[:-1]))
+        totals = [values[-1] for row in result_1['content'][2:-1] for values in row.values()]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        self.assertEqual(result_1['content'][-1]['total'], [sum(column) for column in zip(*[row[1:] for row in rows_1[2:]])])
+
+    def test_revise(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        self.assertEqual(jobs.export_file(file_id)[1], 'SampleAssessmentResult.xlsx')
+        content = st.get_result(file_id, 0)['content']
+        workbook = openpyxl.load_workbook('testdata/SampleAssessmentResult.xlsx')
+        workbook.worksheets[0]['B3'] = 2
+        path = st.make_revision_path(file_id, 'Revised.xlsx')
+        workbook.save(path)
+        jobs.revise(file_id, path)
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'done')
+        self.assertEqual(os.listdir(st.get_base_dir(file_id) + 'ori/'), ['Revised.xlsx'])
+        self.assertIsNone(st.get_export_path(file_id))
+
+        # the same results as a new upload of the revised file
+        new_id, new_path, mod_path = st.make_new_path('Revised.xlsx')
+        shutil.copyfile(st.get_base_dir(file_id) + 'ori/Revised.xlsx', new_path)
+        jobs.process_file(new_id, 'SampleAssessmentResult.xlsx', new_path)
+        for pattern_id in [0, 1]:
+            revised, new = st.get_result(file_id, pattern_id), st.get_result(new_id, pattern_id)
+            self.assertEqual(revised['file_id'], file_id)
+            del revised['file_id'], revised['export_url'], new['file_id'], new['export_url']
+            self.assertEqual(revised, new)
+        self.assertNotEqual(st.get_result(file_id, 0)['content'], content)
+
+    def test_revise_old_results(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        # results in the format of the first version, before the indexes and the student correlations were saved
+        fields = ['file_id', 'file_name', 'export_url', 'irregular_student', 'irregular_item', 'item_performance',
+                  'boxes', 'content', 'odd_cells']
+        for pattern_id in [0, 1]:
+            result = st.get_result(file_id, pattern_id)
+            st.save_result({name: result[name] for name in fields if name in result}, file_id, pattern_id)
+        self.assertEqual(sorted(jobs.previous_result(file_id)), ['item_performance', 'matrix', 'matrix_1'])
+        workbook = openpyxl.load_workbook('testdata/SampleAssessmentResult.xlsx')
+        workbook.worksheets[0]['B3'] = 2
+        path = st.make_revision_path(file_id, 'Revised.xlsx')
+        workbook.save(path)
+        jobs.revise(file_id, path)
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'done')
+
+        # the stages without a previous result ran in full
+        new_id, new_path, mod_path = st.make_new_path('Revised.xlsx')
+        shutil.copyfile(path.replace('revision/', ''), new_path)
+        jobs.process_file(new_id, 'SampleAssessmentResult.xlsx', new_path)
+        for pattern_id in [0, 1]:
+            revised, new = st.get_result(file_id, pattern_id), st.get_result(new_id, pattern_id)
+            del revised['file_id'], revised['export_url'], new['file_id'], new['export_url']
+            self.assertEqual(revised, new)
+
+    def test_revise_error(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        result = st.get_result(file_id, 1)
+        path = st.make_revision_path(file_id, 'dupe-item-id.xlsx')
+        shutil.copyfile('testdata/wrong-formats/dupe-item-id.xlsx', path)
+        with self.assertRaises(Exception):
+            jobs.revise(file_id, path)
+        path = st.make_revision_path(file_id, 'dupe-student-id.xlsx')
+        shutil.copyfile('testdata/wrong-formats/dupe-student-id.xlsx', path)
+        jobs.revise(file_id, path)
+        self.assertEqual(jobs.wait([file_id])[0]['status'], 'error')
+        # the previous results are kept
+        self.assertEqual(jobs.get_status(file_id)['status'], 'done')
+        self.assertEqual(st.get_result(file_id, 1), result)
+        self.assertFalse(os.path.exists(st.get_base_dir(file_id) + 'revision/'))
+
+    def test_revise_keeps_results_on_cache_miss(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        result = st.get_result(file_id, 1)
+        # an entry evicted while it is read
+        self.submit('testdata/AssessmentResult_CPS.xlsx')
+        key = jobs.PIPELINE_VERSION + '-' + st.file_hash('testdata/AssessmentResult_CPS.xlsx')
+        os.remove(st.CACHE_DIR + key + '/result_1.json')
+        st.make_revision_path(file_id, 'Revised.xlsx')
+        self.assertIsNone(st.restore_result(key, file_id, 'Sample.xlsx', st.get_revision_dir(file_id)))
+        self.assertEqual(st.get_result(file_id, 1), result)
+
+    def test_keep_revision_rolls_back(self):
+        file_id, status = self.submit('testdata/SampleAssessmentResult.xlsx')
+        result = st.get_result(file_id, 0)
+        path = st.make_revision_path(file_id, 'Revised.xlsx')
+        shutil.copyfile('testdata/AssessmentResult_CPS.xlsx', path)
+        results = jobs.process_file(file_id, 'Sample.xlsx', path, results_dir=st.get_revision_dir(file_id))
+        self.assertEqual(st.get_result(file_id, 0), result)
+
+        rename = os.rename
+
+        def failing_rename(source, destination):
+            if destination.endswith('result_1.json'):
+                raise OSError('rename failed')
+            rename(source, destination)
+        os.rename = failing_rename
+        try:
+            with self.assertRaises(OSError):
+                st.keep_revision(file_id, *results)
+        finally:
+            os.rename = rename
+        self.assertEqual(st.get_result(file_id, 0), result)
+        self.assertEqual(os.listdir(st.get_base_dir(file_id) + 'ori/'), ['SampleAssessmentResult.xlsx'])
+        st.keep_revision(file_id, *results)
+        self.assertEqual(st.get_result(file_id, 0), results[0])
+        self.assertEqual(os.listdir(st.get_base_dir(file_id) + 'ori/'), ['Revised.xlsx'])
+        self.assertFalse(os.path.exists(st.get_revision_dir(file_id)))
+
+    def test_cache_eviction(self):
+        file_id, path, mod_path = st.make_new_path('Sample.xlsx')
+        shutil.copyfile('testdata/SampleAssessmentResult.xlsx', path)
+        jobs.process_file(file_id, 'Sample.xlsx', path)
+        st.cache_result('first', file_id)
+        st.cache_result('second', file_id)
+        self.assertEqual(sorted(os.listdir(st.CACHE_DIR)), ['first', 'second'])
+        os.utime(st.CACHE_DIR + 'first', (0, 0))
+        limit = st.CACHE_LIMIT
+        st.CACHE_LIMIT = sum(os.path.getsize(st.CACHE_DIR + 'second/' + file) for file in os.listdir(st.CACHE_DIR + 'second'))
+        try:
+            st.evict_cache()
+        finally:
+            st.CACHE_LIMIT = limit
+        self.assertEqual(os.listdir(st.CACHE_DIR), ['second'])
+
+    def test_unknown_job(self):
+        self.assertEqual(jobs.get_status(42)['status'], 'error')
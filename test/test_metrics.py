@@ -0,0 +1,56 @@
+import unittest
+import numpy
+import model.metrics as mt
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        mt.reset()
+
+    def tearDown(self) -> None:
+        mt.TRACE_MEMORY = False
+        mt.reset()
+
+    def test_span(self):
+        spans = []
+        with self.assertRaises(ZeroDivisionError):
+            with mt.span('fail', spans):
+                1 / 0
+        with mt.span('sum', spans):
+            sum(range(100000))
+        self.assertEqual([span['stage'] for span in spans], ['fail', 'sum'])
+        self.assertGreater(spans[1]['wall'], 0)
+        self.assertGreaterEqual(spans[1]['cpu'], 0)
+        self.assertGreater(spans[1]['max_rss'], 0)
+        self.assertIsNone(spans[1]['peak'])
+
+    def test_traced_peak(self):
+        mt.TRACE_MEMORY = True
+        spans = []
+        with mt.span('outer', spans):
+            with mt.span('inner', spans):
+                array = numpy.ones(1 << 20, dtype=numpy.uint8)
+                del array
+            with mt.span('small', spans):
+                pass
+        peaks = {span['stage']: span['peak'] for span in spans}
+        self.assertGreaterEqual(peaks['inner'], 1 << 20)
+        self.assertLess(peaks['small'], 1 << 20)
+        # the peak of the inner span is part of the peak of the outer one
+        self.assertGreaterEqual(peaks['outer'], 1 << 20)
+
+    def test_prometheus_text(self):
+        mt.observe([{'stage': 'sort', 'wall': 0.02, 'cpu': 0.01, 'max_rss': 2048, 'peak': None}], 'done')
+        mt.observe([{'stage': 'sort', 'wall': 2.0, 'cpu': 1.5, 'max_rss': 1024, 'peak': 10}], 'error')
+        lines = mt.prometheus_text().splitlines()
+        self.assertIn('analysis_jobs_total{status="done"} 1', lines)
+        self.assertIn('analysis_jobs_total{status="error"} 1', lines)
+        self.assertIn('analysis_stage_seconds_bucket{stage="sort",le="0.01"} 0', lines)
+        self.assertIn('analysis_stage_seconds_bucket{stage="sort",le="0.05"} 1', lines)
+        self.assertIn('analysis_stage_seconds_bucket{stage="sort",le="+Inf"} 2', lines)
+        self.assertIn('analysis_stage_seconds_sum{stage="sort"} 2.02', lines)
+        self.assertIn('analysis_stage_seconds_count{stage="sort"} 2', lines)
+        self.assertIn('analysis_stage_cpu_seconds_total{stage="sort"} 1.51', lines)
+        self.assertIn('analysis_stage_max_rss_bytes{stage="sort"} 2048', lines)
+        self.assertIn('analysis_stage_peak_bytes{stage="sort"} 10', lines)
@@ -0,0 +1,48 @@
+import unittest
+import numpy
+import model.guttman_analysis as ad
+import model.pipeline as pl
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.matrix = numpy.array([[1, 1, 1, 1, 1, 1, 0, 1],
+                                   [1, 1, 1, 1, 1, 0, 1, 0],
+                                   [1, 1, 1, 1, 0, 1, 0, 0],
+                                   [1, 1, 0, 1, 1, 0, 0, 0],
+                                   [1, 1, 1, 0, 1, 0, 0, 0],
+                                   [1, 0, 1, 1, 0, 0, 0, 0],
+                                   [0, 1, 1, 0, 0, 0, 0, 0],
+                                   [1, 1, 0, 0, 0, 0, 0, 0],
+                                   [1, 0, 0, 0, 0, 0, 0, 1],
+                                   [0, 0, 0, 0, 0, 0, 0, 0]], dtype=numpy.uint8)
+
+    def test_run_workbook(self):
+        result = pl.Pipeline().run('testdata/SampleAssessmentResult.xlsx')
+        self.assertEqual(list(result['timings']), [name for name, function in pl.STAGES])
+        self.assertEqual(result['matrix'].shape[1] - len(result['irregular_item']), result['matrix_1'].shape[1])
+        self.assertEqual(result['row_totals_1'].tolist(), result['matrix_1'].sum(axis=1).tolist())
+        self.assertEqual(len(result['sheet_1']), len(result['sheet']))
+
+    def test_run_matrix(self):
+        result = pl.Pipeline().run(self.matrix)
+        self.assertEqual(result['sheet'][1], ['student_id', '1', '2', '3', '4', '5', '6', '8', '7'])
+        self.assertEqual(result['matrix'].tolist(), ad.clean_input(result['sheet']))
+        self.assertEqual(result['irregular_item'], [7])
+        self.assertEqual(result['sheet_1'][1], ['student_id', '1', '2', '3', '4', '5', '6', '8'])
+        self.assertEqual(result['matrix_1'].tolist(), ad.clean_input(result['sheet_1']))
+        self.assertEqual(result['odd_cells'], ad.odd_cells(result['matrix_1']))
+
+    def test_skip_and_replace(self):
+        def some_items(state):
+            state['irregular_item'] = [7, 5]
+            state['item_performance'] = []
+        result = pl.Pipeline(skip=['find_boxes'], stages={'analyse_items': some_items}).run(self.matrix)
+        self.assertNotIn('boxes', result)
+        self.assertNotIn('find_boxes', result['timings'])
+        # the items are left out even when their indexes are not in order
+        self.assertEqual(result['sheet_1'][1], ['student_id', '1', '2', '3', '4', '5', '8'])
+        self.assertEqual(result['matrix_1'].tolist(), ad.clean_input(result['sheet_1']))
+        with self.assertRaises(Exception):
+            pl.Pipeline(skip=['unknown'])
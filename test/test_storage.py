@@ -2,6 +2,10 @@ import unittest
 import os
 import shutil
 import json
+import io
+import zipfile
+import gzip
+import threading
 import model.storage as st
 
 
@@ -61,3 +65,193 @@ class StorageTestCase(unittest.TestCase):
         data = {'Orcas Hunt': 'Sperm Whales'}
         st.save_result(data, 1)
         self.assertEquals(data, st.get_result(1))
+
+    def test_read_zip(self):
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, 'w') as archive:
+            archive.write('testdata/SampleAssessmentResult.xlsx', 'dept/Sample.xlsx')
+            archive.writestr('__MACOSX/dept/._Sample.xlsx', 'resource fork')
+            archive.writestr('notes.txt', 'not an excel file')
+        with zipfile.ZipFile(stream) as archive:
+            files = st.read_zip(archive)
+            self.assertEqual([name for name, info in files], ['Sample.xlsx'])
+            st.extract_member(archive, files[0][1], 'upload/extracted.xlsx')
+        with open('testdata/SampleAssessmentResult.xlsx', 'rb') as file, open('upload/extracted.xlsx', 'rb') as extracted:
+            self.assertEqual(extracted.read(), file.read())
+
+    def test_read_zip_limits(self):
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+            # compresses to a few hundred bytes
+            archive.writestr('bomb.xlsx', b'\0' * (1 << 20))
+        limit = st.ZIP_MAX_SIZE
+        st.ZIP_MAX_SIZE = 1 << 19
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                with self.assertRaises(Exception):
+                    st.read_zip(archive)
+        finally:
+            st.ZIP_MAX_SIZE = limit
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, 'w') as archive:
+            for i in range(st.ZIP_MAX_MEMBERS + 1):
+                archive.writestr('notes%d.txt' % i, '')
+        with zipfile.ZipFile(stream) as archive:
+            with self.assertRaises(Exception):
+                st.read_zip(archive)
+
+    def test_index_ids(self):
+        # the upload directory from setUp is imported into the new index
+        self.assertEqual(st.get_export_path(1), ('upload/1/mod/', 'SampleAssessmentResult.xlsx'))
+        first, ori_path, mod_path = st.make_new_path('first.xlsx')
+        second, ori_path, mod_path = st.make_new_path('second.xlsx')
+        self.assertEqual((first, second), (2, 3))
+        st.delete_file(second)
+        # ids of deleted uploads are not given out again
+        self.assertEqual(st.make_new_path('third.xlsx')[0], 4)
+        self.assertIsNone(st.get_export_path(second))
+
+    def test_index_created_by_another_process(self):
+        # the file exists, but the process that created it did not create the tables yet
+        open(st.INDEX_PATH, 'w').close()
+        self.assertEqual(st.get_export_path(1), ('upload/1/mod/', 'SampleAssessmentResult.xlsx'))
+        self.assertEqual(st.make_new_path('first.xlsx')[0], 2)
+        with st.open_index() as connection:
+            self.assertEqual(st.index_version(connection), st.INDEX_VERSION)
+
+    def test_set_processed(self):
+        file_id, ori_path, mod_path = st.make_new_path('Sample.xlsx')
+        self.assertFalse(st.is_processed(file_id))
+        result_0 = {'file_id': file_id, 'file_name': 'Sample.xlsx', 'export_url': '/export/2', 'irregular_item': ['1.1'],
+                    'item_performance': [0.5, 0.5], 'content': [{'': []}, {'student_id': []}, {'s1': []}, {'total': []}]}
+        result_1 = {'irregular_student': []}
+        st.save_result(result_0, file_id, 0)
+        st.set_processed(file_id, result_0, result_1)
+        self.assertTrue(st.is_processed(file_id))
+        self.assertEqual(st.get_summary(file_id), {'file_id': file_id, 'file_name': 'Sample.xlsx', 'export_url': '/export/2',
+                                                   'students': 1, 'items': 2, 'irregular_items': 1,
+                                                   'irregular_students': 0})
+        self.assertEqual(st.get_file_list(), ([{'file_id': 2, 'file_name': 'Sample.xlsx',
+                                                 'export_url': '/export/2', 'status': 'done'},
+                                                {'file_id': 1, 'file_name': 'SampleAssessmentResult.xlsx',
+                                                 'export_url': '/export/1', 'status': 'queued'}], None))
+
+    def test_file_list_pages(self):
+        for name in ['a_1.xlsx', 'b%1.xlsx', 'ab1.xlsx', 'A_2.xlsx']:
+            st.make_new_path(name)
+        files, cursor = st.get_file_list(limit=2)
+        self.assertEqual(([file['file_name'] for file in files], cursor), (['A_2.xlsx', 'ab1.xlsx'], 4))
+        files, cursor = st.get_file_list(cursor, limit=2)
+        self.assertEqual(([file['file_name'] for file in files], cursor), (['b%1.xlsx', 'a_1.xlsx'], 2))
+        files, cursor = st.get_file_list(cursor, limit=2)
+        self.assertEqual(([file['file_name'] for file in files], cursor), (['SampleAssessmentResult.xlsx'], None))
+        # wildcards in the name are matched literally
+        self.assertEqual([file['file_name'] for file in st.get_file_list(name='a_')[0]], ['A_2.xlsx', 'a_1.xlsx'])
+        self.assertEqual([file['file_name'] for file in st.get_file_list(name='%')[0]], ['b%1.xlsx'])
+
+    def test_packed_result(self):
+        content = [{'': ['a', 'b', 'c', 'total']}, {'student_id': ['1.1', '1.2', '1.3', '']},
+                   {'s1': [1, 1, 0, 2]}, {'s2': [1, 0, 1, 2]}, {'s3': [0, 0, 1, 1]}, {'total': [2, 1, 2]}]
+        result = {'file_id': 1, 'boxes': [], 'content': content}
+        st.save_result(result, 1, 0)
+        self.assertTrue(os.path.exists('upload/1/result_0.npy'))
+        self.assertEqual(st.get_result(1, 0), result)
+        part = st.get_result(1, 0, rows=(1, 3), columns=(1, 2))
+        self.assertEqual(part['content'], [{'': ['b', 'total']}, {'student_id': ['1.2', '']},
+                                           {'s2': [0, 2]}, {'s3': [0, 1]}, {'total': [1]}])
+        self.assertEqual(part['content_range'], {'rows': [1, 3], 'columns': [1, 2], 'students': 3, 'items': 3})
+
+    def test_unpacked_result(self):
+        # content that is not made of 0/1 marks is kept in the JSON file
+        content = [{'': ['a', 'total']}, {'student_id': ['1.1', '']}, {'s1': [2, 2]}, {'total': [2]}]
+        st.save_result({'content': content}, 1, 0)
+        self.assertFalse(os.path.exists('upload/1/result_0.npy'))
+        self.assertEqual(st.get_result(1, 0), {'content': content})
+        with self.assertRaises(Exception):
+            st.get_result(1, 0, rows=(0, 1))
+
+    def test_result_body(self):
+        result = {'file_id': 1, 'content': [{'': ['a', 'total']}, {'student_id': ['1.1', '']}, {'s1': [1, 1]}, {'total': [1]}]}
+        st.save_result(result, 1, 0)
+        body, encoding, etag = st.get_result_body(1, 0, ['gzip'])
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(body)), result)
+        plain, encoding, plain_etag = st.get_result_body(1, 0, [])
+        self.assertEqual((json.loads(plain), encoding), (result, None))
+        # the same body keeps its etag, every encoding has its own
+        self.assertEqual(st.get_result_body(1, 0, ['gzip'])[2], etag)
+        self.assertNotEqual(etag, plain_etag)
+        result['file_id'] = 2
+        st.save_result(result, 1, 0)
+        self.assertNotEqual(st.get_result_body(1, 0, ['gzip'])[2], etag)
+
+    def test_result_slice_body(self):
+        content = [{'': ['a', 'b', 'total']}, {'student_id': ['1.1', '1.2', '']}, {'s1': [1, 1, 2]}, {'s2': [1, 0, 1]},
+                   {'total': [2, 1]}]
+        st.save_result({'file_id': 1, 'content': content}, 1, 0)
+        body, encoding, etag = st.get_result_slice_body(1, 0, (1, 2), None, ['gzip'])
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(body)), st.get_result(1, 0, rows=(1, 2)))
+        plain, encoding, plain_etag = st.get_result_slice_body(1, 0, (1, 2), None, [])
+        self.assertEqual((json.loads(plain), encoding), (st.get_result(1, 0, rows=(1, 2)), None))
+        # the same slice of the same files keeps its etag, another slice or a saved result gets a new one
+        self.assertEqual(st.get_result_slice_body(1, 0, (1, 2), None, ['gzip'])[2], etag)
+        self.assertNotEqual(etag, plain_etag)
+        self.assertNotEqual(st.get_result_slice_body(1, 0, (0, 2), None, ['gzip'])[2], etag)
+        st.save_result({'file_id': 2, 'content': content}, 1, 0)
+        body, encoding, new_etag = st.get_result_slice_body(1, 0, (1, 2), None, ['gzip'])
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(json.loads(gzip.decompress(body))['file_id'], 2)
+
+    def test_result_cache(self):
+        result = {'file_id': 1, 'content': [{'': ['a', 'total']}, {'student_id': ['1.1', '']}, {'s1': [1, 1]}, {'total': [1]}]}
+        st.save_result(result, 1, 0)
+        st.get_result(1, 0)
+        hits = st.result_cache.stats()['hits']
+        loaded = st.get_result(1, 0)
+        self.assertEqual(st.result_cache.stats()['hits'], hits + 1)
+        # a loaded result can be changed without changing the cache
+        loaded['file_id'] = 3
+        self.assertEqual(st.get_result(1, 0), result)
+        result['file_id'] = 2
+        st.save_result(result, 1, 0)
+        self.assertEqual(st.get_result(1, 0)['file_id'], 2)
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache = st.LRUCache(10)
+
+    def test_evict_by_size(self):
+        self.cache.put('a', 1, 'aaaa', 4)
+        self.cache.put('b', 1, 'bbbb', 4)
+        self.assertEqual(self.cache.get('a', 1), 'aaaa')
+        self.cache.put('c', 1, 'cccc', 4)
+        # 'b' is the least recently used
+        self.assertIsNone(self.cache.get('b', 1))
+        self.assertEqual(self.cache.get('c', 1), 'cccc')
+        self.cache.put('d', 1, 'd' * 11, 11)
+        self.assertIsNone(self.cache.get('d', 1))
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 2, 'entries': 2, 'bytes': 8, 'limit': 10})
+
+    def test_version_and_invalidate(self):
+        self.cache.put('upload/1/result_0.json', 1, 'x', 1)
+        self.cache.put('upload/10/result_0.json', 1, 'y', 1)
+        self.assertIsNone(self.cache.get('upload/1/result_0.json', 2))
+        self.cache.invalidate('upload/1/')
+        self.assertIsNone(self.cache.get('upload/1/result_0.json', 1))
+        self.assertEqual(self.cache.get('upload/10/result_0.json', 1), 'y')
+
+    def test_threads(self):
+        def work(n):
+            for i in range(1000):
+                self.cache.put(str((n + i) % 20), 1, i, 1)
+                self.cache.get(str(i % 20), 1)
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8000)
+        self.assertEqual((stats['entries'], stats['bytes']), (10, 10))